@@ -0,0 +1,292 @@
+"""
+Ingestion benchmark for the papers_and_code loaders
+
+Generates a synthetic links-between-papers-and-code.json (same fields as the Papers with Code dump, with the dump's
+duplicate pattern: the same paper listed with several repos, and a share of malformed rows), loads it with every
+Table.populate_* JSON mode into a scratch table of a local MySQL instance and reports per mode:
+
+- rows/s: rows of the file per second of wall time, and the rows actually inserted (checked against the count
+  the generator expects from the UNIQUE constraints and the loader's skip rules)
+- peak RSS: of the loader process and of its largest child process (the parallel mode's workers)
+- round trips per row: client requests the server counted while the mode ran (global status, so run it against
+  an otherwise idle instance)
+
+Each mode runs in a fresh interpreter, so peak RSS is not inherited from the previous mode or the generator.
+Results are compared with benchmarks/baselines.json (per machine, file size and mode) and the run fails when a
+mode got slower, or bigger, than the tolerance allows. The GitHub mode is not benchmarked here: its time is
+the GitHub API's and the rate limit's.
+
+Usage:
+    (venv) python3 benchmarks/ingest_bench.py --rows 50000
+    (venv) python3 benchmarks/ingest_bench.py --rows 50000 --save-baseline        # after an intended change
+    (venv) python3 benchmarks/ingest_bench.py --json data/links-between-papers-and-code.json --modes json_parallel
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+BENCH_DIR = os.path.join(ROOT, "output", "bench")
+BASELINES_FILE = os.path.join(ROOT, "benchmarks", "baselines.json")
+BENCH_TABLE = "bench_papers_and_code"
+
+# mode -> Table method, called with json_path=
+MODES = {
+    "json_sequential": "populate_table_from_papers_and_code_json_sequential",
+    "json_parallel": "populate_table_from_papers_and_code_json_parallel",
+    "bulk_load": "populate_table_from_papers_and_code_json_bulk",
+    "sharded": "populate_table_from_papers_and_code_json_sharded",
+}
+
+FRAMEWORKS = ["pytorch", "tf", "jax", "mxnet", "none"]
+WORDS = ["neural", "learning", "graph", "attention", "transformer", "adversarial", "robust", "efficient", "sparse",
+         "deep", "generative", "bayesian", "contrastive", "self-supervised", "reinforcement", "networks", "models"]
+
+###########################
+# SYNTHETIC DUMP
+###########################
+
+def paper_record(rng, i):
+    title = " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(3, 9))) + f" {i}"
+    slug = title.lower().replace(" ", "-")
+    arxiv_id = f"{rng.randint(10, 24):02d}{rng.randint(1, 12):02d}.{i:05d}"
+    return {
+        "paper_url": f"https://paperswithcode.com/paper/{slug}",
+        "paper_title": title,
+        "paper_arxiv_id": arxiv_id,
+        "paper_url_abs": f"http://arxiv.org/abs/{arxiv_id}v{rng.randint(1, 3)}",
+        "paper_url_pdf": f"http://arxiv.org/pdf/{arxiv_id}v1.pdf",
+        "repo_url": f"https://github.com/user{rng.randint(0, 10 ** 6)}/repo-{i}",
+        "is_official": rng.random() < 0.3,
+        "mentioned_in_paper": rng.random() < 0.3,
+        "mentioned_in_github": rng.random() < 0.5,
+        "framework": rng.choice(FRAMEWORKS),
+    }
+
+
+def generate_dump(path, rows, duplicate_rate=0.32, malformed_rate=0.01, seed=0):
+    """
+    stream a synthetic dump of rows records to path
+    duplicate_rate: share of records that repeat an earlier paper with another repo (rejected by the UNIQUE keys)
+    malformed_rate: share of records the loaders skip (no arXiv URL, nested github URL, unparseable string row)
+    returns counts, including expected_inserts: the rows the loaders should insert
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    papers = []
+    counts = {"rows": rows, "duplicates": 0, "malformed": 0, "expected_inserts": 0}
+    with open(path, 'w', encoding='ascii') as f:
+        f.write("[\n")
+        for i in range(rows):
+            roll = rng.random()
+            if roll < malformed_rate:
+                record = paper_record(rng, i)
+                kind = rng.randrange(3)
+                if kind == 0:
+                    record["paper_url_abs"] = None
+                elif kind == 1:
+                    record["repo_url"] = f"https://github.com/user{i}/https-github.com-user{i}-repo"
+                else:
+                    # a row that is a string but not valid JSON
+                    record = json.dumps(record)[:-5]
+                counts["malformed"] += 1
+            elif roll < malformed_rate + duplicate_rate and papers:
+                # the same paper with another repo: collides on paper_title and the paper URLs
+                record = {**rng.choice(papers), "repo_url": f"https://github.com/fork{i}/repo-{i}"}
+                counts["duplicates"] += 1
+            else:
+                record = paper_record(rng, i)
+                papers.append(record)
+                counts["expected_inserts"] += 1
+                if rng.random() < 0.05:
+                    # some rows of the dump are JSON strings rather than objects, the loaders parse those
+                    record = json.dumps(record)
+            f.write(("" if i == 0 else ",\n") + json.dumps(record))
+        f.write("\n]\n")
+    return counts
+
+###########################
+# ONE MODE (child process)
+###########################
+
+def server_requests(session):
+    """
+    client requests counted by the server: classic protocol statements or X protocol messages, whichever the
+    server reports more of (depending on the version, X protocol statements are counted in Questions or not)
+    """
+    status = dict(session.sql("""
+    SHOW GLOBAL STATUS WHERE Variable_name IN
+        ('Questions', 'Mysqlx_stmt_execute_sql', 'Mysqlx_crud_insert', 'Mysqlx_crud_find', 'Mysqlx_crud_update')
+    """).execute().fetch_all())
+    x_protocol = sum(int(value) for name, value in status.items() if name.startswith("Mysqlx_"))
+    return int(status.get("Questions", 0)), x_protocol
+
+
+def reset_table(table):
+    from database.database_cmds import drop_table
+    drop_table(table.dependents_table_name, table.db_name)
+    drop_table(table.deps_table_name, table.db_name)
+    drop_table(table.table_name, table.db_name)
+    table.create_table_full()
+
+
+def run_mode(mode, json_path, table_name=BENCH_TABLE, db_name=None):
+    from database.database_cmds import Table, create_session, MYSQL_DATABASE
+    table = Table(table_name, db_name or MYSQL_DATABASE)
+    reset_table(table)
+    session, _ = create_session(table.db_name)
+    try:
+        questions_before, x_before = server_requests(session)
+        start_time = time.perf_counter()
+        ok = getattr(table, MODES[mode])(json_path=json_path)
+        seconds = time.perf_counter() - start_time
+        questions_after, x_after = server_requests(session)
+        inserted = session.sql(f"SELECT COUNT(*) FROM {table_name}").execute().fetch_one()[0]
+    finally:
+        session.close()
+        from database.database_cmds import drop_table
+        drop_table(table.dependents_table_name, table.db_name)
+        drop_table(table.deps_table_name, table.db_name)
+        drop_table(table.table_name, table.db_name)
+    # the status query that closes the measurement is the one request that is not the loader's
+    requests = max(questions_after - questions_before, x_after - x_before) - 1
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "ok": bool(ok),
+        "seconds": seconds,
+        "inserted": inserted,
+        "requests": requests,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20,
+        "child_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2 ** 20,
+    }
+
+
+def run_mode_isolated(mode, json_path, db_name=None):
+    command = [sys.executable, os.path.abspath(__file__), "--run-mode", mode, "--json", json_path]
+    if db_name:
+        command += ["--db", db_name]
+    result = subprocess.run(command, capture_output=True, text=True)
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    print(f"{mode} failed:\n{result.stdout[-2000:]}{result.stderr[-2000:]}")
+    return None
+
+###########################
+# BASELINES
+###########################
+
+def machine_key():
+    return f"{platform.system()}-{platform.machine()}-{os.cpu_count()}cpu"
+
+
+def load_baselines(path=BASELINES_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_baselines(baselines, path=BASELINES_FILE):
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp_file, path)
+
+
+def compare(metrics, baseline, tolerance):
+    """
+    regressions of metrics against baseline: fewer rows/s, more RSS or more round trips than tolerance allows
+    """
+    regressions = []
+    if metrics["rows_per_sec"] < baseline["rows_per_sec"] * (1 - tolerance):
+        regressions.append(f"rows/s {metrics['rows_per_sec']:.0f} < {baseline['rows_per_sec']:.0f}")
+    for key, label in (("peak_rss_mb", "peak RSS"), ("round_trips_per_row", "round trips/row")):
+        if metrics[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{label} {metrics[key]:.2f} > {baseline[key]:.2f}")
+    return regressions
+
+###########################
+# MAIN FUNCTION
+###########################
+
+def run_bench(json_path, counts, modes, db_name=None, tolerance=0.10, save=False, baselines_file=BASELINES_FILE):
+    baselines = load_baselines(baselines_file)
+    machine = baselines.setdefault(machine_key(), {})
+    failed = False
+    print(f"\n{'mode':<18} {'rows/s':>10} {'inserted':>10} {'expected':>10} {'peak RSS MB':>12} "
+          f"{'child MB':>9} {'trips/row':>10}")
+    for mode in modes:
+        result = run_mode_isolated(mode, json_path, db_name)
+        if result is None:
+            failed = True
+            continue
+        metrics = {
+            "rows_per_sec": counts["rows"] / result["seconds"],
+            "peak_rss_mb": max(result["peak_rss_mb"], result["child_peak_rss_mb"]),
+            "round_trips_per_row": result["requests"] / counts["rows"],
+        }
+        expected = counts.get("expected_inserts")
+        print(f"{mode:<18} {metrics['rows_per_sec']:>10.0f} {result['inserted']:>10} {str(expected or '-'):>10} "
+              f"{result['peak_rss_mb']:>12.1f} {result['child_peak_rss_mb']:>9.1f} "
+              f"{metrics['round_trips_per_row']:>10.2f}")
+        if expected is not None and result["inserted"] != expected:
+            print(f"  {mode}: inserted {result['inserted']} rows, expected {expected}")
+            failed = True
+
+        key = f"{mode}@{counts['rows']}"
+        if save:
+            machine[key] = {**metrics, "date": time.strftime("%Y-%m-%d")}
+        elif key in machine:
+            regressions = compare(metrics, machine[key], tolerance)
+            for regression in regressions:
+                print(f"  {mode}: regression against baseline of {machine[key]['date']}: {regression}")
+            failed = failed or bool(regressions)
+    if save:
+        save_baselines(baselines, baselines_file)
+        print(f"\nBaselines saved for {machine_key()} -> {baselines_file}")
+    return not failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the papers_and_code JSON loaders")
+    parser.add_argument('--rows', type=int, default=20000, help='Records in the synthetic dump')
+    parser.add_argument('--duplicate-rate', type=float, default=0.32, help='Share of records repeating a paper')
+    parser.add_argument('--malformed-rate', type=float, default=0.01, help='Share of records the loaders skip')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help='Benchmark this dump instead of a synthetic one')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--db', default=None, help='Database of the scratch table (MYSQL_DATABASE by default)')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed change against the baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baselines')
+    parser.add_argument('--run-mode', choices=list(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        # child: one mode, result on the last line of stdout
+        print("RESULT " + json.dumps(run_mode(args.run_mode, args.json, db_name=args.db)))
+        sys.exit(0)
+
+    if args.json:
+        json_path = args.json
+        with open(json_path, 'r') as f:
+            counts = {"rows": len(json.load(f))}
+    else:
+        json_path = os.path.join(BENCH_DIR, f"links-{args.rows}-{args.seed}.json")
+        start_time = time.perf_counter()
+        counts = generate_dump(json_path, args.rows, args.duplicate_rate, args.malformed_rate, args.seed)
+        print(f"Generated {json_path}: {counts} in {time.perf_counter() - start_time:.1f}s")
+
+    ok = run_bench(json_path, counts, args.modes, db_name=args.db, tolerance=args.tolerance, save=args.save_baseline)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,136 @@
+"""
+Single entry point for the grimrepor scripts
+
+    (venv) python3 cli.py <command> [args...]     run the script of <command> with the remaining arguments
+    (venv) python3 cli.py --help                  list the commands
+    (venv) python3 cli.py startup [commands...]   measure the cold-start time of each command
+
+Only the script of the chosen command is loaded, and the scripts import their heavy dependencies (pandas, mysqlx,
+the GitHub, OpenAI, Gmail and Twitter clients) inside the code paths that use them, so a short command such as
+`tweet` or `migrate --status` starts in a fraction of a second. Every script keeps its own options:
+
+    (venv) python3 cli.py pipeline --help
+    (venv) python3 cli.py migrate --status
+
+`startup` imports each command's script in a fresh interpreter (without running it) and fails when one takes
+longer than the budget, so a new top-level import of a heavy library shows up as a number, not a feeling.
+"""
+
+import os
+import sys
+import time
+import runpy
+import argparse
+import subprocess
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+
+# command -> (script, description)
+COMMANDS = {
+    "pipeline": ("scripts/pipeline.py", "stream repos through qualify, build, fix, publish and contributors"),
+    "build-check": ("scripts/build_check.py", "check that the dependency files of the repos install"),
+    "fix": ("smart_package_versioning/batch_fix_dependencies.py", "fix the dependency files of failed builds"),
+    "publish": ("scripts/new_repo.py", "push fixed repos to new repositories"),
+    "contributors": ("scripts/get_contributor_emails.py", "contributor emails from git history"),
+    "issues": ("scripts/github_issue_harvester.py", "harvest GitHub issues"),
+    "classify-issues": ("scripts/classify_github_issue.py", "flag version issues in the harvested issues"),
+    "process-errors": ("scripts/process_errors.py", "fix failed builds with PyPI release dates and GPT"),
+    "failure-clusters": ("scripts/failure_clusters.py", "cluster failed builds by signature and fix each cluster once"),
+    "notify": ("scripts/notification.py", "send rate limited tweets and emails for fixed repos"),
+    "tweet": ("tweet_bot/tweet.py", "post one tweet"),
+    "email": ("scripts/gmail_api.py", "send one email"),
+    "db": ("database/database_cmds.py", "create and populate the papers_and_code table"),
+    "migrate": ("database/migrate.py", "apply pending schema migrations"),
+    "sync": ("database/delta_sync.py", "sync papers_and_code with a refreshed Papers with Code dump"),
+    "dependents": ("database/dependency_index.py", "repos depending on a package, rebuild the index"),
+    "api-index": ("smart_package_versioning/api_index.py", "offline API-surface index per package version"),
+    "version-solver": ("smart_package_versioning/version_solver.py", "resolve compatible package versions"),
+    "pin-repair": ("smart_package_versioning/pin_repair.py", "repair a bad pin by searching the release timeline"),
+    "ingest-bench": ("benchmarks/ingest_bench.py", "benchmark the papers_and_code JSON loaders"),
+}
+
+# seconds, see startup()
+STARTUP_BUDGET = 0.5
+
+
+def run_command(command, args):
+    # same as `python3 <script> <args>`: the script's directory comes first on sys.path
+    script = os.path.join(ROOT, COMMANDS[command][0])
+    sys.argv = [script, *args]
+    sys.path.insert(0, os.path.dirname(script))
+    runpy.run_path(script, run_name="__main__")
+
+
+def import_time(script, detail=False):
+    """
+    import a script in a fresh interpreter without running its __main__ block
+    returns (seconds, error message or None, [(cumulative seconds, package)] of its slowest top-level imports)
+    """
+    code = ("import sys, importlib.util\n"
+            f"sys.path.insert(0, {os.path.dirname(script)!r})\n"
+            f"spec = importlib.util.spec_from_file_location('startup_check', {script!r})\n"
+            "spec.loader.exec_module(importlib.util.module_from_spec(spec))")
+    command = [sys.executable, *(["-X", "importtime"] if detail else []), "-c", code]
+    start_time = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+    seconds = time.perf_counter() - start_time
+    error = result.stderr.strip().splitlines()[-1] if result.returncode != 0 else None
+
+    slowest = []
+    for line in result.stderr.splitlines():
+        # "import time:       self [us] |  cumulative | imported package", nesting is indentation
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, package = line.split("|")
+        if len(package) - len(package.lstrip()) == 1:
+            slowest.append((int(cumulative) / 1e6, package.strip()))
+    return seconds, error, sorted(slowest, reverse=True)[:5]
+
+
+def startup(commands, repeat=3, budget=STARTUP_BUDGET, detail=False):
+    """
+    best of repeat cold starts per command, returns False if any command is over budget
+    """
+    ok = True
+    for command in commands:
+        script = os.path.join(ROOT, COMMANDS[command][0])
+        timings = [import_time(script) for _ in range(repeat)]
+        seconds = min(seconds for seconds, _, _ in timings)
+        error = timings[-1][1]
+        if error:
+            print(f"  {command:<16} {seconds:6.2f}s  not importable here: {error}")
+            continue
+        slow = seconds > budget
+        ok = ok and not slow
+        print(f"  {command:<16} {seconds:6.2f}s{'  over budget' if slow else ''}")
+        if detail or slow:
+            for cumulative, package in import_time(script, detail=True)[2]:
+                print(f"      {cumulative:6.3f}s  {package}")
+    return ok
+
+
+if __name__ == "__main__":
+    command_list = "\n".join(f"  {name:<16} {description}" for name, (_, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        description="Run a grimrepor script", formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"commands:\n{command_list}\n  {'startup':<16} measure the cold-start time of the commands")
+    parser.add_argument('command', choices=[*COMMANDS, "startup"], metavar='command')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='Arguments for the command')
+    args = parser.parse_args()
+
+    if args.command != "startup":
+        run_command(args.command, args.args)
+        sys.exit(0)
+
+    startup_parser = argparse.ArgumentParser(prog="cli.py startup", description="Measure command cold-start time")
+    startup_parser.add_argument('commands', nargs='*', help='Commands to measure (default all)')
+    startup_parser.add_argument('-r', '--repeat', type=int, default=3, help='Runs per command, the best one counts')
+    startup_parser.add_argument('--budget', type=float, default=STARTUP_BUDGET, help='Seconds allowed per command')
+    startup_parser.add_argument('--detail', action='store_true', help='Show the slowest imports of every command')
+    startup_args = startup_parser.parse_args(args.args)
+    unknown = [command for command in startup_args.commands if command not in COMMANDS]
+    if unknown:
+        startup_parser.error(f"unknown commands: {', '.join(unknown)}")
+    ok = startup(startup_args.commands or list(COMMANDS), repeat=startup_args.repeat,
+                 budget=startup_args.budget, detail=startup_args.detail)
+    sys.exit(0 if ok else 1)
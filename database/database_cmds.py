@@ -2,24 +2,19 @@ import os
 import sys
 import re
 import subprocess
-import pandas as pd
-import requests
 import json
-import mysqlx
-import asyncio
-from multiprocessing import Pool, Manager
-from functools import partial
-import math
 from datetime import datetime
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-import random
 """
 To run:
 ./setup/create_venv.sh
 ./setup/mysql_setup.sh
 source venv/bin/activate
 (venv) python3 database/database_cmds.py
+
+Most scripts import this module for create_session and escape_value alone, so the heavy libraries
+(mysqlx, requests, BeautifulSoup, multiprocessing) are imported inside the functions that use them
+and importing it stays cheap (python3 cli.py startup).
 """
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -27,6 +22,9 @@ sys.path.append(ROOT)
 
 from utils.env import is_docker
 from utils.decorators import timeit
+from utils.metrics import http_get, execute_sql, instrument
+from database.pipeline_state import Stage, Status, state_sql
+from database.dedup import Deduplicator, UNIQUE_COLUMNS, fingerprint
 
 load_dotenv()
 
@@ -40,9 +38,13 @@ else:
 MYSQL_USER = os.getenv('MYSQL_USER', 'root')
 MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD', '')
 MYSQL_PORT = int(os.getenv('MYSQL_PORT', 33060))
+# classic protocol, for LOAD DATA LOCAL INFILE (Table.populate_table_from_papers_and_code_json_bulk)
+MYSQL_CLASSIC_PORT = int(os.getenv('MYSQL_CLASSIC_PORT', 3306))
 MYSQL_ROOT_PASSWORD = os.getenv('MYSQL_ROOT_PASSWORD', '')
 
 TABLE_NAME = "papers_and_code"
+# deps_file_content_orig / deps_file_content_edited, one row per papers_and_code id
+DEPS_TABLE_NAME = "papers_and_code_deps"
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 
 if is_docker():
@@ -53,6 +55,11 @@ else:
 sys.path.append(ROOT)
 from utils.decorators import timeit
 
+# Papers with Code dump, see Table.populate_table_from_papers_and_code_json_*
+PWC_JSON_FILE = os.path.join(ROOT, "data", "links-between-papers-and-code.json")
+# rows of the dump that were not inserted and why, see database/dedup.py
+INGEST_DROPS_FILE = os.path.join(ROOT, "output", "ingest_dropped.csv")
+
 OS = sys.platform
 
 
@@ -166,6 +173,7 @@ def create_session(db_name: str = os.getenv('MYSQL_DATABASE')) -> object:
     and call later with db_name to connect to the database
     returns the session object (open connection)
     """
+    import mysqlx
     conn_params = {
         "host": MYSQL_HOST,
         "port": MYSQL_PORT,
@@ -202,6 +210,7 @@ def create_db(db_name: str = "grimrepor_db") -> bool:
     create a new database
     ok if the database already exists
     """
+    import mysqlx
     session = None
     try:
         session, _ = create_session()
@@ -287,17 +296,8 @@ def show_table_contents(table_name: str, db_name: str = "grimrepor_db", limit_nu
 
     try:
         print(f"Contents of {table_name}\n")
-        result = None
-        try:
-            if limit_num is None:
-                result = schema.get_table(table_name).select().execute()
-            else:
-                result = schema.get_table(table_name).select().limit(limit_num).execute()
-        except Exception as e:
-            print(f"Error selecting from table: {str(e)}")
-            return False
-
-        for row in result.fetch_all():
+        # printed as the pages arrive, the whole table is never held in memory
+        for row in Table(table_name, db_name).iter_rows(limit=limit_num, session=session):
             print(row)
         return True
 
@@ -381,74 +381,48 @@ def escape_value(value):
     # escape single quotes and backslashes
     return "'" + str(value).replace("'", "''").replace("\\", "\\\\") + "'"
 
-def process_chunk_json(chunk, shared_counts, lock, table_name, db_name):
-    session, schema = create_session(db_name)
-    if not session: return False
+def tsv_value(value):
+    """
+    helper function to write a value for LOAD DATA (default format: tab separated, backslash escapes)
+    """
+    if value is None:
+        return '\\N'
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
 
-    local_inserted = 0
-    local_skipped = 0
+def process_chunk_json(chunk, table_name, db_name):
+    """
+    insert a chunk of deduplicated rows, counted in this worker's row of utils.progress stats
+    """
+    from utils.progress import worker_stats
+    stats = worker_stats()
+    session, schema = create_session(db_name)
+    if not session:
+        stats.add('skipped', len(chunk))
+        return False
 
     try:
-        for row in chunk:
-            if isinstance(row, str):
-                try:
-                    row = json.loads(row)
-                except json.JSONDecodeError:
-                    local_skipped += 1
-                    continue
-
-            if not row.get('paper_url_abs'):
-                local_skipped += 1
-                continue
-            elif re.match(r"http[s]{0,1}://.+/http[s]{0,1}-github.com", row.get('repo_url')):
-                local_skipped += 1
-                continue
-
-            values = [
-                escape_value(row.get('paper_title')),
-                escape_value(row.get('paper_arxiv_id')),
-                escape_value(row.get('paper_url_abs')),
-                escape_value(row.get('paper_url')),
-                escape_value(row.get('repo_url')),
-            ]
-
+        # rows come deduplicated (database/dedup.py), a failure here is a server side error
+        for values in chunk:
             insert_cmd = f"""
             INSERT INTO {table_name} (
-                paper_title, paper_arxiv_id, paper_arxiv_url, paper_pwc_url, github_url
+                {', '.join(UNIQUE_COLUMNS)}, source_fingerprint
             ) VALUES (
-                {values[0]}, {values[1]}, {values[2]}, {values[3]}, {values[4]}
+                {', '.join(escape_value(value) for value in values)}, {escape_value(fingerprint(values))}
             )"""
 
             try:
-                session.sql(insert_cmd).execute()
+                execute_sql(session, insert_cmd)
                 session.commit()
-                local_inserted += 1
+                stats.add('inserted')
 
             except Exception:
-                local_skipped += 1
+                stats.add('skipped')
                 continue
 
-        # Update shared counters with lock
-        with lock:
-            shared_counts['inserted'] += local_inserted
-            shared_counts['skipped'] += local_skipped
-
     finally:
         session.close()
 
-def print_row_count(db_name, table_name):
-    while True:
-        time.sleep(10)  # Print row count every 10 seconds
-        session, _ = create_session(db_name)
-        try:
-            result = session.sql(f"SELECT COUNT(*) FROM {table_name}").execute()
-            row_count = result.fetch_one()[0]
-            print(f"Total rows in {table_name}: {row_count}")
-        except Exception as e:
-            print(f"Error fetching row count: {str(e)}")
-        finally:
-            session.close()
-
 def convert_to_mysql_date(iso_datetime):
     """
     Convert ISO 8601 datetime (e.g., '2018-05-30T01:01:19Z') to MySQL DATE format ('2018-05-30').
@@ -478,6 +452,7 @@ def get_contributors(owner, repo):
     Fetch contributors from the GitHub repository.
     helper function for populate_table_github_api
     """
+    import requests
     contributors_url = f"https://api.github.com/repos/{owner}/{repo}/contributors"
 
     # Get GitHub token from environment variable
@@ -488,7 +463,7 @@ def get_contributors(owner, repo):
         else:
             print(f"Warning: No GitHub token found. Rate limits will be strict.")
 
-        response = requests.get(contributors_url, headers=headers)
+        response = http_get(contributors_url, headers=headers)
 
         # Check rate limits from response headers
         rate_limit = response.headers.get('X-RateLimit-Remaining', 'N/A')
@@ -539,7 +514,7 @@ def get_last_commit_date(owner, repo, file_path):
     try:
         for branch in ['main', 'master']:
             commits_url = f"https://api.github.com/repos/{owner}/{repo}/commits?path={file_path}&sha={branch}&per_page=1"
-            response = requests.get(commits_url, headers={'Authorization': f'token {GITHUB_TOKEN}'})
+            response = http_get(commits_url, headers={'Authorization': f'token {GITHUB_TOKEN}'})
             if response.status_code == 200:
                 commit_data = response.json()
                 if commit_data:
@@ -564,13 +539,14 @@ def get_file_content(file_url):
         )
 
         # Attempt to fetch raw file content
-        response = requests.get(raw_file_url)
+        response = http_get(raw_file_url)
         if response.status_code == 200:
             return response.text
 
         # If raw URL fails, fallback to the original blob URL
-        response = requests.get(file_url)
+        response = http_get(file_url)
         if response.status_code == 200:
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(response.text, 'html.parser')
             code_element = soup.find('table', {'class': 'highlight'}) or soup.find('pre')
             if code_element:
@@ -586,7 +562,7 @@ def get_file_content(file_url):
             for branch in branches:
                 for req_file in req_files:
                     alt_raw_url = f"https://raw.githubusercontent.com/{owner}/{repo}/{branch}/{req_file}"
-                    alt_response = requests.get(alt_raw_url)
+                    alt_response = http_get(alt_raw_url)
                     if alt_response.status_code == 200:
                         return alt_response.text
         return None
@@ -596,13 +572,177 @@ def get_file_content(file_url):
         return None
 
 
+def qualify_repo(github_url, with_contributors=True):
+    """
+    look up the dependency file of a GitHub repo, and when there is one its last commit date and contributors
+    returns a dict of papers_and_code values (see Table.qualify_cmds), None if the URL is not a GitHub repo
+    build_sys_type is "Not found" when there is no dependency file, the other fields are then None
+    """
+    owner_repo = extract_owner_repo(github_url)
+    if not owner_repo:
+        return None
+    owner, repo = owner_repo
+
+    # Determine the requirements.txt file URL
+    prefix = "https://raw.githubusercontent.com"
+    builds_and_paths = {
+    'pip':
+    [
+        f"{prefix}/{owner}/{repo}/main/requirements.txt",
+        f"{prefix}/{owner}/{repo}/master/requirements.txt"
+    ],
+    'conda':
+    [
+        f"{prefix}/{owner}/{repo}/main/environment.yml",
+        f"{prefix}/{owner}/{repo}/master/environment.yml",
+        f"{prefix}/{owner}/{repo}/main/env.yml",
+        f"{prefix}/{owner}/{repo}/master/env.yml"
+    ]}
+    info = {
+        'build_sys_type': "Not found",
+        'deps_file_url': None,
+        'deps_file_content_orig': None,
+        'deps_last_commit_date': None,
+        'contributors': None,
+    }
+    for build_sys, deps_files in builds_and_paths.items():
+        for deps_file_path in deps_files:
+            content = get_file_content(deps_file_path)
+            if content:
+                info['deps_file_content_orig'] = content
+                info['deps_file_url'] = deps_file_path
+                info['build_sys_type'] = build_sys
+                break
+        if info['deps_file_url']:
+            break
+
+    # we found a requirements file, so fetch additional info from repo
+    if info['build_sys_type'] != "Not found":
+        # Fetch last commit date for the dependency file
+        info['deps_last_commit_date'] = get_last_commit_date(owner, repo, info['deps_file_url'].split('/')[-1])
+
+        if with_contributors:
+            contributors = get_contributors(owner, repo)
+            if contributors and len(contributors) > 255:
+                contributors = contributors[:252] + '...'
+            info['contributors'] = contributors
+    return info
+
+
 class Table:
     def __init__(self, table_name: str, db_name: str = "grimrepor_db"):
         self.table_name = table_name
+        self.deps_table_name = f"{table_name}_deps"
+        # package -> repos, see database/dependency_index.py
+        self.dependents_table_name = f"{table_name}_dependents"
         self.db_name = db_name
         # database has to work before creating tables
         # create_db(db_name=db_name)
 
+    def iter_rows(self, columns: str = "*", where: str = None, page_size: int = 1000,
+                  id_range: tuple = None, limit: int = None, session=None):
+        """
+        stream rows in id order, one page at a time, so memory is bounded by page_size
+        keyset pagination: every page is WHERE id > <last id of the previous page> ORDER BY id LIMIT page_size,
+        an index range scan on the primary key however deep into the table it is (no OFFSET)
+
+        columns: select list, every row starts with id (with "*" id is already the first column)
+        where: extra filter, e.g. f"stage = {int(Stage.FIND)}"
+        id_range: (low, high] bounds on id, see id_ranges() to split the table between workers
+        limit: stop after this many rows
+        session: an open session to use, otherwise one is created (and closed) here
+
+        rows may be updated while iterating, the next page always starts after the last id seen
+        """
+        own_session = session is None
+        if own_session:
+            session, _ = create_session(self.db_name)
+        select_list = "*" if columns.strip() == "*" else f"id, {columns}"
+        last_id, high = id_range if id_range else (None, None)
+        yielded = 0
+        try:
+            while limit is None or yielded < limit:
+                conditions = [f"({where})"] if where else []
+                if last_id is not None:
+                    conditions.append(f"id > {int(last_id)}")
+                if high is not None:
+                    conditions.append(f"id <= {int(high)}")
+                where_cmd = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+                page_limit = page_size if limit is None else min(page_size, limit - yielded)
+                rows = execute_sql(session, f"""
+                SELECT {select_list}
+                FROM {self.table_name}
+                {where_cmd}
+                ORDER BY id
+                LIMIT {int(page_limit)}""").fetch_all()
+                for row in rows:
+                    yield row
+                yielded += len(rows)
+                if len(rows) < page_limit:
+                    break
+                last_id = rows[-1][0]
+        finally:
+            if own_session:
+                session.close()
+
+    def id_ranges(self, n: int, where: str = None) -> list:
+        """
+        split the ids of the table (matching where) into n disjoint (low, high] ranges for iter_rows
+        boundaries come from the ids themselves, so ranges hold about the same number of rows even with gaps
+        """
+        session, _ = create_session(self.db_name)
+        where_cmd = f"WHERE {where}" if where else ""
+        try:
+            total = session.sql(f"SELECT COUNT(*) FROM {self.table_name} {where_cmd}").execute().fetch_one()[0]
+            if not total:
+                return []
+            n = max(1, min(n, total))
+            bounds = []
+            for i in range(1, n):
+                # id of the (i * total / n)-th row, read from the primary key index
+                offset = i * total // n - 1
+                row = session.sql(f"""
+                SELECT id FROM {self.table_name} {where_cmd}
+                ORDER BY id LIMIT 1 OFFSET {offset}""").execute().fetch_one()
+                bounds.append(row[0])
+            low = session.sql(f"SELECT MIN(id) - 1 FROM {self.table_name} {where_cmd}").execute().fetch_one()[0]
+            high = session.sql(f"SELECT MAX(id) FROM {self.table_name} {where_cmd}").execute().fetch_one()[0]
+            edges = [low] + bounds + [high]
+            return [(edges[i], edges[i + 1]) for i in range(n) if edges[i] < edges[i + 1]]
+        finally:
+            session.close()
+
+    def qualify_cmds(self, row_id: int, info: dict) -> list:
+        """
+        SQL statements that store the result of qualify_repo() for one row and move it to stage QUALIFY
+        (status OK, or SKIPPED when no dependency file was found)
+        """
+        # Determine build system type
+        # hinge upon value of build_sys_type for future table queries
+        # default sql update table if we don't find a requirements file
+        from database.dependency_index import index_cmds
+        if info['build_sys_type'] == "Not found":
+            return [f"""
+            UPDATE {self.table_name}
+            SET build_sys_type = {escape_value(info['build_sys_type'])}, {state_sql(Stage.QUALIFY, Status.SKIPPED)}
+            WHERE id = {int(row_id)}
+            """, *index_cmds(self.dependents_table_name, row_id)]
+
+        contributors_cmd = f"contributors = {escape_value(info['contributors'])}," if info.get('contributors') else ""
+        return [f"""
+            INSERT INTO {self.deps_table_name} (id, deps_file_content_orig)
+            VALUES ({int(row_id)}, {escape_value(info['deps_file_content_orig'])})
+            ON DUPLICATE KEY UPDATE deps_file_content_orig = VALUES(deps_file_content_orig);
+            """, f"""
+            UPDATE {self.table_name}
+            SET build_sys_type = {escape_value(info['build_sys_type'])},
+                deps_file_url = {escape_value(info['deps_file_url'])},
+                {contributors_cmd}
+                deps_last_commit_date = {escape_value(info['deps_last_commit_date'])},
+                {state_sql(Stage.QUALIFY, Status.OK)}
+            WHERE id = {int(row_id)};
+            """, *index_cmds(self.dependents_table_name, row_id, info['deps_file_content_orig'], info['build_sys_type'])]
+
     def create_table_full(self) -> bool:
         """
         create a table in the database
@@ -634,11 +774,9 @@ class Table:
             contributors VARCHAR(255) DEFAULT NULL,
             build_sys_type VARCHAR(255) DEFAULT NULL,
             deps_file_url VARCHAR(255) DEFAULT NULL UNIQUE,
-            deps_file_content_orig MEDIUMTEXT,
             deps_last_commit_date DATE DEFAULT NULL,
 
             build_status_orig VARCHAR(255) DEFAULT NULL,
-            deps_file_content_edited MEDIUMTEXT,
             build_status_edited VARCHAR(255) DEFAULT NULL,
             datetime_latest_build DATETIME DEFAULT NULL,
             num_build_attempts INT DEFAULT 0,
@@ -648,7 +786,38 @@ class Table:
             pushed_to_fork BOOLEAN DEFAULT FALSE,
             pull_request_made BOOLEAN DEFAULT FALSE,
             tweet_posted BOOLEAN DEFAULT FALSE,
-            tweet_url VARCHAR(255) DEFAULT NULL UNIQUE
+            tweet_url VARCHAR(255) DEFAULT NULL UNIQUE,
+
+            stage TINYINT UNSIGNED NOT NULL DEFAULT 0,
+            status TINYINT UNSIGNED NOT NULL DEFAULT 0,
+
+            source_fingerprint CHAR(32) DEFAULT NULL,
+            deleted_at DATETIME DEFAULT NULL,
+
+            INDEX idx_stage_status (stage, status, id),
+            INDEX idx_build_sys_type (build_sys_type(16), id),
+            INDEX idx_build_status_orig (build_status_orig(32), id),
+            INDEX idx_publish (pushed_to_fork, tweet_posted, id),
+            INDEX idx_pull_request (pushed_to_fork, pull_request_made, id)
+        );"""
+        # the large dependency files live in a side table, so work-queue scans never touch blob pages
+        create_deps_table_cmd = f"""
+        CREATE TABLE IF NOT EXISTS {self.deps_table_name} (
+            id INT PRIMARY KEY,
+            deps_file_content_orig MEDIUMTEXT,
+            deps_file_content_edited MEDIUMTEXT,
+            CONSTRAINT fk_deps_repo FOREIGN KEY (id) REFERENCES {self.table_name} (id) ON DELETE CASCADE
+        );"""
+        # reverse dependency index, the packages of every repo's dependency file
+        create_dependents_table_cmd = f"""
+        CREATE TABLE IF NOT EXISTS {self.dependents_table_name} (
+            package VARCHAR(255) NOT NULL,
+            repo_id INT NOT NULL,
+            specifier VARCHAR(255) NOT NULL DEFAULT '',
+            pinned_version VARCHAR(64) DEFAULT NULL,
+            PRIMARY KEY (package, repo_id),
+            INDEX idx_dependents_repo (repo_id),
+            CONSTRAINT fk_dependents_repo FOREIGN KEY (repo_id) REFERENCES {self.table_name} (id) ON DELETE CASCADE
         );"""
         try:
             # Check if the table exists
@@ -665,6 +834,11 @@ class Table:
 
             # Create the table if it does not exist
             session.sql(create_table_cmd).execute()
+            session.sql(create_deps_table_cmd).execute()
+            session.sql(create_dependents_table_cmd).execute()
+            # the new table already has the layout of every migration in db/migrations
+            from database.migrate import mark_applied
+            mark_applied(session)
             print(f"Table {self.table_name} created successfully.")
             return True
         except Exception as e:
@@ -674,7 +848,7 @@ class Table:
             session.close()
 
     @timeit
-    def populate_table_from_papers_and_code_json_sequential(self, row_limit: int = None) -> bool:
+    def populate_table_from_papers_and_code_json_sequential(self, row_limit: int = None, json_path: str = None) -> bool:
         """
         populate the table with data from data/links-between-papers-and-code.json
         sample:
@@ -707,11 +881,15 @@ class Table:
         Not all rows are inserted due to unique and not null constraints
         clashes mainly on paper_url, paper_arxiv_id
         Rows inserted: 185013 of 272525
+        those clashes are resolved in memory before inserting (database/dedup.py), the dropped rows and the
+        reason for each are written to output/ingest_dropped.csv
+
+        json_path: another dump in the same format (benchmarks/ingest_bench.py), data/links-between-papers-and-code.json by default
         """
         session, schema = create_session(self.db_name)
         if not session: return False
 
-        file_loc = os.path.join(ROOT, "data", "links-between-papers-and-code.json")
+        file_loc = json_path or PWC_JSON_FILE
         data = None
         with open(file_loc, 'r', encoding='ascii') as f:
             data = json.load(f)
@@ -721,46 +899,21 @@ class Table:
 
         table = schema.get_table(self.table_name)
         rows_inserted, rows_skipped = 0, 0
+        data = data[:row_limit] if row_limit else data
 
         try:
-            for idx, row in enumerate(data):
-                if row_limit and idx >= row_limit: break
-
-                # convert string to dict if needed
-                if isinstance(row, str):
-                    try:
-                        row = json.loads(row)
-                    except json.JSONDecodeError as e:
-                        print(f"Error parsing row #{idx}: {str(e)}")
-                        continue
-
-                if not row.get('paper_url_abs'):
-                    print(f"Skipping row #{idx}: Missing required paper_pwc_url")
-                    rows_skipped += 1
-                    continue
-                elif re.match(r"http[s]{0,1}://.+/http[s]{0,1}-github.com", row.get('repo_url')):
-                    # skip repos with multiple http[s] occurences inside
-                    # retrieving raw github file content can fail
-                    # "repo_url":
-                    # "https://github.com/NateKoenig/https-github.com-Kautenja-a-neural-algorithm-of-artistic-style",
-                    rows_skipped += 1
-                    continue
-
-                values = [
-                    escape_value(row.get('paper_title')),
-                    escape_value(row.get('paper_arxiv_id')),
-                    escape_value(row.get('paper_url_abs')),
-                    escape_value(row.get('paper_url')),
-                    escape_value(row.get('repo_url')),
-                ]
+            # only rows that pass the UNIQUE keys (including the rows already in the table) reach the server
+            dedup = Deduplicator()
+            dedup.preload(self, session=session)
+            for idx, values in dedup.filter(data):
                 insert_update_cmd = f"""
                 INSERT INTO {self.table_name} (
-                    paper_title, paper_arxiv_id, paper_arxiv_url, paper_pwc_url, github_url
+                    {', '.join(UNIQUE_COLUMNS)}, source_fingerprint
                 ) VALUES (
-                    {values[0]}, {values[1]}, {values[2]}, {values[3]}, {values[4]}
+                    {', '.join(escape_value(value) for value in values)}, {escape_value(fingerprint(values))}
                 )"""
                 try:
-                    session.sql(insert_update_cmd).execute()
+                    execute_sql(session, insert_update_cmd)
                     session.commit()
                     rows_inserted += 1
                     if rows_inserted % 10000 == 0:
@@ -771,10 +924,10 @@ class Table:
                     rows_skipped += 1
                     continue
 
-            if row_limit:
-                print(f"Rows inserted: {rows_inserted}, Rows skipped: {rows_skipped} of attempted {row_limit}")
-            else:
-                print(f"Rows inserted: {rows_inserted}, Rows skipped: {rows_skipped} of attempted {len(data)}")
+            rows_skipped += sum(dedup.dropped.values())
+            dedup.report()
+            dedup.write_drops(INGEST_DROPS_FILE)
+            print(f"Rows inserted: {rows_inserted}, Rows skipped: {rows_skipped} of attempted {len(data)}")
             print(f"Total rows in table: {table.count()}")
         except Exception as e:
             print(f"Error populating table: {str(e)}")
@@ -784,9 +937,13 @@ class Table:
         return True
 
     @timeit
-    def populate_table_from_papers_and_code_json_parallel(self, row_limit: int = None) -> bool:
+    def populate_table_from_papers_and_code_json_parallel(self, row_limit: int = None, json_path: str = None) -> bool:
+        import math
+        from functools import partial
+        from multiprocessing import Pool
+        from utils.progress import WorkerStats, ProgressReporter, init_worker
         print("Attempting to popualte table from JSON file in parallel mode...")
-        file_loc = os.path.join(ROOT, "data", "links-between-papers-and-code.json")
+        file_loc = json_path or PWC_JSON_FILE
         try:
             with open(file_loc, 'r', encoding='ascii') as f:
                 data = json.load(f)
@@ -799,142 +956,220 @@ class Table:
 
         data = data[:row_limit] if row_limit else data
 
+        # resolve the UNIQUE clashes here, so the workers only send rows that insert
+        dedup = Deduplicator()
+        dedup.preload(self)
+        rows = [values for _, values in dedup.filter(data)]
+        dedup.report()
+        dedup.write_drops(INGEST_DROPS_FILE)
+
         # Calculate chunk size and number of processes
         num_processes = min(os.cpu_count(), 16)
-        chunk_size = math.ceil(len(data) / num_processes)
-        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        chunk_size = max(1, math.ceil(len(rows) / num_processes))
+        chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
 
-        # Shared counters and lock
-        manager = Manager()
-        shared_counts = manager.dict()
-        shared_counts['inserted'] = 0
-        shared_counts['skipped'] = 0
-        lock = manager.Lock()
+        # per-worker counters in shared memory, the parent prints progress from them
+        stats = WorkerStats(num_processes, counters=('inserted', 'skipped'))
 
         # Process chunks in parallel
-        with Pool(processes=num_processes) as pool:
+        with ProgressReporter(stats, total=len(rows)), \
+                Pool(processes=num_processes, initializer=init_worker, initargs=(stats,)) as pool:
             pool.map(
                 partial(process_chunk_json,
-                    shared_counts=shared_counts,
-                    lock=lock,
                     table_name=self.table_name,
                     db_name=self.db_name),
                 chunks
             )
+            # closed and joined instead of terminated, so the workers' metrics finalizer runs (utils/metrics.py)
+            pool.close()
+            pool.join()
 
         # Print final statistics
-        print(f"Rows inserted: {shared_counts['inserted']}, "
-            f"Rows skipped: {shared_counts['skipped']} "
+        totals = stats.totals()
+        print(f"Rows inserted: {totals['inserted']}, "
+            f"Rows skipped: {totals['skipped'] + sum(dedup.dropped.values())} "
             f"of attempted {len(data)}")
 
         return True
 
     @timeit
-    def populate_table_from_github_repo_sequential(self, row_limit: int = None) -> bool:
+    def populate_table_from_papers_and_code_json_sharded(self, row_limit: int = None, json_path: str = None) -> bool:
+        """
+        parallel load where the parent never reads the records: the file is split into byte ranges on record
+        boundaries and every worker parses (mmap + orjson) and inserts its own range (database/json_shards.py)
+        rows are deduplicated per shard, clashes between shards are rejected by the UNIQUE keys (INSERT IGNORE)
+        row_limit is a row count, not a byte range, so limited loads go through the parallel loader
+        """
+        from collections import Counter
+        from functools import partial
+        from multiprocessing import Pool
+        from utils.progress import WorkerStats, ProgressReporter, init_worker
+        from database.json_shards import shard_ranges, insert_shard
+        if row_limit:
+            return self.populate_table_from_papers_and_code_json_parallel(row_limit=row_limit, json_path=json_path)
+
+        print("Attempting to populate table from JSON file in sharded mode...")
+        file_loc = json_path or PWC_JSON_FILE
+        num_processes = min(os.cpu_count(), 16)
+        try:
+            # a few shards per worker, so one slow shard does not hold up the end of the load
+            shards = shard_ranges(file_loc, num_processes * 4)
+        except Exception as e:
+            print(f"Error reading JSON file: {str(e)}")
+            return False
+
+        stats = WorkerStats(num_processes, counters=('inserted', 'skipped', 'failed'))
+        dropped = Counter()
+        with ProgressReporter(stats), \
+                Pool(processes=num_processes, initializer=init_worker, initargs=(stats,)) as pool:
+            for shard_dropped in pool.imap_unordered(
+                    partial(insert_shard, path=file_loc, table_name=self.table_name, db_name=self.db_name), shards):
+                dropped.update(shard_dropped)
+            # closed and joined instead of terminated, so the workers' metrics finalizer runs (utils/metrics.py)
+            pool.close()
+            pool.join()
+
+        totals = stats.totals()
+        for reason, count in dropped.most_common():
+            print(f"  {reason:<28} {count:>8}")
+        print(f"Rows inserted: {totals['inserted']}, Rows skipped: {totals['skipped']}, "
+              f"Rows failed: {totals['failed']} of attempted {sum(totals.values())} ({len(shards)} shards)")
+        return True
+
+    @timeit
+    def populate_table_from_papers_and_code_json_bulk(self, row_limit: int = None, json_path: str = None) -> bool:
+        """
+        cold build of the table from the dump in a handful of statements:
+        1. one pass over the JSON rows (deduplicated and canonicalized like the other loaders, database/dedup.py)
+           writing a TSV file
+        2. LOAD DATA LOCAL INFILE of the file into a temporary staging table (classic protocol, MYSQL_CLASSIC_PORT)
+        3. one INSERT IGNORE ... SELECT from the staging table, rows clashing with the table's UNIQUE keys are rejected
+
+        needs mysql-connector-python (pip install mysql-connector-python) and local_infile=ON on the server
+        (db/my.cnf), the X protocol of create_session() has no LOAD DATA LOCAL
+        """
+        import tempfile
+        try:
+            import mysql.connector
+        except ImportError:
+            print("Bulk load needs the classic MySQL connector: pip install mysql-connector-python")
+            return False
+
+        print("Attempting to populate table from JSON file with LOAD DATA...")
+        file_loc = json_path or PWC_JSON_FILE
+        with open(file_loc, 'r', encoding='ascii') as f:
+            data = json.load(f)
+        if not data:
+            print("JSON file not read in correctly")
+            return False
+        data = data[:row_limit] if row_limit else data
+
+        # 1. TSV in the default LOAD DATA format: tab separated, backslash escapes, \N for NULL
+        dedup = Deduplicator()
+        tsv_file = tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.tsv', delete=False)
+        try:
+            with tsv_file:
+                for _, values in dedup.filter(data):
+                    tsv_file.write("\t".join(tsv_value(value) for value in (*values, fingerprint(values))) + "\n")
+            dedup.report()
+            dedup.write_drops(INGEST_DROPS_FILE)
+
+            staging_table = f"{self.table_name}_staging"
+            conn = None
+            try:
+                # a refused connection falls back to the parallel loader like a disabled local_infile
+                conn = mysql.connector.connect(host=MYSQL_HOST, port=MYSQL_CLASSIC_PORT, user=MYSQL_USER,
+                                               password=MYSQL_PASSWORD, database=self.db_name, allow_local_infile=True)
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                CREATE TEMPORARY TABLE {staging_table} (
+                    line INT AUTO_INCREMENT PRIMARY KEY,
+                    {', '.join(f'{column} TEXT' for column in UNIQUE_COLUMNS)},
+                    source_fingerprint CHAR(32)
+                ) CHARACTER SET utf8mb4""")
+
+                # 2. file -> staging table
+                with instrument("db_statement", statement="LOAD"):
+                    cursor.execute(f"""
+                    LOAD DATA LOCAL INFILE {escape_value(tsv_file.name)}
+                    INTO TABLE {staging_table}
+                    CHARACTER SET utf8mb4
+                    ({', '.join(UNIQUE_COLUMNS)}, source_fingerprint)""")
+                rows_staged = cursor.rowcount
+                cursor.execute("SHOW COUNT(*) WARNINGS")
+                load_warnings = cursor.fetchone()[0]
+
+                # 3. staging table -> table, in file order, the UNIQUE keys reject rows already in the table
+                with instrument("db_statement", statement="INSERT"):
+                    cursor.execute(f"""
+                    INSERT IGNORE INTO {self.table_name} ({', '.join(UNIQUE_COLUMNS)}, source_fingerprint)
+                    SELECT {', '.join(UNIQUE_COLUMNS)}, source_fingerprint
+                    FROM {staging_table}
+                    ORDER BY line""")
+                rows_inserted = cursor.rowcount
+                conn.commit()
+                cursor.execute(f"DROP TEMPORARY TABLE {staging_table}")
+            except mysql.connector.Error as e:
+                print(f"Error bulk loading table: {str(e)}")
+                if e.errno == 3948:
+                    print("local_infile is OFF on the server, set local_infile=ON (db/my.cnf)")
+                return False
+            finally:
+                if conn is not None:
+                    conn.close()
+        finally:
+            os.remove(tsv_file.name)
+
+        rows_rejected = rows_staged - rows_inserted
+        print(f"Rows staged: {rows_staged} ({load_warnings} load warnings), "
+              f"rejected by UNIQUE keys of the table: {rows_rejected}")
+        print(f"Rows inserted: {rows_inserted}, Rows skipped: {rows_rejected + sum(dedup.dropped.values())} "
+              f"of attempted {len(data)}")
+        return True
+
+    @timeit
+    def populate_table_from_github_repo_sequential(self, row_limit: int = None, id_range: tuple = None) -> bool:
         """
         Populate additional columns in the table using GitHub repository data.
         This includes:
 
         build_sys_type ['Not found', 'pip', 'conda']
         deps_file_url  f"https://raw.githubusercontent.com/{owner}/{repo}/{main,master}/{requirements.txt,env.yml,environment.yml}"
-        deps_file_content_orig  module0==1.0.2 module0==2.3.4
+        deps_file_content_orig  module0==1.0.2 module0==2.3.4  (papers_and_code_deps)
         contributors  github_username1, github_username2
         requirements_last_commit_date  'YYYY-MM-DD'
 
         if build_sys_type == "Not found" then the other fields are left NULL
+        rows move to stage QUALIFY, status OK (SKIPPED when no dependency file was found)
+
+        rows are streamed page by page (Table.iter_rows), id_range limits this call to one slice of the table
+        so several workers can each take one of Table.id_ranges(n)
         """
         # TODO: optimize speed
         session, schema = create_session(self.db_name)
         if not session: return False
 
         rows_updated, rows_skipped = 0, 0
-        table = schema.get_table(self.table_name)
 
         try:
-            # Fetch all rows from the table
+            # Stream the rows from the table
             # avoid rechecking rows where the build_sys_type has been populated (previously hit this section)
-            rows = table.select('github_url, paper_title').where('build_sys_type IS NULL').execute().fetch_all()
-            rows = rows[:row_limit] if row_limit else rows
+            rows = self.iter_rows('github_url, paper_title', where=f'stage = {int(Stage.FIND)} AND deleted_at IS NULL',
+                                  page_size=500, id_range=id_range, limit=row_limit, session=session)
 
             for row in rows:
-                github_url = row[0]  # Now correctly points to github_url
-                paper_title = row[1]  # Now correctly points to paper_title
+                row_id = row[0]
+                github_url = row[1]  # Now correctly points to github_url
+                paper_title = row[2]  # Now correctly points to paper_title
 
                 if github_url:
-                    owner_repo = extract_owner_repo(github_url)
-                    if owner_repo:
-                        owner, repo = owner_repo
-
-                        # Determine the requirements.txt file URL
-                        prefix = "https://raw.githubusercontent.com"
-                        builds_and_paths = {
-                        'pip':
-                        [
-                            f"{prefix}/{owner}/{repo}/main/requirements.txt",
-                            f"{prefix}/{owner}/{repo}/master/requirements.txt"
-                        ],
-                        'conda':
-                        [
-                            f"{prefix}/{owner}/{repo}/main/environment.yml",
-                            f"{prefix}/{owner}/{repo}/master/environment.yml",
-                            f"{prefix}/{owner}/{repo}/main/env.yml",
-                            f"{prefix}/{owner}/{repo}/master/env.yml"
-                        ]}
-                        deps_file_content_orig, deps_file_url, deps_last_commit_date = None, None, None
-                        build_sys_type = "Not found"
-                        for build_sys, deps_files in builds_and_paths.items():
-                            for deps_file_path in deps_files:
-                                content = self.get_file_content(deps_file_path)
-                                if content:
-                                    deps_file_content_orig = content
-                                    deps_file_url = deps_file_path
-                                    build_sys_type = build_sys
-                                    break
-
-                        # Determine build system type
-                        # hinge upon value of build_sys_type for future table queries
-                        # default sql update table if we don't find a requirements file
-                        update_cmd = f"""
-                        UPDATE {self.table_name}
-                        SET build_sys_type = {escape_value(build_sys_type)}
-                        WHERE paper_title = {escape_value(paper_title)}
-                        """
-
-                        # we found a requirements file, so fetch additional info from repo
-                        if build_sys_type != "Not found":
-                            # Fetch last commit date for the requirements file
-                            if deps_file_url:
-                                deps_last_commit_date = self.get_last_commit_date(
-                                    owner, repo, 'requirements.txt'
-                                )
-
-                            # Get contributors
-                            contributors = get_contributors(owner, repo)
-                            if contributors and len(contributors) > 255:
-                                contributors = contributors[:252] + '...'
-
-                            # Escape all values for SQL
-                            escaped_values = {
-                                'build_sys_type': escape_value(build_sys_type),
-                                'deps_file_url': escape_value(deps_file_url),
-                                'deps_file_content_orig': escape_value(deps_file_content_orig),
-                                'contributors': escape_value(contributors),
-                                'deps_last_commit_date': escape_value(deps_last_commit_date),
-                                'paper_title': escape_value(paper_title)
-                            }
-                            # overwrite default command if fields can be scraped
-                            update_cmd = f"""
-                            UPDATE {self.table_name}
-                            SET build_sys_type = {escaped_values['build_sys_type']},
-                                deps_file_url = {escaped_values['deps_file_url']},
-                                deps_file_content_orig = {escaped_values['deps_file_content_orig']},
-                                contributors = {escaped_values['contributors']},
-                                deps_last_commit_date = {escaped_values['deps_last_commit_date']}
-                            WHERE paper_title = {escaped_values['paper_title']};
-                            """
+                    info = qualify_repo(github_url)
+                    if info:
+                        qualify_cmds = self.qualify_cmds(row_id, info)
 
                         try:
-                            session.sql(update_cmd).execute()
+                            for cmd in qualify_cmds:
+                                execute_sql(session, cmd)
                             rows_updated += 1
                             if rows_updated % 100 == 0:
                                 print(f"-- Rows updated: {rows_updated} --\n")
@@ -973,7 +1208,6 @@ if __name__ == '__main__':
     if not is_docker():
         create_db(db_name=MYSQL_DATABASE) # do once
         show_all_tables(db_name=MYSQL_DATABASE)
-        drop_all_tables(db_name=MYSQL_DATABASE) # for testing
 
     # have function to populate the table from each data source
     # FIND      first 5 cols from 'links-between-papers-and-code.json'
@@ -985,7 +1219,13 @@ if __name__ == '__main__':
 
     papers_and_code = Table(table_name=TABLE_NAME, db_name=MYSQL_DATABASE)
     papers_and_code.create_table_full()
+    # tables created before the latest schema change
+    from database.migrate import migrate
+    migrate(db_name=MYSQL_DATABASE)
     show_table_columns(table_name=TABLE_NAME, db_name=MYSQL_DATABASE)
+    # notification queue for the publish stage (scripts/notification.py)
+    from database.outbox import create_outbox_table
+    create_outbox_table(db_name=MYSQL_DATABASE)
 
     # 185,000 new rows of 272,000 possible \/
     # sequential took 158 seconds on M3 Max MBP with 14 cores, 96GB RAM
@@ -993,7 +1233,15 @@ if __name__ == '__main__':
     # papers_and_code.populate_table_from_papers_and_code_json_sequential()
     # parallel took 23 seconds on M3 Max MBP with 14 cores, 96GB RAM
     # parallel took 40 seconds on 2x Xeon E5-2699 v4 server with 44 cores, 256GB RAM
-    papers_and_code.populate_table_from_papers_and_code_json_parallel()
+    # LOAD DATA bulk load, benchmarks/ingest_bench.py compares the modes
+    # falls back to the parallel loader without mysql-connector-python or local_infile
+    # a populated table is synced with the dump instead, keeping the GitHub, build and notification columns
+    if not list(papers_and_code.iter_rows('id', limit=1)):
+        if not papers_and_code.populate_table_from_papers_and_code_json_bulk():
+            papers_and_code.populate_table_from_papers_and_code_json_parallel()
+    else:
+        from database.delta_sync import sync_from_json
+        sync_from_json(papers_and_code)
     show_table_contents(table_name=TABLE_NAME, db_name=MYSQL_DATABASE, limit_num=row_limit_view)
 
     # given the 5000 github api call limit per hour, row limit is set here
@@ -0,0 +1,204 @@
+"""
+In-memory deduplication of links-between-papers-and-code.json rows against the UNIQUE columns of papers_and_code
+
+About a third of the dump repeats a paper (the same paper listed with several repos), and every repeat used to
+reach the server only to fail on a UNIQUE constraint. Deduplicator canonicalizes the five unique columns and keeps
+one hash map per column, so only rows that will be inserted are sent and every other row gets a drop reason:
+
+    unparseable             the row is a string that is not JSON
+    missing_arxiv_url       no paper_url_abs (the loaders need the arXiv link)
+    missing_title           no paper_title (NOT NULL)
+    nested_github_url       https://github.com/<user>/https-github.com-..., raw file URLs of those fail
+    too_long:<column>       longer than the VARCHAR(255) column
+    duplicate:<column>      same canonical value as an earlier row (or a row already in the table)
+
+Canonical values, which are also the values inserted:
+    URLs          https, lowercase host without www., no trailing slash, query or fragment (github: no .git)
+    arXiv URL     https://arxiv.org/abs/<id> for abs and pdf links of any version (v1, v2, ... are one paper)
+    arXiv id      without the version suffix
+    title         whitespace collapsed
+Comparison is also case and accent insensitive, like the utf8mb4 collation of the table.
+
+    dedup = Deduplicator()
+    dedup.preload(table)                      keys of the rows already in the table (appending)
+    for idx, values in dedup.filter(rows):    values in UNIQUE_COLUMNS order
+        ...
+    dedup.report()                            drop counts per reason
+    dedup.write_drops("output/ingest_dropped.csv")
+
+import into other python files like
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.dedup import Deduplicator, UNIQUE_COLUMNS, fingerprint
+"""
+
+import os
+import re
+import csv
+import json
+import hashlib
+import unicodedata
+from collections import Counter
+from urllib.parse import urlsplit
+
+# the columns the JSON loaders fill, all UNIQUE, in insert order
+UNIQUE_COLUMNS = ("paper_title", "paper_arxiv_id", "paper_arxiv_url", "paper_pwc_url", "github_url")
+# column -> field of links-between-papers-and-code.json
+JSON_FIELDS = {
+    "paper_title": "paper_title",
+    "paper_arxiv_id": "paper_arxiv_id",
+    "paper_arxiv_url": "paper_url_abs",
+    "paper_pwc_url": "paper_url",
+    "github_url": "repo_url",
+}
+MAX_LENGTH = 255
+
+NESTED_GITHUB_URL = re.compile(r"http[s]{0,1}://.+/http[s]{0,1}-github.com")
+ARXIV_VERSION = re.compile(r"v\d+$")
+ARXIV_PATH = re.compile(r"^/(?:abs|pdf)/(.+?)(?:\.pdf)?$")
+
+###########################
+# CANONICAL VALUES
+###########################
+
+def canonical_url(url):
+    url = url.strip()
+    parts = urlsplit(url)
+    if not parts.netloc:
+        return url
+    host = parts.netloc.lower().removeprefix("www.")
+    return f"https://{host}{parts.path.rstrip('/')}"
+
+
+def canonical_github_url(url):
+    return canonical_url(url).removesuffix(".git")
+
+
+def canonical_arxiv_id(arxiv_id):
+    return ARXIV_VERSION.sub("", arxiv_id.strip())
+
+
+def canonical_arxiv_url(url):
+    url = canonical_url(url)
+    parts = urlsplit(url)
+    match = ARXIV_PATH.match(parts.path)
+    if parts.netloc == "arxiv.org" and match:
+        return f"https://arxiv.org/abs/{canonical_arxiv_id(match.group(1))}"
+    return url
+
+
+def canonical_title(title):
+    return " ".join(title.split())
+
+
+CANONICAL = {
+    "paper_title": canonical_title,
+    "paper_arxiv_id": canonical_arxiv_id,
+    "paper_arxiv_url": canonical_arxiv_url,
+    "paper_pwc_url": canonical_url,
+    "github_url": canonical_github_url,
+}
+
+
+def fingerprint(values):
+    """
+    md5 of the paper fields of a row's canonical values (everything but github_url, the key of database/delta_sync.py)
+    stored in source_fingerprint, a refreshed dump only rewrites the rows whose fingerprint changed
+    """
+    paper_fields = (value or "" for column, value in zip(UNIQUE_COLUMNS, values) if column != "github_url")
+    return hashlib.md5("\x1f".join(paper_fields).encode("utf-8")).hexdigest()
+
+
+def comparison_key(value):
+    # how the case and accent insensitive collation of the table compares two values
+    value = unicodedata.normalize("NFKD", value.casefold())
+    return "".join(char for char in value if not unicodedata.combining(char))
+
+###########################
+# DEDUPLICATOR
+###########################
+
+class Deduplicator:
+    def __init__(self):
+        # column -> {comparison key: source of the row that holds it (row index, or "table")}
+        self.seen = {column: {} for column in UNIQUE_COLUMNS}
+        self.dropped = Counter()
+        self.drops = []     # (row index, reason, value)
+        self.kept = 0
+
+    def preload(self, table, session=None):
+        """
+        add the keys of the rows already in table (a database_cmds.Table), returns the number of rows read
+        """
+        rows = 0
+        for row in table.iter_rows(", ".join(UNIQUE_COLUMNS), page_size=10000, session=session):
+            for column, value in zip(UNIQUE_COLUMNS, row[1:]):
+                if value is not None:
+                    self.seen[column][comparison_key(value)] = "table"
+            rows += 1
+        return rows
+
+    def drop(self, idx, reason, value=None):
+        self.dropped[reason] += 1
+        self.drops.append((idx, reason, value))
+        return None
+
+    def check(self, row, idx=None):
+        """
+        canonical values (in UNIQUE_COLUMNS order) of a JSON row that will insert, None if it is dropped
+        the kept row's keys are added, so a later row with any of the same values is dropped
+        """
+        if isinstance(row, str):
+            try:
+                row = json.loads(row)
+            except ValueError:
+                return self.drop(idx, "unparseable", row[:MAX_LENGTH])
+        if not row.get('paper_url_abs'):
+            return self.drop(idx, "missing_arxiv_url", row.get('paper_title'))
+        if not row.get('paper_title'):
+            return self.drop(idx, "missing_title", row.get('paper_url_abs'))
+        if row.get('repo_url') and NESTED_GITHUB_URL.match(row['repo_url']):
+            return self.drop(idx, "nested_github_url", row['repo_url'])
+
+        values = []
+        for column in UNIQUE_COLUMNS:
+            value = row.get(JSON_FIELDS[column])
+            value = CANONICAL[column](str(value)) if value is not None else None
+            if value is not None and len(value) > MAX_LENGTH:
+                return self.drop(idx, f"too_long:{column}", value[:MAX_LENGTH])
+            values.append(value)
+
+        keys = [comparison_key(value) if value is not None else None for value in values]
+        for column, key, value in zip(UNIQUE_COLUMNS, keys, values):
+            # NULLs never collide on a UNIQUE index
+            if key is not None and key in self.seen[column]:
+                return self.drop(idx, f"duplicate:{column}", f"{value} (row {self.seen[column][key]})")
+
+        for column, key in zip(UNIQUE_COLUMNS, keys):
+            if key is not None:
+                self.seen[column][key] = idx
+        self.kept += 1
+        return tuple(values)
+
+    def filter(self, rows):
+        """
+        yield (row index, values) for the rows of rows that will insert
+        """
+        for idx, row in enumerate(rows):
+            values = self.check(row, idx)
+            if values is not None:
+                yield idx, values
+
+    def report(self):
+        print(f"Deduplication: kept {self.kept}, dropped {sum(self.dropped.values())}")
+        for reason, count in self.dropped.most_common():
+            print(f"  {reason:<28} {count:>8}")
+
+    def write_drops(self, path):
+        # every dropped row: index in the JSON file, reason, offending value
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["row", "reason", "value"])
+            writer.writerows(self.drops)
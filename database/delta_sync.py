@@ -0,0 +1,226 @@
+"""
+Delta sync of papers_and_code with a refreshed links-between-papers-and-code.json
+
+Reloading the table from scratch throws away the GitHub enrichment, build results and notification flags.
+Instead every record is keyed by its canonical github_url and fingerprinted (md5 of its canonical paper fields,
+database/dedup.py), and only the difference with the stored fingerprints is written:
+
+    insert      github_url not in the table
+    update      same github_url, paper fields changed: the paper columns are rewritten, enrichment is kept
+    move        the paper is in the table under a github_url that left the dump: github_url is replaced and the
+                enrichment, dependency file (and its index rows) and notifications of the old repo are reset
+                (the repo starts at FIND)
+    delete      github_url left the dump: soft delete (deleted_at), every work queue skips the row
+    restore     a soft-deleted github_url is back in the dump
+
+Reading the stored fingerprints is one streamed scan of five short columns, the writes are proportional to the
+changes. Records without a github_url cannot be keyed and are left out.
+
+To run:
+(venv) python3 database/delta_sync.py --dry-run          # print what would change
+(venv) python3 database/delta_sync.py --json data/links-between-papers-and-code.json
+
+import into other python files like
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.delta_sync import sync_from_json
+"""
+
+import os
+import sys
+import json
+import argparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.database_cmds import (Table, create_session, escape_value, MYSQL_DATABASE, TABLE_NAME,
+                                    PWC_JSON_FILE, INGEST_DROPS_FILE)
+from database.dedup import Deduplicator, UNIQUE_COLUMNS, fingerprint, comparison_key
+from database.pipeline_state import Stage, Status, state_sql
+from utils.metrics import execute_sql
+
+BATCH_SIZE = 500
+GITHUB_URL = UNIQUE_COLUMNS.index("github_url")
+
+# columns derived from the repo, reset when a paper moves to another github_url
+ENRICHMENT_RESET = f"""contributors = NULL, build_sys_type = NULL, deps_file_url = NULL, deps_last_commit_date = NULL,
+    build_status_orig = NULL, build_status_edited = NULL, datetime_latest_build = NULL, num_build_attempts = 0,
+    py_valid_versions = NULL, github_fork_url = NULL, pushed_to_fork = FALSE, pull_request_made = FALSE,
+    tweet_posted = FALSE, tweet_url = NULL, {state_sql(Stage.FIND, Status.PENDING)}"""
+
+###########################
+# PLAN
+###########################
+
+def load_records(json_path, dedup):
+    """
+    canonical values of the dump's records that have a github_url, deduplicated, keyed by github_url
+    """
+    with open(json_path, 'r', encoding='ascii') as f:
+        data = json.load(f)
+    records = {}
+    for _, values in dedup.filter(data):
+        if values[GITHUB_URL] is not None:
+            records[comparison_key(values[GITHUB_URL])] = values
+    return records
+
+
+def plan_sync(stored_rows, records):
+    """
+    stored_rows: (id, github_url, paper_pwc_url, paper_title, source_fingerprint, deleted) of the table
+    records: {github_url key: canonical values} of the dump
+    returns {"insert": [values], "update": [(id, values)], "move": [(id, values)], "delete": [id], "restore": [id],
+             "unchanged": count}
+    """
+    plan = {"insert": [], "update": [], "move": [], "delete": [], "restore": [], "unchanged": 0}
+    seen = set()
+    # rows whose github_url left the dump (id -> deleted), and their ids by paper: candidates for a move
+    leaving, leaving_papers = {}, {}
+    for row_id, github_url, pwc_url, title, stored_fingerprint, deleted in stored_rows:
+        key = comparison_key(github_url) if github_url else None
+        values = records.get(key) if key else None
+        if values is None:
+            leaving[row_id] = deleted
+            for paper_key in (pwc_url, title):
+                if paper_key:
+                    leaving_papers.setdefault(comparison_key(paper_key), row_id)
+            continue
+        seen.add(key)
+        if fingerprint(values) != stored_fingerprint:
+            plan["update"].append((row_id, values))
+        elif deleted:
+            plan["restore"].append(row_id)
+        else:
+            plan["unchanged"] += 1
+
+    pwc_url, title = UNIQUE_COLUMNS.index("paper_pwc_url"), UNIQUE_COLUMNS.index("paper_title")
+    for key, values in records.items():
+        if key in seen:
+            continue
+        row_id = None
+        for paper_value in (values[pwc_url], values[title]):
+            candidate = leaving_papers.get(comparison_key(paper_value)) if paper_value else None
+            if candidate is not None and candidate in leaving:
+                row_id = candidate
+                break
+        if row_id is None:
+            plan["insert"].append(values)
+        else:
+            # claimed, a row moves once
+            del leaving[row_id]
+            plan["move"].append((row_id, values))
+
+    plan["delete"] = [row_id for row_id, deleted in leaving.items() if not deleted]
+    return plan
+
+###########################
+# APPLY
+###########################
+
+def set_values_sql(values):
+    return ", ".join(f"{column} = {escape_value(value)}" for column, value in zip(UNIQUE_COLUMNS, values))
+
+
+def apply_sync(session, table, plan):
+    """
+    write the plan in one transaction, returns {change: rows written} and the rejected rows (UNIQUE clashes)
+    """
+    written = {"insert": 0, "update": 0, "move": 0, "delete": 0, "restore": 0}
+    rejected = []
+    session.start_transaction()
+    try:
+        for change, deleted_at in (("delete", "NOW()"), ("restore", "NULL")):
+            ids = plan[change]
+            for i in range(0, len(ids), BATCH_SIZE):
+                result = execute_sql(session, f"""
+                UPDATE {table.table_name} SET deleted_at = {deleted_at}
+                WHERE id IN ({', '.join(str(int(row_id)) for row_id in ids[i:i + BATCH_SIZE])})""")
+                written[change] += result.get_affected_items_count()
+
+        for change, reset in (("update", ""), ("move", f", {ENRICHMENT_RESET}")):
+            for row_id, values in plan[change]:
+                try:
+                    execute_sql(session, f"""
+                    UPDATE {table.table_name}
+                    SET {set_values_sql(values)}, source_fingerprint = {escape_value(fingerprint(values))},
+                        deleted_at = NULL{reset}
+                    WHERE id = {int(row_id)}""")
+                    written[change] += 1
+                except Exception as e:
+                    rejected.append((change, values[GITHUB_URL], str(e)))
+                    continue
+                if change == "move":
+                    # the old repo's dependency file and notifications do not apply to the new one
+                    execute_sql(session, f"DELETE FROM {table.deps_table_name} WHERE id = {int(row_id)}")
+                    execute_sql(session, f"DELETE FROM {table.dependents_table_name} WHERE repo_id = {int(row_id)}")
+                    if table.table_name == TABLE_NAME:
+                        from database.outbox import OUTBOX_TABLE
+                        execute_sql(session, f"DELETE FROM {OUTBOX_TABLE} WHERE repo_id = {int(row_id)}")
+
+        inserts = plan["insert"]
+        for i in range(0, len(inserts), BATCH_SIZE):
+            batch = inserts[i:i + BATCH_SIZE]
+            rows_sql = ",\n".join(
+                f"({', '.join(escape_value(value) for value in (*values, fingerprint(values)))})" for values in batch)
+            # IGNORE: a clash with a row outside the dump (e.g. a soft-deleted one) rejects that row only
+            result = execute_sql(session, f"""
+            INSERT IGNORE INTO {table.table_name} ({', '.join(UNIQUE_COLUMNS)}, source_fingerprint)
+            VALUES {rows_sql}""")
+            inserted = result.get_affected_items_count()
+            written["insert"] += inserted
+            if inserted < len(batch):
+                rejected.append(("insert", f"{len(batch) - inserted} rows of batch {i // BATCH_SIZE}", "UNIQUE clash"))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return written, rejected
+
+
+def print_plan(plan):
+    print(f"Unchanged: {plan['unchanged']}, insert: {len(plan['insert'])}, update: {len(plan['update'])}, "
+          f"move: {len(plan['move'])}, delete: {len(plan['delete'])}, restore: {len(plan['restore'])}")
+
+###########################
+# MAIN FUNCTION
+###########################
+
+def sync_from_json(table: Table, json_path: str = None, dry_run: bool = False) -> bool:
+    """
+    bring table in line with the dump at json_path (data/links-between-papers-and-code.json by default)
+    """
+    dedup = Deduplicator()
+    records = load_records(json_path or PWC_JSON_FILE, dedup)
+    dedup.report()
+    dedup.write_drops(INGEST_DROPS_FILE)
+
+    session, _ = create_session(table.db_name)
+    try:
+        stored_rows = table.iter_rows(
+            "github_url, paper_pwc_url, paper_title, source_fingerprint, deleted_at IS NOT NULL",
+            page_size=10000, session=session)
+        plan = plan_sync(((row[0], *row[1:5], bool(row[5])) for row in stored_rows), records)
+        print_plan(plan)
+        if dry_run:
+            return True
+        written, rejected = apply_sync(session, table, plan)
+        print(f"Written: {written}")
+        for change, github_url, error in rejected:
+            print(f"Rejected {change} {github_url}: {error}")
+        return True
+    except Exception as e:
+        print(f"Error syncing table: {str(e)}")
+        return False
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync papers_and_code with a refreshed Papers with Code dump")
+    parser.add_argument('--json', default=None, help='Dump to sync with (data/links-between-papers-and-code.json)')
+    parser.add_argument('--table', default=TABLE_NAME)
+    parser.add_argument('--dry-run', action='store_true', help='Only print the changes')
+    args = parser.parse_args()
+    ok = sync_from_json(Table(args.table, MYSQL_DATABASE), json_path=args.json, dry_run=args.dry_run)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,230 @@
+"""
+Reverse dependency index: which repos depend on which package
+
+<table>_dependents (papers_and_code_dependents) holds one row per (package, repo) of the repo's original dependency
+file, with the requirement's specifier and the pinned version when it is pinned (==x.y.z). Package names are
+normalized like PEP 503 (lowercase, runs of - _ . become -), so Scikit_Learn and scikit-learn are one package.
+Table.qualify_cmds() rewrites a repo's rows whenever its dependency file is fetched, rebuild() backfills them.
+
+A release or a yank of package==version affects the repos whose specifier admits that version (unpinned
+repos included, repos pinned to another version excluded):
+
+    dependents("numpy", "2.0.0")          [{"id", "github_url", "specifier", "pinned_version"}, ...]
+    packages_of(repo_id)                   [(package, specifier, pinned_version), ...]
+    top_packages(20)                       [(package, repos), ...]
+
+(venv) python3 scripts/build_check.py --affected numpy==2.0.0 re-checks only those repos.
+
+To run:
+(venv) python3 database/dependency_index.py --rebuild         # index every fetched dependency file
+(venv) python3 database/dependency_index.py numpy==2.0.0      # list the affected repos
+
+import into other python files like
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.dependency_index import dependents, index_cmds, normalize_name
+"""
+
+import os
+import re
+import sys
+import argparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.database_cmds import Table, create_session, escape_value, MYSQL_DATABASE, TABLE_NAME
+from utils.metrics import execute_sql
+
+# not packages a build can be broken by a release of
+IGNORED_PACKAGES = {"python", "pip"}
+CONDA_PIN = re.compile(r"^\s*([A-Za-z0-9_.\-]+)\s*=\s*([0-9][^=\s]*)")
+
+###########################
+# PARSING
+###########################
+
+def normalize_name(name: str) -> str:
+    # PEP 503
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def requirement_lines(content: str, build_sys_type: str = None) -> list:
+    """
+    pip requirement strings of a dependency file: requirements.txt lines, or the conda and pip dependencies of an
+    environment.yml (conda's name=version becomes name==version)
+    """
+    if build_sys_type == "conda":
+        import yaml
+        try:
+            env = yaml.safe_load(content) or {}
+        except yaml.YAMLError:
+            return []
+        lines = []
+        for dependency in env.get("dependencies", []) or []:
+            if isinstance(dependency, str):
+                # conda pins are name=version[=build], other specifiers are pip's
+                pin = CONDA_PIN.match(dependency)
+                lines.append(f"{pin.group(1)}=={pin.group(2)}" if pin else dependency)
+            elif isinstance(dependency, dict):
+                lines.extend(str(line) for line in dependency.get("pip", []) or [])
+        return lines
+    return content.splitlines()
+
+
+def parse_requirements(content: str, build_sys_type: str = None) -> dict:
+    """
+    {normalized package: (specifier, pinned version or None)} of a dependency file
+    options (-r, -e, --index-url), URLs and unparseable lines are left out
+    """
+    from packaging.requirements import Requirement, InvalidRequirement
+    packages = {}
+    for line in requirement_lines(content or "", build_sys_type):
+        line = line.split(" #")[0].strip()
+        if not line or line.startswith(("#", "-")) or "://" in line:
+            continue
+        try:
+            requirement = Requirement(line)
+        except InvalidRequirement:
+            continue
+        package = normalize_name(requirement.name)
+        if package in IGNORED_PACKAGES:
+            continue
+        specifiers = list(requirement.specifier)
+        pinned = None
+        if len(specifiers) == 1 and specifiers[0].operator in ("==", "===") and "*" not in specifiers[0].version:
+            pinned = specifiers[0].version
+        packages[package] = (str(requirement.specifier)[:255], pinned)
+    return packages
+
+
+def admits(specifier: str, version: str) -> bool:
+    # an empty specifier admits every version, prereleases count (a broken rc breaks unpinned installs too)
+    from packaging.specifiers import SpecifierSet, InvalidSpecifier
+    try:
+        return SpecifierSet(specifier).contains(version, prereleases=True)
+    except InvalidSpecifier:
+        return True
+
+###########################
+# WRITES
+###########################
+
+def index_cmds(dependents_table_name: str, repo_id: int, content: str = None, build_sys_type: str = None) -> list:
+    """
+    SQL statements replacing the index rows of one repo with the packages of its dependency file
+    (content None: the repo has no dependency file, its rows are removed)
+    """
+    cmds = [f"DELETE FROM {dependents_table_name} WHERE repo_id = {int(repo_id)}"]
+    packages = parse_requirements(content, build_sys_type) if content else {}
+    if packages:
+        values = ",\n".join(f"({escape_value(package)}, {int(repo_id)}, {escape_value(specifier)}, "
+                            f"{escape_value(pinned)})" for package, (specifier, pinned) in packages.items())
+        cmds.append(f"""
+        INSERT INTO {dependents_table_name} (package, repo_id, specifier, pinned_version)
+        VALUES {values}""")
+    return cmds
+
+
+def rebuild(table: Table) -> int:
+    """
+    index every fetched dependency file of table, returns the number of repos indexed
+    """
+    session, _ = create_session(table.db_name)
+    repos = 0
+    try:
+        rows = session.sql(f"""
+        SELECT t.id, t.build_sys_type, d.deps_file_content_orig
+        FROM {table.table_name} t JOIN {table.deps_table_name} d ON d.id = t.id
+        WHERE d.deps_file_content_orig IS NOT NULL""").execute()
+        # read everything first, one session cannot interleave a result set with other statements
+        rows = rows.fetch_all()
+        session.start_transaction()
+        for repo_id, build_sys_type, content in rows:
+            for cmd in index_cmds(table.dependents_table_name, repo_id, content, build_sys_type):
+                execute_sql(session, cmd)
+            repos += 1
+        session.commit()
+        return repos
+    finally:
+        session.close()
+
+###########################
+# QUERIES
+###########################
+
+def dependents(package: str, version: str = None, table: Table = None, session=None) -> list:
+    """
+    repos depending on package, when version is given only those whose specifier admits it
+    soft-deleted repos are left out
+    """
+    table = table or Table(TABLE_NAME, MYSQL_DATABASE)
+    own_session = session is None
+    if own_session:
+        session, _ = create_session(table.db_name)
+    try:
+        rows = execute_sql(session, f"""
+        SELECT t.id, t.github_url, d.specifier, d.pinned_version
+        FROM {table.dependents_table_name} d JOIN {table.table_name} t ON t.id = d.repo_id
+        WHERE d.package = {escape_value(normalize_name(package))} AND t.deleted_at IS NULL
+        ORDER BY t.id""").fetch_all()
+    finally:
+        if own_session:
+            session.close()
+    return [{"id": row[0], "github_url": row[1], "specifier": row[2], "pinned_version": row[3]}
+            for row in rows if version is None or admits(row[2], version)]
+
+
+def packages_of(repo_id: int, table: Table = None, session=None) -> list:
+    table = table or Table(TABLE_NAME, MYSQL_DATABASE)
+    own_session = session is None
+    if own_session:
+        session, _ = create_session(table.db_name)
+    try:
+        return execute_sql(session, f"""
+        SELECT package, specifier, pinned_version FROM {table.dependents_table_name}
+        WHERE repo_id = {int(repo_id)} ORDER BY package""").fetch_all()
+    finally:
+        if own_session:
+            session.close()
+
+
+def top_packages(limit: int = 20, table: Table = None, session=None) -> list:
+    table = table or Table(TABLE_NAME, MYSQL_DATABASE)
+    own_session = session is None
+    if own_session:
+        session, _ = create_session(table.db_name)
+    try:
+        return execute_sql(session, f"""
+        SELECT package, COUNT(*) AS repos FROM {table.dependents_table_name}
+        GROUP BY package ORDER BY repos DESC LIMIT {int(limit)}""").fetch_all()
+    finally:
+        if own_session:
+            session.close()
+
+
+def parse_package_arg(arg: str) -> tuple:
+    # "numpy==2.0.0" -> ("numpy", "2.0.0"), "numpy" -> ("numpy", None)
+    package, _, version = arg.partition("==")
+    return package.strip(), version.strip() or None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reverse dependency index of papers_and_code")
+    parser.add_argument('package', nargs='?', help='package or package==version to list the dependents of')
+    parser.add_argument('--rebuild', action='store_true', help='Index every fetched dependency file')
+    parser.add_argument('--top', type=int, default=0, help='Show the N packages most repos depend on')
+    args = parser.parse_args()
+
+    table = Table(TABLE_NAME, MYSQL_DATABASE)
+    if args.rebuild:
+        print(f"Indexed {rebuild(table)} repos.")
+    if args.top:
+        for package, repos in top_packages(args.top, table):
+            print(f"{repos:>8}  {package}")
+    if args.package:
+        package, version = parse_package_arg(args.package)
+        rows = dependents(package, version, table)
+        for row in rows:
+            print(f"{row['id']:>8}  {row['github_url']}  {row['specifier'] or '(any)'}")
+        print(f"{len(rows)} repos affected by {args.package}")
@@ -0,0 +1,106 @@
+"""
+Byte-range shards of links-between-papers-and-code.json, parsed and inserted by the worker that owns them
+
+The dump is one JSON array of flat records. shard_ranges() cuts it into byte ranges that start and end on record
+boundaries, so every worker can mmap the file, parse only its range with orjson (b"[" + range + b"]") and insert
+it, and the parent process never reads the records. Memory is the page cache of the file plus one shard per worker.
+
+A record boundary is searched as a comma followed by the start of an object, `,{"` (whitespace allowed). The pattern
+is not checked against the strings of the records: a value ending in `,{` matches it too (its closing quote follows).
+A range cut there, or anywhere else than between records, does not parse, so the load fails loudly instead of
+inserting wrong rows.
+
+Rows are deduplicated within a shard (database/dedup.py) and inserted in batches with INSERT IGNORE, rows clashing
+with another shard's rows (or rows already in the table) are rejected by the UNIQUE keys of the table.
+
+import into other python files like
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.json_shards import shard_ranges, load_shard, insert_shard
+"""
+
+import os
+import re
+import sys
+import mmap
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+RECORD_BOUNDARY = re.compile(rb',\s*(?=\{")')
+INSERT_BATCH_SIZE = 1000
+
+
+def shard_ranges(path: str, shards: int) -> list:
+    """
+    (start, end) byte ranges of the records of the JSON array at path, about the same size each, without the
+    brackets and the commas between shards
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        first = mm.find(b"[") + 1
+        last = mm.rfind(b"]")
+        if first == 0 or last < first:
+            raise ValueError(f"{path} is not a JSON array")
+        ranges = []
+        start = first
+        for i in range(1, shards):
+            # next record boundary after the i-th fraction of the file
+            match = RECORD_BOUNDARY.search(mm, max(start, first + (last - first) * i // shards), last)
+            if match is None:
+                break
+            if match.start() > start:
+                ranges.append((start, match.start()))
+                start = match.end()
+        if mm[start:last].strip():
+            ranges.append((start, last))
+        return ranges
+
+
+def load_shard(path: str, start: int, end: int) -> list:
+    """
+    records in path[start:end], parsed with orjson
+    """
+    import orjson
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return orjson.loads(b"[" + mm[start:end] + b"]")
+
+
+def insert_shard(shard_range, path, table_name, db_name):
+    """
+    Pool worker: parse one shard, deduplicate it and insert it in batches
+    counts go to this worker's row of utils.progress stats, returns the drop reasons of the shard (a Counter)
+    rows of a batch the server failed to insert are counted as failed and dropped as insert_error, not as rejected
+    """
+    from database.database_cmds import create_session, escape_value
+    from database.dedup import Deduplicator, UNIQUE_COLUMNS, fingerprint
+    from utils.metrics import execute_sql
+    from utils.progress import worker_stats
+    stats = worker_stats()
+    dedup = Deduplicator()
+    rows = [values for _, values in dedup.filter(load_shard(path, *shard_range))]
+    stats.add('skipped', sum(dedup.dropped.values()))
+
+    session, _ = create_session(db_name)
+    try:
+        for i in range(0, len(rows), INSERT_BATCH_SIZE):
+            batch = rows[i:i + INSERT_BATCH_SIZE]
+            values_sql = ",\n".join(
+                f"({', '.join(escape_value(value) for value in (*values, fingerprint(values)))})" for values in batch)
+            try:
+                result = execute_sql(session, f"""
+                INSERT IGNORE INTO {table_name} ({', '.join(UNIQUE_COLUMNS)}, source_fingerprint)
+                VALUES {values_sql}""")
+                inserted = result.get_affected_items_count()
+            except Exception as e:
+                print(f"Error inserting batch of shard {shard_range}: {str(e)}")
+                stats.add('failed', len(batch))
+                dedup.dropped["insert_error"] += len(batch)
+                continue
+            stats.add('inserted', inserted)
+            stats.add('skipped', len(batch) - inserted)
+            if inserted < len(batch):
+                dedup.dropped["rejected_by_table"] += len(batch) - inserted
+    finally:
+        session.close()
+    return dedup.dropped
@@ -0,0 +1,121 @@
+"""
+Schema migrations for grimrepor_db
+
+Applies the db/migrations/NNN_*.sql files that are not recorded in schema_migrations yet, in file name order.
+Fresh databases (db/mysql-init/*.sql, Table.create_table_full) are created with the latest layout and record
+every migration as applied, so this is only needed for databases created before a migration was added.
+
+MySQL commits every DDL statement on its own, so a migration that fails halfway is not rolled back:
+fix the cause, finish or undo the remaining statements by hand and run again.
+
+To run:
+(venv) python3 database/migrate.py             # apply pending migrations
+(venv) python3 database/migrate.py --status    # list applied and pending migrations
+"""
+
+import os
+import sys
+import argparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.database_cmds import create_session, escape_value, MYSQL_DATABASE
+
+MIGRATIONS_DIR = os.path.join(ROOT, "db", "migrations")
+MIGRATIONS_TABLE = "schema_migrations"
+
+
+def migration_files(migrations_dir: str = MIGRATIONS_DIR) -> list:
+    if not os.path.isdir(migrations_dir):
+        return []
+    return sorted(f for f in os.listdir(migrations_dir) if f.endswith(".sql"))
+
+
+def split_statements(sql: str) -> list:
+    """
+    statements of a migration file, separated by ';' at the end of a line
+    (the migrations hold no procedures or triggers, so that is enough)
+    """
+    statements, current = [], []
+    for line in sql.splitlines():
+        if line.strip().startswith("--"):
+            continue
+        current.append(line)
+        if line.rstrip().endswith(";"):
+            statement = "\n".join(current).strip().rstrip(";")
+            if statement:
+                statements.append(statement)
+            current = []
+    if "\n".join(current).strip():
+        statements.append("\n".join(current).strip())
+    return statements
+
+
+def ensure_migrations_table(session):
+    session.sql(f"""
+    CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+        version VARCHAR(255) PRIMARY KEY,
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""").execute()
+
+
+def applied_migrations(session) -> set:
+    ensure_migrations_table(session)
+    return {row[0] for row in session.sql(f"SELECT version FROM {MIGRATIONS_TABLE}").execute().fetch_all()}
+
+
+def mark_applied(session, versions=None):
+    """
+    record migrations as applied without running them (fresh databases already have the latest layout)
+    """
+    ensure_migrations_table(session)
+    versions = migration_files() if versions is None else versions
+    for version in versions:
+        session.sql(f"INSERT IGNORE INTO {MIGRATIONS_TABLE} (version) VALUES ({escape_value(version)})").execute()
+    session.commit()
+
+
+def migrate(db_name: str = MYSQL_DATABASE, migrations_dir: str = MIGRATIONS_DIR) -> bool:
+    session, _ = create_session(db_name)
+    try:
+        done = applied_migrations(session)
+        pending = [f for f in migration_files(migrations_dir) if f not in done]
+        if not pending:
+            print("Schema is up to date.")
+            return True
+        for version in pending:
+            with open(os.path.join(migrations_dir, version), 'r') as f:
+                statements = split_statements(f.read())
+            print(f"Applying {version} ({len(statements)} statements)")
+            for statement in statements:
+                try:
+                    session.sql(statement).execute()
+                except Exception as e:
+                    print(f"Error applying {version}: {str(e)}\n{statement}")
+                    return False
+            session.sql(f"INSERT INTO {MIGRATIONS_TABLE} (version) VALUES ({escape_value(version)})").execute()
+            session.commit()
+        print(f"Applied {len(pending)} migrations.")
+        return True
+    finally:
+        session.close()
+
+
+def show_status(db_name: str = MYSQL_DATABASE) -> bool:
+    session, _ = create_session(db_name)
+    try:
+        done = applied_migrations(session)
+        for version in migration_files():
+            print(f"  [{'x' if version in done else ' '}] {version}")
+        return True
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument('--status', action='store_true', help='List applied and pending migrations')
+    args = parser.parse_args()
+
+    ok = show_status() if args.status else migrate()
+    sys.exit(0 if ok else 1)
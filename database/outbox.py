@@ -0,0 +1,226 @@
+"""
+Outbox queue for notifications (tweets, emails)
+
+Every notification is one row of notification_outbox, unique per (repo_id, channel), so a repo can never be
+queued twice for the same channel. Dispatchers claim rows with a lease:
+
+    enqueue(session, "tweet")                       INSERT IGNORE ... SELECT, one statement for every new row
+    rows = claim_batch(session, "tweet", owner, 5)  SELECT ... FOR UPDATE SKIP LOCKED + one UPDATE
+    complete_batch(session, "tweet", owner, results)  one UPDATE of the outbox + one UPDATE of papers_and_code
+    release_batch(session, owner, failures)         back to pending (or failed after MAX_ATTEMPTS)
+
+scripts/notification.py sends every channel, tweet_bot/tweet.py a single tweet through the same claim.
+
+SKIP LOCKED means concurrent dispatchers never claim the same row, and a claim whose lease expired
+(the dispatcher died) is picked up again by the next claim_batch.
+
+import into other python files like
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.outbox import enqueue, claim_batch, complete_batch, release_batch
+"""
+
+import os
+import sys
+import socket
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.database_cmds import create_session, escape_value, MYSQL_DATABASE, TABLE_NAME
+from database.pipeline_state import Stage, Status
+from utils.metrics import execute_sql
+
+OUTBOX_TABLE = "notification_outbox"
+MAX_ATTEMPTS = 5
+
+# channel -> rows of papers_and_code that need a notification on that channel
+ENQUEUE_CONDITIONS = {
+    "tweet": "pushed_to_fork = TRUE AND tweet_posted = FALSE AND github_fork_url IS NOT NULL",
+    "email": "pushed_to_fork = TRUE AND github_fork_url IS NOT NULL AND contributors LIKE '%@%'",
+}
+
+# channel -> papers_and_code columns set when a notification is done, {result} is the sender's result
+COMPLETE_COLUMNS = {
+    "tweet": {"tweet_posted": "TRUE", "tweet_url": "{result}",
+              "stage": str(int(Stage.NOTIFY)), "status": str(int(Status.OK))},
+    "email": {},
+}
+
+
+def default_owner() -> str:
+    # lease owner name, unique per dispatcher process
+    return f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+
+def create_outbox_table(db_name: str = MYSQL_DATABASE) -> bool:
+    """
+    same table as db/mysql-init/01-notification_outbox.sql, for databases created with database_cmds.py
+    """
+    session, _ = create_session(db_name)
+    create_table_cmd = f"""
+    CREATE TABLE IF NOT EXISTS {OUTBOX_TABLE} (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        repo_id INT NOT NULL,
+        channel VARCHAR(32) NOT NULL,
+
+        status VARCHAR(16) NOT NULL DEFAULT 'pending',
+        attempts INT NOT NULL DEFAULT 0,
+        lease_owner VARCHAR(64) DEFAULT NULL,
+        lease_expires DATETIME DEFAULT NULL,
+        result VARCHAR(255) DEFAULT NULL,
+        last_error VARCHAR(255) DEFAULT NULL,
+
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+        UNIQUE KEY uq_outbox_repo_channel (repo_id, channel),
+        KEY idx_outbox_claim (channel, status, lease_expires, id),
+        CONSTRAINT fk_outbox_repo FOREIGN KEY (repo_id) REFERENCES {TABLE_NAME} (id) ON DELETE CASCADE
+    );"""
+    try:
+        session.sql(create_table_cmd).execute()
+        print(f"Table {OUTBOX_TABLE} created successfully.")
+        return True
+    except Exception as e:
+        print(f"Error creating table: {str(e)}")
+        return False
+    finally:
+        session.close()
+
+
+def enqueue(session, channel: str, repo_id: int = None) -> int:
+    """
+    queue every repo (or only repo_id) that needs a notification on channel and is not queued yet
+    returns the number of new outbox rows
+    """
+    insert_cmd = f"""
+    INSERT IGNORE INTO {OUTBOX_TABLE} (repo_id, channel)
+    SELECT id, {escape_value(channel)}
+    FROM {TABLE_NAME}
+    WHERE ({ENQUEUE_CONDITIONS[channel]}) AND deleted_at IS NULL"""
+    if repo_id is not None:
+        insert_cmd += f" AND id = {int(repo_id)}"
+    result = execute_sql(session, insert_cmd)
+    session.commit()
+    return result.get_affected_items_count()
+
+
+def claim_batch(session, channel: str, owner: str, limit: int = 20, lease_seconds: int = 600,
+                repo_id: int = None) -> list:
+    """
+    atomically claim up to limit pending (or lease-expired) notifications, only repo_id's when given
+    returns dicts with outbox_id, repo_id, github_url, github_fork_url, contributors
+    """
+    repo_filter = f"AND o.repo_id = {int(repo_id)}" if repo_id is not None else ""
+    select_cmd = f"""
+    SELECT o.id, o.repo_id, p.github_url, p.github_fork_url, p.contributors
+    FROM {OUTBOX_TABLE} o
+    JOIN {TABLE_NAME} p ON p.id = o.repo_id
+    WHERE o.channel = {escape_value(channel)} {repo_filter}
+        AND (o.status = 'pending' OR (o.status = 'claimed' AND o.lease_expires < NOW()))
+    ORDER BY o.id
+    LIMIT {int(limit)}
+    FOR UPDATE OF o SKIP LOCKED"""
+
+    session.start_transaction()
+    try:
+        rows = execute_sql(session, select_cmd).fetch_all()
+        if rows:
+            ids = ", ".join(str(row[0]) for row in rows)
+            session.sql(f"""
+            UPDATE {OUTBOX_TABLE}
+            SET status = 'claimed', lease_owner = {escape_value(owner)},
+                lease_expires = NOW() + INTERVAL {int(lease_seconds)} SECOND, attempts = attempts + 1
+            WHERE id IN ({ids})""").execute()
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    keys = ("outbox_id", "repo_id", "github_url", "github_fork_url", "contributors")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def complete_batch(session, channel: str, owner: str, results) -> int:
+    """
+    results: (outbox_id, repo_id, result) of notifications that went out
+    marks them done and sets the channel's status columns of papers_and_code, in one transaction
+    only rows still leased by owner are completed, and the status updates are idempotent
+    """
+    results = list(results)
+    if not results:
+        return 0
+    outbox_ids = ", ".join(str(outbox_id) for outbox_id, _, _ in results)
+    result_cases = " ".join(f"WHEN {outbox_id} THEN {escape_value(result)}" for outbox_id, _, result in results)
+    outbox_cmd = f"""
+    UPDATE {OUTBOX_TABLE}
+    SET status = 'done', result = CASE id {result_cases} END, lease_expires = NULL, last_error = NULL
+    WHERE id IN ({outbox_ids}) AND lease_owner = {escape_value(owner)}"""
+
+    assignments = []
+    for column, value in COMPLETE_COLUMNS[channel].items():
+        if value == "{result}":
+            cases = " ".join(f"WHEN {repo_id} THEN {escape_value(result)}" for _, repo_id, result in results)
+            assignments.append(f"{column} = CASE id {cases} END")
+        else:
+            assignments.append(f"{column} = {value}")
+
+    session.start_transaction()
+    try:
+        execute_sql(session, outbox_cmd)
+        if assignments:
+            repo_ids = ", ".join(str(repo_id) for _, repo_id, _ in results)
+            execute_sql(session, f"""
+            UPDATE {TABLE_NAME}
+            SET {', '.join(assignments)}
+            WHERE id IN ({repo_ids})""")
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return len(results)
+
+
+def release_batch(session, owner: str, failures, retry: bool = True, count_attempt: bool = True) -> int:
+    """
+    failures: (outbox_id, error message) of notifications that did not go out
+    retry puts them back to pending (until MAX_ATTEMPTS), otherwise they are marked failed
+    count_attempt=False gives back the attempt of the claim (rate limited, nothing was tried)
+    """
+    failures = list(failures)
+    if not failures:
+        return 0
+    outbox_ids = ", ".join(str(outbox_id) for outbox_id, _ in failures)
+    error_cases = " ".join(f"WHEN {outbox_id} THEN {escape_value(str(error)[:255])}" for outbox_id, error in failures)
+    if not count_attempt:
+        status = "'pending', attempts = GREATEST(attempts - 1, 0)"
+    elif retry:
+        status = f"IF(attempts >= {MAX_ATTEMPTS}, 'failed', 'pending')"
+    else:
+        status = "'failed'"
+    execute_sql(session, f"""
+    UPDATE {OUTBOX_TABLE}
+    SET status = {status}, last_error = CASE id {error_cases} END, lease_owner = NULL, lease_expires = NULL
+    WHERE id IN ({outbox_ids}) AND lease_owner = {escape_value(owner)}""")
+    session.commit()
+    return len(failures)
+
+
+def outbox_counts(session) -> dict:
+    rows = session.sql(f"SELECT channel, status, COUNT(*) FROM {OUTBOX_TABLE} GROUP BY channel, status").execute()
+    return {(channel, status): count for channel, status, count in rows.fetch_all()}
+
+
+def peek_batch(session, channel: str, limit: int = 20) -> list:
+    """
+    pending notifications without claiming them (read only, for dry runs)
+    """
+    rows = session.sql(f"""
+    SELECT o.id, o.repo_id, p.github_url, p.github_fork_url, p.contributors
+    FROM {OUTBOX_TABLE} o
+    JOIN {TABLE_NAME} p ON p.id = o.repo_id
+    WHERE o.channel = {escape_value(channel)} AND o.status = 'pending'
+    ORDER BY o.id
+    LIMIT {int(limit)}""").execute().fetch_all()
+    keys = ("outbox_id", "repo_id", "github_url", "github_fork_url", "contributors")
+    return [dict(zip(keys, row)) for row in rows]
@@ -0,0 +1,38 @@
+"""
+Compact pipeline state of a papers_and_code row: stage and status TINYINT columns
+
+stage is the last stage the row reached, status is how that stage went.
+Work-queue queries filter on them through the (stage, status, id) index, e.g. the repos whose build failed:
+
+    WHERE stage = {Stage.BUILD:d} AND status = {Status.FAILED:d} ORDER BY id LIMIT 100
+
+import into other python files like
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.pipeline_state import Stage, Status
+"""
+
+from enum import IntEnum
+
+
+class Stage(IntEnum):
+    FIND = 0        # row inserted from links-between-papers-and-code.json
+    QUALIFY = 1     # dependency file, contributors and commit date fetched from GitHub
+    BUILD = 2       # original dependency file install checked
+    FIX = 3         # fixed dependency file written
+    PUBLISH = 4     # fixed repo pushed to the fork
+    NOTIFY = 5      # owner notified
+
+
+class Status(IntEnum):
+    PENDING = 0
+    RUNNING = 1
+    OK = 2
+    FAILED = 3
+    SKIPPED = 4     # nothing to do, e.g. no dependency file found
+
+
+def state_sql(stage: Stage, status: Status) -> str:
+    # SET clause fragment
+    return f"stage = {int(stage)}, status = {int(status)}"
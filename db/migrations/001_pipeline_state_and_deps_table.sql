@@ -0,0 +1,44 @@
+-- pipeline state columns, work-queue indexes and dependency file contents moved to a side table
+-- stage/status values: database/pipeline_state.py
+-- apply with: (venv) python3 database/migrate.py
+
+ALTER TABLE papers_and_code
+    ADD COLUMN stage TINYINT UNSIGNED NOT NULL DEFAULT 0,
+    ADD COLUMN status TINYINT UNSIGNED NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS papers_and_code_deps (
+    id INT PRIMARY KEY,
+    deps_file_content_orig MEDIUMTEXT,
+    deps_file_content_edited MEDIUMTEXT,
+    CONSTRAINT fk_deps_repo FOREIGN KEY (id) REFERENCES papers_and_code (id) ON DELETE CASCADE
+);
+
+INSERT INTO papers_and_code_deps (id, deps_file_content_orig, deps_file_content_edited)
+SELECT id, deps_file_content_orig, deps_file_content_edited
+FROM papers_and_code
+WHERE deps_file_content_orig IS NOT NULL OR deps_file_content_edited IS NOT NULL;
+
+-- backfill, later stages win: QUALIFY=1 BUILD=2 FIX=3 PUBLISH=4 NOTIFY=5 / OK=2 FAILED=3 SKIPPED=4
+UPDATE papers_and_code SET stage = 1, status = IF(build_sys_type = 'Not found', 4, 2)
+WHERE build_sys_type IS NOT NULL;
+
+UPDATE papers_and_code SET stage = 2, status = IF(build_status_orig IN ('Success', 'No requirements found'), 2, 3)
+WHERE build_status_orig IS NOT NULL;
+
+UPDATE papers_and_code SET stage = 3, status = 2
+WHERE deps_file_content_edited IS NOT NULL;
+
+UPDATE papers_and_code SET stage = 4, status = 2
+WHERE pushed_to_fork = TRUE;
+
+UPDATE papers_and_code SET stage = 5, status = 2
+WHERE tweet_posted = TRUE;
+
+ALTER TABLE papers_and_code
+    DROP COLUMN deps_file_content_orig,
+    DROP COLUMN deps_file_content_edited,
+    ADD INDEX idx_stage_status (stage, status, id),
+    ADD INDEX idx_build_sys_type (build_sys_type(16), id),
+    ADD INDEX idx_build_status_orig (build_status_orig(32), id),
+    ADD INDEX idx_publish (pushed_to_fork, tweet_posted, id),
+    ADD INDEX idx_pull_request (pushed_to_fork, pull_request_made, id);
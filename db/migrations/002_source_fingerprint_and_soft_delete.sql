@@ -0,0 +1,8 @@
+-- delta sync of a refreshed links-between-papers-and-code.json (database/delta_sync.py)
+-- source_fingerprint: md5 of the canonical paper fields the row was loaded from, unchanged records are skipped
+-- deleted_at: set when the record left the dump, soft-deleted rows are left out of every work queue
+-- apply with: (venv) python3 database/migrate.py
+
+ALTER TABLE papers_and_code
+    ADD COLUMN source_fingerprint CHAR(32) DEFAULT NULL,
+    ADD COLUMN deleted_at DATETIME DEFAULT NULL;
@@ -0,0 +1,14 @@
+-- reverse dependency index: package (PEP 503 normalized) -> repos, see database/dependency_index.py
+-- kept up to date when dependency files are fetched, index the files fetched before this migration with:
+-- (venv) python3 database/dependency_index.py --rebuild
+-- apply with: (venv) python3 database/migrate.py
+
+CREATE TABLE IF NOT EXISTS papers_and_code_dependents (
+    package VARCHAR(255) NOT NULL,
+    repo_id INT NOT NULL,
+    specifier VARCHAR(255) NOT NULL DEFAULT '',
+    pinned_version VARCHAR(64) DEFAULT NULL,
+    PRIMARY KEY (package, repo_id),
+    INDEX idx_dependents_repo (repo_id),
+    CONSTRAINT fk_dependents_repo FOREIGN KEY (repo_id) REFERENCES papers_and_code (id) ON DELETE CASCADE
+);
@@ -13,11 +13,9 @@ CREATE TABLE IF NOT EXISTS papers_and_code (
     contributors VARCHAR(255) DEFAULT NULL,
     build_sys_type VARCHAR(255) DEFAULT NULL,
     deps_file_url VARCHAR(255) DEFAULT NULL UNIQUE,
-    deps_file_content_orig MEDIUMTEXT,
     deps_last_commit_date DATE DEFAULT NULL,
 
     build_status_orig VARCHAR(255) DEFAULT NULL,
-    deps_file_content_edited MEDIUMTEXT,
     build_status_edited VARCHAR(255) DEFAULT NULL,
     datetime_latest_build DATETIME DEFAULT NULL,
     num_build_attempts INT DEFAULT 0,
@@ -27,5 +25,48 @@ CREATE TABLE IF NOT EXISTS papers_and_code (
     pushed_to_fork BOOLEAN DEFAULT FALSE,
     pull_request_made BOOLEAN DEFAULT FALSE,
     tweet_posted BOOLEAN DEFAULT FALSE,
-    tweet_url VARCHAR(255) DEFAULT NULL UNIQUE
-);
\ No newline at end of file
+    tweet_url VARCHAR(255) DEFAULT NULL UNIQUE,
+
+    -- pipeline state, see database/pipeline_state.py
+    stage TINYINT UNSIGNED NOT NULL DEFAULT 0,
+    status TINYINT UNSIGNED NOT NULL DEFAULT 0,
+
+    -- delta sync of the dump, see database/delta_sync.py
+    source_fingerprint CHAR(32) DEFAULT NULL,
+    deleted_at DATETIME DEFAULT NULL,
+
+    INDEX idx_stage_status (stage, status, id),
+    INDEX idx_build_sys_type (build_sys_type(16), id),
+    INDEX idx_build_status_orig (build_status_orig(32), id),
+    INDEX idx_publish (pushed_to_fork, tweet_posted, id),
+    INDEX idx_pull_request (pushed_to_fork, pull_request_made, id)
+);
+
+-- dependency file contents, kept out of papers_and_code so work-queue scans never touch blob pages
+CREATE TABLE IF NOT EXISTS papers_and_code_deps (
+    id INT PRIMARY KEY,
+    deps_file_content_orig MEDIUMTEXT,
+    deps_file_content_edited MEDIUMTEXT,
+    CONSTRAINT fk_deps_repo FOREIGN KEY (id) REFERENCES papers_and_code (id) ON DELETE CASCADE
+);
+
+-- reverse dependency index: package (PEP 503 normalized) -> repos, see database/dependency_index.py
+CREATE TABLE IF NOT EXISTS papers_and_code_dependents (
+    package VARCHAR(255) NOT NULL,
+    repo_id INT NOT NULL,
+    specifier VARCHAR(255) NOT NULL DEFAULT '',
+    pinned_version VARCHAR(64) DEFAULT NULL,
+    PRIMARY KEY (package, repo_id),
+    INDEX idx_dependents_repo (repo_id),
+    CONSTRAINT fk_dependents_repo FOREIGN KEY (repo_id) REFERENCES papers_and_code (id) ON DELETE CASCADE
+);
+
+-- this layout already includes every migration in db/migrations (database/migrate.py)
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(255) PRIMARY KEY,
+    applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+INSERT IGNORE INTO schema_migrations (version) VALUES
+    ('001_pipeline_state_and_deps_table.sql'),
+    ('002_source_fingerprint_and_soft_delete.sql'),
+    ('003_package_dependents.sql');
\ No newline at end of file
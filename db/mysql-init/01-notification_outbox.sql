@@ -0,0 +1,23 @@
+USE grimrepor_db;
+
+-- one row per (repo, channel) notification, claimed by dispatchers with a lease
+-- see database/outbox.py
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    repo_id INT NOT NULL,
+    channel VARCHAR(32) NOT NULL,
+
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    lease_owner VARCHAR(64) DEFAULT NULL,
+    lease_expires DATETIME DEFAULT NULL,
+    result VARCHAR(255) DEFAULT NULL,
+    last_error VARCHAR(255) DEFAULT NULL,
+
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+    UNIQUE KEY uq_outbox_repo_channel (repo_id, channel),
+    KEY idx_outbox_claim (channel, status, lease_expires, id),
+    CONSTRAINT fk_outbox_repo FOREIGN KEY (repo_id) REFERENCES papers_and_code (id) ON DELETE CASCADE
+);
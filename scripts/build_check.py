@@ -1,8 +1,9 @@
 import os
 import sys
+import re
+import csv
 import subprocess
 import requests
-import pandas as pd
 from multiprocessing import Pool
 import tempfile
 from tqdm import tqdm
@@ -10,13 +11,31 @@ import yaml
 import glob
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from utils.csv_io import read_csv_cached
+from utils.repo_store import RepoStore
+from utils.metrics import instrument, http_get
 
+# set in each worker by init_worker when --use-store is given, files are then read from the local mirror
+REPO_STORE = None
+NO_MATCHING_DISTRIBUTION = re.compile(r"No matching distribution found for (\S+)")
+
+
+def init_worker(use_store=False):
+    global REPO_STORE
+    REPO_STORE = RepoStore() if use_store else None
 
 def fetch_file(repo_url, file_name, branches=["main", "master"]):
+    if REPO_STORE is not None:
+        # HEAD of the mirror is the default branch, whatever it is called
+        try:
+            return REPO_STORE.read_file(repo_url, file_name)
+        except subprocess.CalledProcessError:
+            return None
     for branch in branches:
         try:
             raw_url = f"{repo_url.replace('github.com', 'raw.githubusercontent.com')}/{branch}/{file_name}"
-            response = requests.get(raw_url)
+            response = http_get(raw_url)
             response.raise_for_status()
             return response.text
         except requests.RequestException:
@@ -50,22 +69,28 @@ def parse_conda_env(conda_content):
 def install_requirements(requirements_content):
     try:
         with tempfile.TemporaryDirectory() as env_dir:
-            subprocess.run(["python3", "-m", "venv", env_dir], check=True)
+            with instrument("venv_create"):
+                subprocess.run(["python3", "-m", "venv", env_dir], check=True)
             pip_executable = os.path.join(env_dir, "bin", "pip") if os.name != 'nt' else os.path.join(env_dir, "Scripts", "pip")
 
             with tempfile.NamedTemporaryFile(delete=False, mode='w') as temp_req_file:
                 temp_req_file.write(requirements_content)
                 temp_req_file.flush()
 
-                result = subprocess.run([pip_executable, "install", "-r", temp_req_file.name], capture_output=True, text=True)
+                with instrument("pip_install") as timer:
+                    result = subprocess.run([pip_executable, "install", "-r", temp_req_file.name], capture_output=True, text=True)
+                    timer.labels["result"] = "ok" if result.returncode == 0 else "failed"
 
                 if result.returncode != 0:
-                    return False, result.stderr
+                    # pip names the requirement it was working on in stdout only, keep it with the error
+                    collecting = [line for line in result.stdout.splitlines() if line.startswith("Collecting ")]
+                    return False, "\n".join(collecting[-1:] + [result.stderr])
                 return True, None
     except Exception as e:
         return False, str(e)
 
-def check_repo(repo):
+def fetch_requirements(repo):
+    # pip requirements of a GitHub repo: requirements.txt, else setup.py, else environment.yml
     requirements = fetch_file(repo, "requirements.txt")
     if not requirements:
         setup_py = fetch_file(repo, "setup.py")
@@ -75,24 +100,104 @@ def check_repo(repo):
             conda_env = fetch_file(repo, "environment.yml") or fetch_file(repo, "environment.yaml")
             if conda_env:
                 requirements = parse_conda_env(conda_env)
+    return requirements
 
+def check_repo(repo):
+    return repo, build_status(fetch_requirements(repo))
+
+def build_status(requirements):
+    # install the requirements in a fresh venv, returns the build_status_orig value
     if not requirements:
-        return repo, "No requirements found"
+        return "No requirements found"
 
     success, error = install_requirements(requirements)
     if success:
-        return repo, "Success"
-    else:
-        # Parse error message
-        if "No matching distribution found" in error:
-            return repo, "No matching distribution found"
-        else:
-            return repo, f"Failed: {error}"
+        return "Success"
+    return failure_status(error)
+
+def failure_status(error):
+    # Parse error message, the requirement pip could not find is kept (scripts/failure_clusters.py groups by it)
+    if "No matching distribution found" in error:
+        match = NO_MATCHING_DISTRIBUTION.search(error)
+        return f"No matching distribution found for {match.group(1)}" if match else "No matching distribution found"
+    return f"Failed: {error}"
+
+def iter_check_repos(repos, total=None, use_store=False):
+    # yields (repo, status) as each check finishes so results can be written out while the pool keeps running
+    with Pool(processes=10, initializer=init_worker, initargs=(use_store,)) as pool:
+        yield from tqdm(pool.imap(check_repo, repos), total=total, desc="Processing Repositories")
+        # closed and joined instead of terminated, so the workers' metrics finalizer runs (utils/metrics.py)
+        pool.close()
+        pool.join()
 
 def check_repos(repos):
-    with Pool(processes=10) as pool:
-        results = list(tqdm(pool.imap(check_repo, repos), total=len(repos), desc="Processing Repositories"))
-    return dict(results)
+    return dict(iter_check_repos(repos, total=len(repos)))
+
+def write_results(results, output_file):
+    # stream (file_or_repo, status) rows to the results CSV
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["file_or_repo", "status"])
+        for row in results:
+            writer.writerow(row)
+            f.flush()
+
+def check_dependency_file(item):
+    # (id, github_url, build status) of a dependency file already stored in the database
+    repo_id, github_url, build_sys_type, content = item
+    if build_sys_type == "conda":
+        content = parse_conda_env(content)
+    return repo_id, github_url, build_status(content)
+
+def recheck_affected(package_arg, output_file):
+    """
+    re-run the build check of only the repos a release (or yank) of package==version can affect,
+    found through the reverse dependency index (database/dependency_index.py)
+    build_status_orig is updated, the pipeline state only for repos still at stage BUILD
+    """
+    from database.database_cmds import Table, create_session, escape_value, MYSQL_DATABASE, TABLE_NAME
+    from database.dependency_index import dependents, parse_package_arg
+    from database.pipeline_state import Stage, Status
+    from utils.metrics import execute_sql
+    package, version = parse_package_arg(package_arg)
+    table = Table(TABLE_NAME, MYSQL_DATABASE)
+    affected = dependents(package, version, table)
+    print(f"{len(affected)} repos affected by {package_arg}")
+    if not affected:
+        return
+
+    session, _ = create_session(table.db_name)
+    try:
+        ids = ", ".join(str(int(row["id"])) for row in affected)
+        rows = session.sql(f"""
+        SELECT t.id, t.github_url, t.build_sys_type, d.deps_file_content_orig
+        FROM {table.table_name} t JOIN {table.deps_table_name} d ON d.id = t.id
+        WHERE t.id IN ({ids})""").execute().fetch_all()
+        # plain tuples, they are pickled to the workers
+        items = [(row[0], row[1], row[2], row[3]) for row in rows]
+
+        failed = 0
+        with open(output_file, 'w', newline='') as f, Pool(processes=10) as pool:
+            writer = csv.writer(f)
+            writer.writerow(["file_or_repo", "status"])
+            for repo_id, github_url, status in tqdm(pool.imap_unordered(check_dependency_file, items),
+                                                    total=len(items), desc=f"Re-checking {package_arg}"):
+                writer.writerow([github_url, status])
+                ok = status in ("Success", "No requirements found")
+                failed += not ok
+                new_status = int(Status.OK if ok else Status.FAILED)
+                execute_sql(session, f"""
+                UPDATE {table.table_name}
+                SET build_status_orig = {escape_value(status[:255])}, datetime_latest_build = NOW(),
+                    num_build_attempts = num_build_attempts + 1,
+                    status = IF(stage = {int(Stage.BUILD)}, {new_status}, status)
+                WHERE id = {int(repo_id)}""")
+            # closed and joined instead of terminated, so the workers' metrics finalizer runs (utils/metrics.py)
+            pool.close()
+            pool.join()
+        print(f"{failed} of {len(items)} affected repos fail to build, results in {output_file}")
+    finally:
+        session.close()
 
 def check_local_requirements(requirements_files):
     results = {}
@@ -105,17 +210,20 @@ def check_local_requirements(requirements_files):
             if success:
                 results[req_file] = "Success"
             else:
-                if "No matching distribution found" in error:
-                    results[req_file] = "No matching distribution found"
-                else:
-                    results[req_file] = f"Failed: {error}"
+                results[req_file] = failure_status(error)
         except Exception as e:
             results[req_file] = f"Error reading file: {str(e)}"
 
     return results
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1 and sys.argv[1] == "--local":
+    output_file = os.path.join(ROOT, "output", "build_check_results.csv")
+    use_store = "--use-store" in sys.argv
+    if "--affected" in sys.argv:
+        # re-check only the repos depending on a package (version), e.g. --affected numpy==2.0.0
+        recheck_affected(sys.argv[sys.argv.index("--affected") + 1],
+                         os.path.join(ROOT, "output", "build_check_affected.csv"))
+    elif len(sys.argv) > 1 and sys.argv[1] == "--local":
         # Check local requirements files
         # FIXME: Replace with the actual path to the requirements files
         # git ls-files | grep requirements.txt
@@ -123,16 +231,11 @@ if __name__ == "__main__":
         # os.path.walk ...
         requirements_files = glob.glob("path/to/requirements/*.txt")
         results = check_local_requirements(requirements_files)
+        write_results(results.items(), output_file)
     else:
         # Check GitHub repositories
+        # only the repo_url column is needed, read through the columnar cache when pyarrow is available
         filepath = os.path.join(ROOT, "data", "paper_repo_info.csv")
-        df = pd.read_csv(filepath)
-        repos = df["repo_url"].tolist()
-        results = check_repos(repos)
-
-    # Create a DataFrame with the results
-    results_df = pd.DataFrame(list(results.items()), columns=["file_or_repo", "status"])
-
-    # Write results to a CSV file
-    output_file = os.path.join(ROOT, "output", "build_check_results.csv")
-    results_df.to_csv(output_file, index=False)
+        repos = read_csv_cached(filepath, columns=["repo_url"])["repo_url"].tolist()
+        # results are written as they arrive instead of being collected first
+        write_results(iter_check_repos(repos, total=len(repos), use_store=use_store), output_file)
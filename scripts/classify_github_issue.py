@@ -1,6 +1,6 @@
 import os
-import subprocess
-import pandas as pd
+import re
+import sys
 
 # Assuming df is your DataFrame containing GitHub issues
 # df = pd.read_csv('path_to_your_csv_file.csv')
@@ -18,24 +18,124 @@ keywords = [
     "pip install --no-deps", "pip install --no-binary", "pip install --only-binary"
 ]
 
+# category -> {keyword: weight}, a row belongs to a category when its matched weights reach the threshold
+# every keyword counts fully towards version_issue, which is the original any-keyword-matches rule
+categories = {
+    'version_issue': {keyword: 1.0 for keyword in keywords},
+}
+thresholds = {
+    'version_issue': 1.0,
+}
 
-def classify_issues(df):
-    def check_issue(row):
-        title = str(row['title']).lower()
-        body = str(row['body']).lower()
-        for keyword in keywords:
-            if keyword in title or keyword in body:
-                return True
-        return False
 
-    df['is_version_issue'] = df.apply(check_issue, axis=1)
+def trie_pattern(words):
+    """
+    Compile a set of literal keywords into one regex shaped like a trie,
+    e.g. ['pip install', 'pip issue'] -> 'pip\\ i(?:nstall|ssue)'
+    Shared prefixes are only tried once per text position and optional suffixes are greedy,
+    so the longest keyword at a position wins.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        if len(alternatives) == 1 and '' not in node:
+            return alternatives[0]
+        group = '(?:' + '|'.join(alternatives) + ')'
+        return group + '?' if '' in node else group
+
+    return build(trie)
+
+
+class KeywordClassifier:
+    """
+    Multi-keyword classifier: all keywords are matched in a single pass over each text
+    with one compiled automaton instead of one substring scan per keyword.
+    """
+    def __init__(self, categories=categories, thresholds=thresholds):
+        self.categories = categories
+        self.thresholds = thresholds
+        self.keywords = sorted({keyword for weights in categories.values() for keyword in weights})
+        # the trie inside a lookahead matches at every text position without consuming the text, so overlapping
+        # keywords are all found: 'requires version conflict' -> 'requires version', 'version conflict'
+        self.pattern = re.compile(f"(?=({trie_pattern(self.keywords)}))")
+        # only the longest keyword starting at a position is returned, a match of 'pip install --upgrade'
+        # also means 'pip install' occurred
+        self.contained = {
+            keyword: tuple(other for other in self.keywords if other != keyword and other in keyword)
+            for keyword in self.keywords
+        }
+
+    def expand(self, found):
+        matched = set(found)
+        for keyword in found:
+            matched.update(self.contained[keyword])
+        return sorted(matched)
+
+    def match(self, texts):
+        """
+        texts: Series of lowercase strings
+        returns a Series of sorted keyword lists
+        """
+        return texts.str.findall(self.pattern).map(self.expand)
+
+    def classify(self, df, text_columns=('title', 'body')):
+        # lowercase text of every column, joined so no keyword can span two columns (missing values match nothing)
+        texts = df[text_columns[0]].fillna('').astype(str).str.lower()
+        for column in text_columns[1:]:
+            texts = texts + '\n' + df[column].fillna('').astype(str).str.lower()
+
+        import pandas as pd
+        matched = self.match(texts)
+        result = pd.DataFrame(index=df.index)
+        result['matched_keywords'] = matched.map('; '.join)
+        for category, weights in self.categories.items():
+            scores = matched.map(lambda found: sum(weights.get(keyword, 0.0) for keyword in found))
+            result[f'{category}_score'] = scores
+            result[f'is_{category}'] = scores >= self.thresholds.get(category, 1.0)
+        return result
+
+
+def classify_issues(df, classifier=None):
+    classifier = classifier or KeywordClassifier()
+    result = classifier.classify(df)
+    for column in result.columns:
+        df[column] = result[column]
     return df
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from utils.csv_io import iter_csv, CsvAppender
+
+
+def classify_file(input_file, output_file, chunksize=5000):
+    """
+    Stream the issues CSV in chunks and write only the classification as a side file:
+    'row' is the row number in input_file (plus repo/number when the harvester wrote them), so the
+    issues themselves are never copied and memory is bounded by the chunk size.
+    """
+    classifier = KeywordClassifier()
+    writer = CsvAppender(output_file)
+    num_flagged = 0
+    for chunk in iter_csv(input_file, chunksize=chunksize):
+        result = classifier.classify(chunk)
+        for column in ('number', 'repo'):
+            if column in chunk.columns:
+                result.insert(0, column, chunk[column])
+        result.insert(0, 'row', chunk.index)
+        writer.write(result)
+        num_flagged += int(result['is_version_issue'].sum())
+    print(f"Classified {writer.rows_written} issues, {num_flagged} version issues -> {output_file}")
+    return writer.rows_written, num_flagged
 
-file_issues = os.path.join(ROOT, "output", "issues.csv")
-df  = pd.read_csv(file_issues)
-df = classify_issues(df)
-output_file = os.path.join(ROOT, "output", "issues_classified.csv")
-df.to_csv(output_file, index=False)
-print(df[['title', 'is_version_issue']])
+if __name__ == "__main__":
+    file_issues = os.path.join(ROOT, "output", "issues.csv")
+    output_file = os.path.join(ROOT, "output", "issues_classified.csv")
+    classify_file(file_issues, output_file)
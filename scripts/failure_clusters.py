@@ -0,0 +1,439 @@
+"""
+Cluster failed builds by failure signature and compute one fix per cluster
+
+Most failed builds share their root cause with many others (the same unavailable tensorflow==1.x pin, the deprecated
+sklearn package, a conda pin in a pip file), so instead of one PyPI lookup and one GPT call per repo like
+process_errors.py, every failure is reduced to a signature
+
+    (error class, offending requirement, python version)     e.g. ("no_matching_distribution", "tensorflow==1.4.0", "3.12")
+
+the repos are grouped by it, a candidate fix (a replacement line for the offending requirement, or dropping it) is
+computed once per cluster and applied to every member, and each member is verified with a resolve-only pip run
+(pip install --dry-run, nothing is built into a venv). PyPI and LLM work scales with the number of distinct problems.
+A bad pin is repaired by searching the package's release timeline around the commit date for the nearest release
+that resolves with the rest of the file (smart_package_versioning/pin_repair.py, probes are memoized across repos).
+
+Members that still fail after the fix get the signature of their next problem and go into the next round, so a repo
+with several bad requirements is repaired one cluster at a time.
+
+The failure text is the build_status_orig of the row (or the status column of build_check_results.csv). When it does
+not name the offending requirement (build_status_orig is cut at 255 characters) the dependency file is resolved once
+to get pip's full error. The python version is read from the error (lib/pythonX.Y paths), --python otherwise;
+resolves for another version than the one running this script are binary-only (pip --python-version).
+
+Verified fixes are written like batch_fix_dependencies.py does (deps_file_content_edited, stage FIX), the clusters
+go to output/failure_clusters.csv and the outcome per repo to output/failure_cluster_fixes.csv.
+
+Usage:
+    (venv) python3 scripts/failure_clusters.py                   # failed builds of papers_and_code
+    (venv) python3 scripts/failure_clusters.py --csv output/build_check_results.csv --dry-run
+    (venv) python3 scripts/failure_clusters.py --llm             # ask GPT for clusters without a rule based fix
+"""
+
+import os
+import re
+import sys
+import csv
+import argparse
+from collections import namedtuple
+from functools import lru_cache
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.dependency_index import normalize_name, CONDA_PIN
+from smart_package_versioning.pin_repair import PinRepairer, pip_resolve, HOST_PYTHON
+from utils.metrics import instrument
+
+CLUSTERS_FILE = os.path.join(ROOT, "output", "failure_clusters.csv")
+FIXES_FILE = os.path.join(ROOT, "output", "failure_cluster_fixes.csv")
+BUILD_OK = ("Success", "No requirements found")
+
+MAX_ROUNDS = 3
+# error classes fixed by repairing the pin of the offending requirement
+PIN_REPAIR_CLASSES = ("no_matching_distribution", "unsupported_wheel", "build_failed", "conflict")
+
+Signature = namedtuple("Signature", "error_class requirement python_version")
+Fix = namedtuple("Fix", "replacement source")
+
+# error class and the pattern naming the offending requirement (None: it is found by another pattern), first match wins
+ERROR_CLASSES = [
+    ("deprecated_package", re.compile(r"The '([^']+)' PyPI package is deprecated")),
+    ("invalid_requirement", re.compile(r"Invalid requirement: '([^']*)'")),
+    ("unsupported_wheel", re.compile(r"(\S+\.whl) is not a supported wheel")),
+    ("no_matching_distribution", re.compile(
+        r"Could not find a version that satisfies the requirement (\S+)|No matching distribution found(?: for (\S+))?")),
+    ("conflict", re.compile(r"ResolutionImpossible|conflicting dependencies")),
+    ("build_failed", re.compile(r"subprocess-exited-with-error|metadata-generation-failed|Failed to build|"
+                                r"Could not build wheels")),
+    ("pip_error", re.compile(r"ERROR: Exception:")),
+]
+# build_check.install_requirements puts pip's last "Collecting X" line in front of the error
+COLLECTING = re.compile(r"^Collecting (\S+)", re.MULTILINE)
+USER_REQUESTED = re.compile(r"The user requested (\S+)")
+FAILED_BUILDING = re.compile(r"Failed (?:building wheel for|to build) (\S+)")
+PYTHON_IN_PATH = re.compile(r"python(\d\.\d+)[/\\]")
+PACKAGE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._\-]*")
+
+###########################
+# SIGNATURES
+###########################
+
+def normalize_requirement(raw):
+    """
+    offending requirement in one spelling: normalized name (PEP 503) and specifier, a wheel file becomes name==version
+    """
+    from packaging.requirements import Requirement, InvalidRequirement
+    raw = raw.strip().strip("'\"").rstrip(".,;:)")
+    if raw.endswith(".whl"):
+        name, version = os.path.basename(raw).split("-")[:2]
+        return f"{normalize_name(name)}=={version}"
+    try:
+        requirement = Requirement(raw)
+    except InvalidRequirement:
+        return raw
+    return f"{normalize_name(requirement.name)}{requirement.specifier}"
+
+
+def line_package(line):
+    # normalized package a requirements line installs, None for options, comments and unreadable lines
+    from packaging.requirements import Requirement, InvalidRequirement
+    line = line.split(" #")[0].strip()
+    if not line or line.startswith(("#", "-")):
+        return None
+    if line.endswith(".whl"):
+        return normalize_name(os.path.basename(line).split("-")[0])
+    try:
+        return normalize_name(Requirement(line).name)
+    except InvalidRequirement:
+        return None
+
+
+def signature(error, default_python=HOST_PYTHON):
+    python = PYTHON_IN_PATH.search(error)
+    python_version = python.group(1) if python else default_python
+    for error_class, pattern in ERROR_CLASSES:
+        match = pattern.search(error)
+        if not match:
+            continue
+        offending = next((group for group in match.groups() if group), None)
+        if error_class == "conflict":
+            offending = (USER_REQUESTED.search(error) or [None, None])[1]
+        elif error_class in ("build_failed", "pip_error"):
+            offending = (COLLECTING.search(error) or FAILED_BUILDING.search(error) or [None, None])[1]
+        if offending is not None and error_class != "invalid_requirement":
+            offending = normalize_requirement(offending)
+        return Signature(error_class, offending, python_version)
+    return Signature("other", None, python_version)
+
+###########################
+# RESOLVE CHECK
+###########################
+
+@lru_cache(maxsize=None)
+def resolve_check(content, python_version=HOST_PYTHON):
+    """
+    (True, None) when pip can resolve the requirements for python_version, (False, pip's error) otherwise
+    identical requirement sets are resolved once per run
+    """
+    return pip_resolve(content, python_version)
+
+###########################
+# FIXES
+###########################
+
+@lru_cache(maxsize=None)
+def repairer():
+    return PinRepairer()
+
+
+@lru_cache(maxsize=None)
+def pypi_releases(package):
+    """
+    installable releases of package, oldest first: [(Version, upload date, requires_python)]
+    from the version solver's metadata store, packages it does not hold are fetched from PyPI once per run (and not
+    saved), empty when PyPI does not know the package either
+    """
+    store = repairer().store
+    if package not in store and not store.update_from_pypi(package, with_dependencies=False):
+        return []
+    return store.releases(package)
+
+
+def pinned_version(requirement):
+    from packaging.requirements import Requirement, InvalidRequirement
+    try:
+        specifiers = list(Requirement(requirement).specifier)
+    except InvalidRequirement:
+        return None
+    if len(specifiers) == 1 and specifiers[0].operator in ("==", "===") and "*" not in specifiers[0].version:
+        return specifiers[0].version
+    return None
+
+
+def fix_invalid_requirement(raw):
+    # conda's name=version[=build] becomes name==version when PyPI has the package, conda-only packages are dropped
+    pin = CONDA_PIN.match(raw)
+    if pin:
+        package = normalize_name(pin.group(1))
+        return Fix(f"{package}=={pin.group(2)}" if pypi_releases(package) else "", "conda pin")
+    # a stray character after the name ("scipy]", "torch torchvision"), else a path or option pip cannot read
+    name = PACKAGE_NAME.match(raw.strip())
+    if name and pypi_releases(normalize_name(name.group(0))):
+        return Fix(normalize_name(name.group(0)), "package name")
+    return Fix("", "dropped")
+
+
+@lru_cache(maxsize=None)
+def replacement_model():
+    from pydantic import BaseModel
+
+    class Replacement(BaseModel):
+        requirement: str
+    return Replacement
+
+
+@instrument("llm_request", model="gpt-4", caller="failure_clusters")
+def llm_fix(sig, error):
+    from scripts.process_errors import get_client
+    prompt = f"""
+    A pip requirements file fails to install on python {sig.python_version} ({sig.error_class}) because of the
+    requirement "{sig.requirement}". The end of pip's error output is:
+
+    {error[-1500:]}
+
+    Reply with the single requirement line that should replace "{sig.requirement}" so the file installs on python
+    {sig.python_version}, keeping the package and a version as close to the original as possible. Reply with an
+    empty string if the line should be removed.
+    """
+    response = get_client().chat.completions.create(
+        model="gpt-4",
+        messages=[{"role": "user", "content": prompt}],
+        response_model=replacement_model()
+    )
+    return response.requirement.strip()
+
+
+def repair_pin(package, sig, member):
+    """
+    package==x nearest to the broken pin (or the commit date) that resolves with the rest of member's file
+    when no release does (another line of the file is broken too) the nearest release that resolves by itself,
+    the member then carries on with its next problem
+    """
+    rest = [line.split(" #")[0].strip() for line in member["content"].splitlines()
+            if line.split(" #")[0].strip() and not line.strip().startswith("#") and line_package(line) != package]
+    args = (sig.python_version, pinned_version(sig.requirement), member.get("date"))
+    version = repairer().repair(package, rest, *args)
+    if version is None and rest:
+        # mostly cached, the probes of package by itself were run by the first search
+        version = repairer().repair(package, (), *args)
+    return f"{package}=={version}" if version is not None else None
+
+
+def compute_fix(sig, member, use_llm=False):
+    """
+    replacement line of the offending requirement of a cluster ("" drops it), None when there is no candidate
+    member: one failure of the cluster, its file is the rest of the set pins are repaired against
+    """
+    if sig.requirement is None:
+        return Fix(None, "no offending requirement")
+    if sig.error_class == "invalid_requirement":
+        return fix_invalid_requirement(sig.requirement)
+
+    package = line_package(sig.requirement)
+    if sig.error_class == "deprecated_package":
+        from smart_package_versioning.version_solver import IMPORT_TO_DIST
+        renamed = {normalize_name(name): dist for name, dist in IMPORT_TO_DIST.items()}
+        if package in renamed:
+            return Fix(renamed[package], "renamed package")
+    elif sig.error_class in PIN_REPAIR_CLASSES and package:
+        if not pypi_releases(package):
+            return Fix(None, "not on PyPI")
+        repaired = repair_pin(package, sig, member)
+        if repaired:
+            return Fix(repaired, "release timeline")
+
+    if use_llm:
+        try:
+            return Fix(llm_fix(sig, member["status"]), "llm")
+        except Exception as e:
+            print(f"Error asking for a fix of {sig}: {str(e)}")
+    return Fix(None, "no rule")
+
+
+def apply_fix(content, sig, replacement):
+    """
+    content with the offending requirement's lines replaced (replacement "" drops them)
+    None when no line of content is the offending requirement or nothing changes
+    """
+    package = line_package(sig.requirement)
+    lines, changed = [], False
+    for line in content.splitlines():
+        stripped = line.split(" #")[0].strip()
+        offending = stripped == sig.requirement if sig.error_class == "invalid_requirement" else \
+            package is not None and line_package(line) == package
+        if offending and stripped != replacement:
+            changed = True
+            if replacement:
+                lines.append(replacement)
+            continue
+        lines.append(line)
+    return "\n".join(lines) + "\n" if changed else None
+
+###########################
+# CLUSTERING
+###########################
+
+def cluster(failures, default_python=HOST_PYTHON):
+    """
+    {Signature: [failure]} of failures ({"content", "status", ...}), largest clusters first
+    failures whose text does not name the offending requirement are resolved once to get pip's full error
+    """
+    clusters = {}
+    for failure in failures:
+        sig = signature(failure["status"], default_python)
+        if sig.requirement is None:
+            ok, error = resolve_check(failure["content"], sig.python_version)
+            if not ok:
+                failure = {**failure, "status": error}
+                sig = signature(error, sig.python_version)
+        clusters.setdefault(sig, []).append(failure)
+    return dict(sorted(clusters.items(), key=lambda item: -len(item[1])))
+
+
+def repair(failures, default_python=HOST_PYTHON, use_llm=False, rounds=MAX_ROUNDS):
+    """
+    failures: [{"id", "github_url", "content" (pip requirements), "status" (failure text), "date" (of the file)}]
+    returns the verified fixes [{"id", "github_url", "content", "python_version", ...}], the cluster report rows
+    and the failures left, each with the signature it ended on
+    """
+    fixed, report, left = [], [], []
+    pending = failures
+    fixes = {}
+    for round_number in range(1, rounds + 1):
+        next_pending = []
+        for sig, members in cluster(pending, default_python).items():
+            # a signature seen in an earlier round keeps its fix (a member back on it is not changed by it)
+            if sig not in fixes:
+                fixes[sig] = compute_fix(sig, members[0], use_llm)
+            fix = fixes[sig]
+            verified = 0
+            for member in members:
+                member = {**member, "signature": sig}
+                content = apply_fix(member["content"], sig, fix.replacement) if fix.replacement is not None else None
+                if content is None:
+                    left.append(member)
+                    continue
+                ok, error = resolve_check(content, sig.python_version)
+                if ok:
+                    fixed.append({**member, "content": content, "python_version": sig.python_version})
+                    verified += 1
+                else:
+                    # fixed this problem, carries on with its next one
+                    next_pending.append({**member, "content": content, "status": error})
+            report.append({"round": round_number, "error_class": sig.error_class, "requirement": sig.requirement,
+                           "python_version": sig.python_version, "members": len(members),
+                           "fix": fix.replacement, "fix_source": fix.source, "verified": verified})
+        pending = next_pending
+        if not pending:
+            break
+    return fixed, report, left + pending
+
+###########################
+# INPUT AND OUTPUT
+###########################
+
+def load_failed_builds(table, limit=None):
+    """
+    failed original builds (stage BUILD, status FAILED) with a stored dependency file
+    """
+    from database.database_cmds import create_session
+    from database.pipeline_state import Stage, Status
+    from scripts.build_check import parse_conda_env
+    from utils.metrics import execute_sql
+    select_cmd = f"""
+    SELECT t.id, t.github_url, t.build_status_orig, t.deps_last_commit_date, t.build_sys_type, d.deps_file_content_orig
+    FROM {table.table_name} t JOIN {table.deps_table_name} d ON d.id = t.id
+    WHERE t.stage = {int(Stage.BUILD)} AND t.status = {int(Status.FAILED)} AND t.deleted_at IS NULL
+        AND d.deps_file_content_orig IS NOT NULL
+    ORDER BY t.id"""
+    if limit:
+        select_cmd += f" LIMIT {int(limit)}"
+    session, _ = create_session(table.db_name)
+    try:
+        rows = execute_sql(session, select_cmd).fetch_all()
+    finally:
+        session.close()
+    failures = []
+    for repo_id, github_url, status, date, build_sys_type, content in rows:
+        content = parse_conda_env(content) if build_sys_type == "conda" else content
+        if content:
+            failures.append({"id": repo_id, "github_url": github_url, "status": status or "", "content": content,
+                             "date": str(date)[:10] if date else None})
+    return failures
+
+
+def load_failed_csv(filepath, limit=None):
+    """
+    failed rows of build_check_results.csv, their dependency files are fetched again from GitHub
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from scripts.build_check import fetch_requirements
+    with open(filepath, 'r', newline='') as f:
+        rows = [row for row in csv.DictReader(f) if row["status"] not in BUILD_OK]
+    rows = rows[:limit] if limit else rows
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        contents = list(executor.map(fetch_requirements, [row["file_or_repo"] for row in rows]))
+    return [{"id": None, "github_url": row["file_or_repo"], "status": row["status"], "content": content, "date": None}
+            for row, content in zip(rows, contents) if content]
+
+
+def write_reports(fixed, report, left, clusters_file=CLUSTERS_FILE, fixes_file=FIXES_FILE):
+    os.makedirs(os.path.dirname(clusters_file), exist_ok=True)
+    with open(clusters_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=["round", "error_class", "requirement", "python_version", "members",
+                                               "fix", "fix_source", "verified"])
+        writer.writeheader()
+        writer.writerows(report)
+    with open(fixes_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["github_url", "fixed", "error_class", "requirement", "python_version"])
+        for member, was_fixed in [(member, True) for member in fixed] + [(member, False) for member in left]:
+            writer.writerow([member["github_url"], was_fixed, *member["signature"]])
+
+
+def main(csv_path=None, limit=None, default_python=HOST_PYTHON, use_llm=False, dry_run=False):
+    from database.database_cmds import Table, MYSQL_DATABASE, TABLE_NAME
+    table = Table(TABLE_NAME, MYSQL_DATABASE)
+    failures = load_failed_csv(csv_path, limit) if csv_path else load_failed_builds(table, limit)
+    if not failures:
+        print("No failed builds with a dependency file")
+        return []
+
+    fixed, report, left = repair(failures, default_python, use_llm)
+    repairer().save()
+    write_reports(fixed, report, left)
+    clusters = sum(1 for row in report if row["round"] == 1)
+    print(f"{len(failures)} failed builds in {clusters} clusters ({len(report)} over all rounds), "
+          f"{len(fixed)} fixed and verified, {len(left)} left. "
+          f"PyPI lookups: {pypi_releases.cache_info().currsize}, resolves: {resolve_check.cache_info().currsize}, "
+          f"pin repair probes: {repairer().probes} ({repairer().hits} cached)")
+    print(f"Clusters in {CLUSTERS_FILE}, repos in {FIXES_FILE}")
+
+    if not dry_run and not csv_path and fixed:
+        from scripts.pipeline import batch_fix_dependencies
+        written = batch_fix_dependencies().write_results(
+            fixed, table_name=table.table_name, deps_table_name=table.deps_table_name, db_name=table.db_name)
+        print(f"Wrote {written} fixed dependency files")
+    return fixed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster failed builds by failure signature and fix each cluster once")
+    parser.add_argument('--csv', default=None, help='Read the failures from a build check results CSV instead of the table')
+    parser.add_argument('--limit', type=int, default=None, help='Only look at the first N failed builds')
+    parser.add_argument('--python', default=HOST_PYTHON, help='Python version of failures that do not name one')
+    parser.add_argument('--llm', action='store_true', help='Ask GPT for a fix of clusters no rule fixes')
+    parser.add_argument('--dry-run', action='store_true', help='Only write the reports, not the fixed dependency files')
+    args = parser.parse_args()
+
+    main(args.csv, args.limit, args.python, args.llm, args.dry_run)
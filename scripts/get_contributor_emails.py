@@ -1,50 +1,184 @@
-import subprocess
+"""
+Contributor emails of git repositories
+
+Emails come from `git shortlog -sne` (mailmap aware, most active contributor first), read line by line from the
+git process, so the history is never loaded into Python and memory does not grow with the number of commits.
+git runs with cwd= instead of os.chdir, so many repos can be processed at once.
+
+A repo is a local checkout, a bare repository or a GitHub URL (resolved through the shared mirror store).
+
+Usage:
+    (venv) python3 scripts/get_contributor_emails.py <path_to_git_repo_or_url>
+    Every repo in papers_and_code without contributors, results upserted into the contributors column:
+    (venv) python3 scripts/get_contributor_emails.py --from-db --workers 8 --limit 1000
+"""
+
 import os
 import sys
+import time
+import argparse
+import subprocess
+from multiprocessing import Pool
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+# same limit as the contributors VARCHAR(255) column
+MAX_CONTRIBUTORS_LENGTH = 255
+
+
+def resolve_repo(repo):
+    """
+    git directory to run commands in: a local checkout or bare repo as is, anything else through the mirror store
+    """
+    if os.path.isdir(repo):
+        return os.path.abspath(repo)
+    from utils.repo_store import RepoStore
+    return RepoStore().mirror(repo)
+
+
+def iter_contributor_emails(repo_path, rev="HEAD"):
+    """
+    yields (commit_count, email) per contributor, most commits first
+    """
+    command = ["git", "shortlog", "-sne", rev]
+    # shortlog reads the log from stdin when it is not a terminal, so give it an empty one
+    with subprocess.Popen(command, cwd=repo_path, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, text=True, errors="replace",
+                          env={**os.environ, "GIT_TERMINAL_PROMPT": "0"}) as process:
+        for line in process.stdout:
+            # "   42\tJane Doe <jane@example.com>"
+            count, _, author = line.strip().partition("\t")
+            email = author.rpartition("<")[2].rstrip(">").strip()
+            if email:
+                yield int(count), email.lower()
+        stderr = process.stderr.read()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+
 
 def get_all_contributor_emails(repo_path):
+    """
+    unique contributor emails, most active first
+    the same email can appear under several names, only its first (highest count) occurrence is kept
+    """
+    emails = {}
+    for count, email in iter_contributor_emails(repo_path):
+        emails.setdefault(email, count)
+    return list(emails)
+
+
+def format_contributors(emails, max_length=MAX_CONTRIBUTORS_LENGTH):
+    # whole emails only, the least active ones are dropped until the list fits the column
+    contributors = []
+    length = 0
+    for email in emails:
+        length += len(email) + (2 if contributors else 0)
+        if length > max_length:
+            break
+        contributors.append(email)
+    return ', '.join(contributors)
+
+
+def extract_contributors(row):
+    # worker: (id, repo) -> (id, contributors or None)
+    repo_id, repo = row
     try:
-        # Verify the path exists and is a directory
-        if not os.path.isdir(repo_path):
-            raise ValueError(f"The path '{repo_path}' is not a valid directory")
-            
-        # Verify it's a git repository
-        if not os.path.isdir(os.path.join(repo_path, '.git')):
-            raise ValueError(f"The directory '{repo_path}' is not a git repository")
-        
-        # Change to the repository directory
-        original_dir = os.getcwd()
-        os.chdir(repo_path)
-        
-        try:
-            # Run git log command to get all commit emails
-            command = ["git", "log", "--pretty=format:%ae"]
-            result = subprocess.run(command, capture_output=True, text=True, check=True)
-            
-            # Split output into lines and convert to set to remove duplicates
-            emails = set(result.stdout.split('\n'))
-            
-            # Write emails to file in the repository directory
-            output_file = os.path.join(repo_path, 'contributor_emails.txt')
-            with open(output_file, 'w') as f:
-                for email in sorted(emails):
-                    f.write(f"{email}\n")
-            
-            print(f"Successfully extracted {len(emails)} unique contributor emails to {output_file}")
-            
-        finally:
-            # Always change back to original directory
-            os.chdir(original_dir)
-            
-    except subprocess.CalledProcessError:
-        print("Error: Failed to execute git command")
+        emails = get_all_contributor_emails(resolve_repo(repo))
+        return repo_id, format_contributors(emails) or None
+    except subprocess.CalledProcessError as e:
+        print(f"Error reading history of {repo}: {(e.stderr or '').strip()}")
     except Exception as e:
-        print(f"An error occurred: {str(e)}")
+        print(f"An error occurred for {repo}: {str(e)}")
+    return repo_id, None
+
+
+###########################
+# DATABASE FUNCTIONS
+###########################
+
+def fetch_repos(limit=None):
+    from database.database_cmds import create_session, MYSQL_DATABASE, TABLE_NAME
+    session, _ = create_session(MYSQL_DATABASE)
+    select_cmd = f"""
+    SELECT id, github_url
+    FROM {TABLE_NAME}
+    WHERE contributors IS NULL AND github_url IS NOT NULL AND deleted_at IS NULL
+    ORDER BY id"""
+    if limit:
+        select_cmd += f" LIMIT {int(limit)}"
+    try:
+        return [(row[0], row[1]) for row in session.sql(select_cmd).execute().fetch_all()]
+    finally:
+        session.close()
+
+
+def write_contributors(results, session=None):
+    """
+    bulk upsert of the contributors column, one UPDATE ... CASE statement per batch
+    session: an open session to reuse, otherwise one is created (and closed) here
+    """
+    from database.database_cmds import create_session, escape_value, MYSQL_DATABASE, TABLE_NAME
+    from utils.metrics import execute_sql
+    found = [(repo_id, contributors) for repo_id, contributors in results if contributors]
+    if not found:
+        return 0
+    cases = " ".join(f"WHEN {repo_id} THEN {escape_value(contributors)}" for repo_id, contributors in found)
+    ids = ", ".join(str(repo_id) for repo_id, _ in found)
+    update_cmd = f"""
+    UPDATE {TABLE_NAME}
+    SET contributors = CASE id {cases} END
+    WHERE id IN ({ids})"""
+
+    own_session = session is None
+    if own_session:
+        session, _ = create_session(MYSQL_DATABASE)
+    try:
+        execute_sql(session, update_cmd)
+        session.commit()
+        return len(found)
+    finally:
+        if own_session:
+            session.close()
+
+
+def run_batch(rows, workers=4, batch_size=100):
+    start_time = time.monotonic()
+    processed, updated = 0, 0
+    pending = []
+    with Pool(processes=workers) as pool:
+        for result in pool.imap_unordered(extract_contributors, rows, chunksize=4):
+            processed += 1
+            pending.append(result)
+            if len(pending) >= batch_size:
+                updated += write_contributors(pending)
+                pending.clear()
+                print(f"-- Repos processed: {processed}/{len(rows)}, updated: {updated}, "
+                      f"{processed / (time.monotonic() - start_time):.1f} repos/s --")
+    if pending:
+        updated += write_contributors(pending)
+    print(f"\nRepos processed: {processed}, contributors updated: {updated} in {time.monotonic() - start_time:.1f}s")
+    return updated
+
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python get_contributor_emails.py <path_to_git_repo>")
+    parser = argparse.ArgumentParser(description="Extract contributor emails from git history")
+    parser.add_argument('repo', nargs='?', help='Path to a git repository (checkout or bare) or a GitHub URL')
+    parser.add_argument('--from-db', action='store_true', help='Process every repo in papers_and_code without contributors')
+    parser.add_argument('-w', '--workers', type=int, default=min(os.cpu_count(), 8), help='Number of worker processes')
+    parser.add_argument('-l', '--limit', type=int, default=None, help='Maximum number of repos to process')
+    parser.add_argument('-b', '--batch_size', type=int, default=100, help='Results per bulk database write')
+    args = parser.parse_args()
+
+    if args.from_db:
+        run_batch(fetch_repos(args.limit), workers=args.workers, batch_size=args.batch_size)
+    elif args.repo:
+        try:
+            for email in get_all_contributor_emails(resolve_repo(args.repo)):
+                print(email)
+        except subprocess.CalledProcessError:
+            print("Error: Failed to execute git command")
+            sys.exit(1)
+    else:
+        parser.print_usage()
         sys.exit(1)
-        
-    repo_path = os.path.abspath(sys.argv[1])
-    get_all_contributor_emails(repo_path) 
\ No newline at end of file
@@ -0,0 +1,309 @@
+"""
+GitHub issue harvester
+
+Pulls issues for many repositories (for example every github_url in papers_and_code) into output/issues.csv.
+
+- Authenticated with GITHUB_TOKEN (5000 requests/hour instead of 60)
+- Conditional requests: the first page of every repo is requested with If-None-Match, an unchanged repo answers
+  304 Not Modified, which does not count against the rate limit
+- Incremental: only issues updated since the last successful run of that repo are requested (since=)
+- Concurrent: the page count is read from the Link header of the first page and the remaining pages are fetched
+  in parallel, several repos are harvested at once
+- Streaming: issues are appended to a side file of the run (output/issues.run.csv) in batches instead of being kept
+  in memory until the end, at the end of the run it is compacted into output/issues.csv
+- Keyed by (repo, number): an incremental run returns issues that were updated, and a repo that failed halfway
+  returns its first pages again, compaction keeps one row per issue, the one with the latest updated_at
+- Resumable: per-repo cursors (since timestamp and ETag) are kept in output/issue_cursors.json and only advanced
+  once every page of that repo has been written. A side file left by an interrupted run is compacted first
+
+Usage:
+    (venv) python3 scripts/github_issue_harvester.py --repos huggingface/transformers pytorch/pytorch
+    (venv) python3 scripts/github_issue_harvester.py --from-db --limit 1000
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import argparse
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from utils.metrics import http_get
+
+load_dotenv()
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+
+ISSUES_FILE = os.path.join(ROOT, "output", "issues.csv")
+RUN_FILE = os.path.join(ROOT, "output", "issues.run.csv")
+CURSORS_FILE = os.path.join(ROOT, "output", "issue_cursors.json")
+ISSUE_COLUMNS = ["repo", "number", "title", "body", "labels", "comments", "state", "updated_at"]
+PER_PAGE = 100
+
+
+class IssueWriter:
+    """
+    thread-safe CSV appender that buffers rows and flushes them in batches, to the side file of the run
+    """
+    def __init__(self, path=RUN_FILE, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = []
+        self.rows_written = 0
+        self.lock = threading.Lock()
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', newline='') as f:
+                csv.writer(f).writerow(ISSUE_COLUMNS)
+
+    def write(self, rows):
+        with self.lock:
+            self.buffer.extend(rows)
+            if len(self.buffer) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        with open(self.path, 'a', newline='') as f:
+            csv.writer(f).writerows(self.buffer)
+        self.rows_written += len(self.buffer)
+        self.buffer = []
+
+
+def read_rows(path):
+    csv.field_size_limit(2**31 - 1)
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        yield from reader
+
+def compact(issues_file=ISSUES_FILE, run_file=RUN_FILE):
+    """
+    merge run_file into issues_file keeping one row per (repo, number), the one with the latest updated_at
+    two streamed passes over both files, only one key per issue is held in memory
+    returns the number of issues in issues_file
+    """
+    if not os.path.exists(run_file):
+        return None
+    # a file from the old single-repo scraper has a different layout, keep it aside instead of mixing the two
+    if os.path.exists(issues_file):
+        with open(issues_file, newline='') as f:
+            header = next(csv.reader(f), None)
+        if header != ISSUE_COLUMNS:
+            os.replace(issues_file, f"{issues_file}.old")
+            print(f"Existing {issues_file} has a different layout, moved to {issues_file}.old")
+    files = [path for path in (issues_file, run_file) if os.path.exists(path)]
+
+    updated_at = ISSUE_COLUMNS.index("updated_at")
+    latest = {}
+    for path in files:
+        for row in read_rows(path):
+            key = (row[0], row[1])
+            if row[updated_at] > latest.get(key, ""):
+                latest[key] = row[updated_at]
+
+    issues = 0
+    tmp_file = f"{issues_file}.tmp"
+    with open(tmp_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(ISSUE_COLUMNS)
+        for path in files:
+            for row in read_rows(path):
+                key = (row[0], row[1])
+                # the first row with the latest updated_at, later copies find the key gone
+                if key in latest and latest[key] == row[updated_at]:
+                    writer.writerow(row)
+                    del latest[key]
+                    issues += 1
+    os.replace(tmp_file, issues_file)
+    os.remove(run_file)
+    return issues
+
+def load_cursors(path=CURSORS_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_cursors(cursors, path=CURSORS_FILE):
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(cursors, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, path)
+
+def create_http_session(pool_size=16):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.headers["Accept"] = "application/vnd.github+json"
+    if GITHUB_TOKEN:
+        session.headers["Authorization"] = f"token {GITHUB_TOKEN}"
+    else:
+        print("Warning: No GitHub token found. Rate limits will be strict.")
+    return session
+
+def last_page(link_header):
+    # Link: <https://api.github.com/...&page=34>; rel="last"
+    match = re.search(r'[?&]page=(\d+)[^>]*>;\s*rel="last"', link_header or "")
+    return int(match.group(1)) if match else 1
+
+def issue_row(repo, issue):
+    return [
+        repo,
+        issue["number"],
+        issue["title"],
+        issue["body"],
+        ", ".join(label["name"] for label in issue.get("labels", [])),
+        issue["comments"],
+        issue["state"],
+        issue["updated_at"],
+    ]
+
+def report_failure(repo, response):
+    if response.status_code == 403 and response.headers.get('X-RateLimit-Remaining') == '0':
+        reset = int(response.headers.get('X-RateLimit-Reset', 0))
+        reset_time = datetime.fromtimestamp(reset).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"GitHub API rate limit exceeded while fetching {repo}, resets at {reset_time}")
+    else:
+        print(f"Failed to retrieve issues for {repo}: {response.status_code}")
+
+def harvest_repo(repo, session, writer, cursor, page_workers=8):
+    """
+    fetch every issue of one repo updated since the cursor
+    returns the new cursor, or None if the repo failed (the old cursor is then kept)
+    """
+    run_started = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    url = f"https://api.github.com/repos/{repo}/issues"
+    params = {"state": "all", "per_page": PER_PAGE, "sort": "updated", "direction": "asc"}
+    if cursor.get("since"):
+        params["since"] = cursor["since"]
+    headers = {"If-None-Match": cursor["etag"]} if cursor.get("etag") else {}
+
+    try:
+        response = http_get(url, session=session, params={**params, "page": 1}, headers=headers, timeout=30)
+    except requests.RequestException as e:
+        print(f"Network error fetching issues for {repo}: {str(e)}")
+        return None
+
+    if response.status_code == 304:
+        return {**cursor, "since": run_started}
+    if response.status_code != 200:
+        report_failure(repo, response)
+        return None
+
+    def to_rows(issues):
+        # the issues endpoint also returns pull requests, those are not issues for our purposes
+        return [issue_row(repo, issue) for issue in issues if "pull_request" not in issue]
+
+    writer.write(to_rows(response.json()))
+    num_pages = last_page(response.headers.get("Link"))
+    etag = response.headers.get("ETag")
+
+    def fetch_page(page):
+        page_response = http_get(url, session=session, params={**params, "page": page}, timeout=30)
+        if page_response.status_code != 200:
+            report_failure(repo, page_response)
+            return False
+        writer.write(to_rows(page_response.json()))
+        return True
+
+    if num_pages > 1:
+        try:
+            with ThreadPoolExecutor(max_workers=page_workers) as pool:
+                ok = all(pool.map(fetch_page, range(2, num_pages + 1)))
+        except requests.RequestException as e:
+            print(f"Network error fetching issues for {repo}: {str(e)}")
+            ok = False
+        if not ok:
+            return None
+
+    return {"since": run_started, "etag": etag}
+
+def harvest(repos, repo_workers=4, page_workers=8, output_file=ISSUES_FILE, cursors_file=CURSORS_FILE,
+            run_file=RUN_FILE):
+    """
+    harvest issues for a list of 'owner/name' repos
+    cursors are saved after every finished repo so an interrupted run only redoes the repos in flight,
+    the rows of finished repos are already in run_file, which the next run compacts before it starts
+    """
+    if compact(output_file, run_file) is not None:
+        print(f"Compacted the issues of an interrupted run into {output_file}")
+    cursors = load_cursors(cursors_file)
+    writer = IssueWriter(run_file)
+    session = create_http_session(pool_size=repo_workers * page_workers)
+    cursors_lock = threading.Lock()
+    done, failed = 0, 0
+
+    def run(repo):
+        nonlocal done, failed
+        new_cursor = harvest_repo(repo, session, writer, cursors.get(repo, {}), page_workers)
+        # the repo's rows have to be on disk before its cursor moves forward
+        writer.flush()
+        with cursors_lock:
+            if new_cursor is None:
+                failed += 1
+                return
+            cursors[repo] = new_cursor
+            save_cursors(cursors, cursors_file)
+            done += 1
+            if done % 50 == 0:
+                print(f"-- Repos harvested: {done}, issues written: {writer.rows_written} --")
+
+    with ThreadPoolExecutor(max_workers=repo_workers) as pool:
+        list(pool.map(run, repos))
+    writer.flush()
+    issues = compact(output_file, run_file)
+
+    print(f"Repos harvested: {done}, failed: {failed}, issues written: {writer.rows_written}, "
+          f"{issues} issues in {output_file}")
+    return done, failed
+
+def repos_from_db(limit=None):
+    """
+    'owner/name' for every github_url in papers_and_code
+    """
+    from database.database_cmds import create_session, extract_owner_repo, MYSQL_DATABASE, TABLE_NAME
+    session, _ = create_session(MYSQL_DATABASE)
+    select_cmd = f"SELECT github_url FROM {TABLE_NAME} WHERE github_url IS NOT NULL AND deleted_at IS NULL ORDER BY id"
+    if limit:
+        select_cmd += f" LIMIT {int(limit)}"
+    try:
+        rows = session.sql(select_cmd).execute().fetch_all()
+    finally:
+        session.close()
+    repos = []
+    for row in rows:
+        owner_repo = extract_owner_repo(row[0])
+        if owner_repo:
+            repos.append(f"{owner_repo[0]}/{owner_repo[1].removesuffix('.git')}")
+    return repos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally harvest GitHub issues for many repositories")
+    parser.add_argument('--repos', nargs='+', default=[], help='Repositories as owner/name')
+    parser.add_argument('--from-db', action='store_true', help='Harvest every github_url in papers_and_code')
+    parser.add_argument('--limit', type=int, default=None, help='Maximum number of repos read from the database')
+    parser.add_argument('--repo-workers', type=int, default=4, help='Repositories harvested concurrently')
+    parser.add_argument('--page-workers', type=int, default=8, help='Pages fetched concurrently per repository')
+    args = parser.parse_args()
+
+    repo_list = list(args.repos)
+    if args.from_db:
+        repo_list += repos_from_db(args.limit)
+    if not repo_list:
+        parser.print_help()
+        sys.exit(1)
+    harvest(repo_list, repo_workers=args.repo_workers, page_workers=args.page_workers)
@@ -12,10 +12,15 @@ Usage:
     2. Import as module:
         from gmail_api import main
         await main(owner_email="user@example.com", repo_name="my-repo", repo_url="https://github.com/user/my-repo")
+        or, for many emails, build the service once and reuse it:
+        service = build_service()
+        send_email(service, "user@example.com", "my-repo", "https://github.com/user/my-repo")
 
     3. Testing (uses default values):
         python gmail_api.py
 
+    4. Queued notifications for every fixed repo, rate limited: see scripts/notification.py
+
 Note: Requires .env with Gmail API credentials and OAuth token.
 """
 
@@ -25,24 +30,24 @@ import asyncio
 import sys
 from datetime import datetime
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
-import pickle
 import base64
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import pathlib
-import time
 
 
-async def main(owner_email=None, repo_name=None, repo_url=None):
+SCOPES = ['https://www.googleapis.com/auth/gmail.send']
+
+
+def build_service():
+    """
+    Authenticated Gmail service, build it once and reuse it for every email
+    (the refresh token is exchanged here, the client refreshes the access token itself when it expires)
+    """
     # Load environment variables
     load_dotenv()
-    
-    # Gmail API setup
-    SCOPES = ['https://www.googleapis.com/auth/gmail.send']
-    
+
     # Create credentials from environment variables
     creds = Credentials(
         token=None,  # We'll use refresh token flow
@@ -52,27 +57,11 @@ async def main(owner_email=None, repo_name=None, repo_url=None):
         client_secret=os.getenv('GMAIL_CLIENT_SECRET'),
         scopes=SCOPES
     )
+    creds.refresh(Request())
+    return build('gmail', 'v1', credentials=creds, cache_discovery=False)
 
-    # Try to refresh the credentials
-    try:
-        creds.refresh(Request())
-    except Exception as e:
-        print(f"Error refreshing credentials: {e}")
-        return
-
-    # Use command line arguments if no parameters provided
-    if owner_email is None and len(sys.argv) > 1:
-        owner_email = sys.argv[1]
-    if repo_name is None and len(sys.argv) > 2:
-        repo_name = sys.argv[2]
-    if repo_url is None and len(sys.argv) > 3:
-        repo_url = sys.argv[3]
-    
-    # Default values for testing if no arguments provided
-    owner_email = owner_email or "test@example.com"
-    repo_name = repo_name or "test-repo"
-    repo_url = repo_url or "https://github.com/test-person/test-repo"
 
+def build_message(owner_email, repo_name, repo_url):
     # Create email content with timestamp
     current_time = datetime.now().strftime("%H:%M:%S")
     EMAIL_SUBJECT = f"your repo: {repo_name} can't be built"
@@ -116,21 +105,48 @@ async def main(owner_email=None, repo_name=None, repo_url=None):
     
     message.attach(text_part)  # Plain text fallback
     message.attach(html_part)  # HTML version
+    return message
+
+
+def send_email(service, owner_email, repo_name, repo_url):
+    """
+    Send one notification with an already built service, raises on failure.
+    Rate limiting is up to the caller (scripts/notification.py), nothing sleeps here.
+    """
+    message = build_message(owner_email, repo_name, repo_url)
+    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+    return service.users().messages().send(
+        userId='me',
+        body={'raw': raw_message}
+    ).execute()
 
-    print("Waiting for 10 seconds before sending the email...")
-    await asyncio.sleep(10)
 
-    # Try to send email with error handling and rate limiting
+async def main(owner_email=None, repo_name=None, repo_url=None, service=None):
+    # Try to refresh the credentials
+    if service is None:
+        try:
+            service = build_service()
+        except Exception as e:
+            print(f"Error refreshing credentials: {e}")
+            return
+
+    # Use command line arguments if no parameters provided
+    if owner_email is None and len(sys.argv) > 1:
+        owner_email = sys.argv[1]
+    if repo_name is None and len(sys.argv) > 2:
+        repo_name = sys.argv[2]
+    if repo_url is None and len(sys.argv) > 3:
+        repo_url = sys.argv[3]
+    
+    # Default values for testing if no arguments provided
+    owner_email = owner_email or "test@example.com"
+    repo_name = repo_name or "test-repo"
+    repo_url = repo_url or "https://github.com/test-person/test-repo"
+
+    # Try to send email with error handling
     try:
-        service = build('gmail', 'v1', credentials=creds)
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
-        service.users().messages().send(
-            userId='me',
-            body={'raw': raw_message}
-        ).execute()
-        
+        await asyncio.to_thread(send_email, service, owner_email, repo_name, repo_url)
         print("Email sent successfully!")
-        time.sleep(0.25)  # 250ms delay = ~240 emails per minute
     except Exception as e:
         print(f"Sadface homies. Error: {e}")
 
@@ -1,10 +1,38 @@
+"""
+Publish fixed repositories
+
+Reads the failed rows of output/build_check_results.csv, checks out each repo, applies the fix and pushes the result
+to a new repository under the grimrepor account.
+
+- Repos are processed concurrently, each in its own working directory (no process-wide os.chdir)
+- Checkouts are cheap: a shallow, blobless clone (--depth 1 --filter=blob:none), or a clone that borrows objects
+  from a local mirror with --reference (--use-store takes the mirror from the shared store in utils/repo_store.py)
+- The fixed tree is published as a single snapshot commit, so nothing but the current tree is pushed
+- No venv is created unless the fix stage needs one (--venv), and the pip cache is left alone
+- All GitHub API calls share one pooled HTTP session, all ssh pushes share one multiplexed ssh connection
+
+Usage:
+    (venv) python3 scripts/new_repo.py --workers 8
+    Testing against local bare repositories (created on demand, nothing is sent to GitHub):
+    (venv) python3 scripts/new_repo.py --remote-template /tmp/remotes/{name}.git --no-create
+"""
+
 import os
-import subprocess
+import sys
+import time
 import shutil
+import argparse
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-import pandas as pd
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from utils.csv_io import iter_csv
+from utils.repo_store import RepoStore
+from utils.metrics import instrument, http_request
 
 # GitHub API URL for creating repositories
 GITHUB_API_URL = "https://api.github.com/user/repos"
@@ -12,113 +40,220 @@ GITHUB_API_URL = "https://api.github.com/user/repos"
 # Replace this with your GitHub Personal Access Token
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 
+DEFAULT_REMOTE_TEMPLATE = "git@github.com:grimrepor/{name}.git"
+WORK_DIR = os.path.join(ROOT, "output", "publish")
+
+_http_session = None
+_http_lock = threading.Lock()
+
+
+def get_http_session():
+    # one keep-alive connection pool for every GitHub API call made by the workers
+    global _http_session
+    with _http_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            _http_session.headers.update({
+                "Authorization": f"token {GITHUB_TOKEN}",
+                "Accept": "application/vnd.github.v3+json"
+            })
+    return _http_session
+
 # Function to create a new GitHub repository using a placeholder logic (replace with your logic)
-def create_new_github_repo(new_repo_name):
+def create_new_github_repo(new_repo_name, remote_url=None):
     """
     Creates a new GitHub repository using the GitHub API.
 
     Parameters:
     - new_repo_name (str): The name of the new GitHub repository.
+    - remote_url (str): Unused, the URL follows from the name on GitHub.
     """
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-
     # Payload for creating a new repository
     data = {
         "name": new_repo_name,  # Name of the new repository
         "description": "We have fixed your repository!",
         "private": False,  # Set to True if you want the repo to be private
-        "auto_init": True  # Initialize the repo with an empty README
+        "auto_init": False  # Stay empty, the fixed snapshot is pushed as the first commit
     }
 
     # Make the request to GitHub API to create the repository
-    response = requests.post(GITHUB_API_URL, json=data, headers=headers)
+    response = http_request("POST", GITHUB_API_URL, session=get_http_session(), json=data)
 
     if response.status_code == 201:
         print(f"Repository '{new_repo_name}' created successfully.")
+        return True
     else:
         print(f"Failed to create repository: {response.status_code}")
         print(response.json())
+        return False
+
+
+def create_local_bare_repo(new_repo_name, remote_url):
+    # stand-in for create_new_github_repo when publishing to local bare repositories (testing)
+    if not os.path.isdir(remote_url):
+        subprocess.run(["git", "init", "--bare", "--quiet", remote_url], check=True)
+    return True
 
 
-def build_check():
+def build_check(repo_dir):
     # FIXME: Replace with actual function logic
     success = True
     fixed = True
     json_data = {}  # Placeholder JSON data
     return success, fixed, json_data
 
-# List of GitHub repositories
-filepath = os.path.join(ROOT, "output", "build_check_results.csv")
-df = pd.read_csv(filepath)
-repos_list = list(df.itertuples(index=False, name=None))
 
-# Iterate over each repository in the list
-for repo, status in repos_list:
-    # from IPython import embed; embed()
-    print(f"Processing repository: {repo}")
-    print(f"Status: {status}")
+def git(args, cwd, env=None):
+    return subprocess.run(["git", *args], cwd=cwd, env=env, check=True, capture_output=True, text=True)
 
-    if status == "Success" or status == "No requirements found":
-        continue
 
-    # Extract the repository name from the URL
-    repo_name = os.path.basename(repo).replace(".git", "")
+def git_env(control_dir):
+    """
+    environment for git subprocesses
+    ssh connection multiplexing: the first push opens a master connection that later pushes reuse
+    """
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+    os.makedirs(control_dir, exist_ok=True)
+    env.setdefault("GIT_SSH_COMMAND",
+                   f"ssh -o ControlMaster=auto -o ControlPath={control_dir}/%r@%h:%p -o ControlPersist=300")
+    return env
 
-    # Extract the username
-    username = repo.split("/")[-2]
 
-    # Create a new directory for the repo and move into it
+def clone_source(repo):
+    # local paths (test fixtures) need file:// for --depth to be honoured
+    if os.path.isdir(repo):
+        return f"file://{os.path.abspath(repo)}"
+    return f"{repo}.git" if not repo.endswith(".git") else repo
 
-    repo_dir = os.path.join(ROOT, "output", f"{repo_name}_dir")
-    os.makedirs(repo_dir, exist_ok=True)
-    os.chdir(repo_dir)
 
-    # Clone the GitHub repository
-    # FIXME: fails if repo already exists
-    subprocess.run(["git", "clone", f"{repo}.git"], check=True)
+def fork_name(repo):
+    # owner_repo, the name of the fixed copy
+    # Extract the repository name from the URL
+    repo_name = os.path.basename(repo.rstrip("/")).replace(".git", "")
+    # Extract the username
+    username = os.path.basename(os.path.dirname(repo.rstrip("/")))
+    return f"{username}_{repo_name}"
 
-    # Navigate into the cloned repository folder
-    os.chdir(repo_name)
-    # if .gitingore exists, add venv/ to it, otherwise create it and add venv/
-    if not os.path.exists(".gitignore"):
-        os.system("touch .gitignore && echo 'venv/' >> .gitignore")
-    else:
-        os.system("echo 'venv/' >> .gitignore")
 
-    # Create a virtual environment (using Python's venv module)
-    # FIXME: we should care about which python3 version
-    subprocess.run(["python3", "-m", "venv", "venv"], check=True)
+def publish_repo(repo, work_dir=WORK_DIR, remote_template=DEFAULT_REMOTE_TEMPLATE, reference=None,
+                 create_remote=create_new_github_repo, needs_venv=False, env=None, store=None,
+                 fixed_requirements=None):
+    """
+    check out one repo in its own directory, fix it and push the fixed snapshot to a new remote
+    store: RepoStore whose mirror of the repo is used as the --reference
+    fixed_requirements: contents of the fixed requirements.txt when it is already known (scripts/pipeline.py)
+    returns (repo, result) where result is 'published', 'not fixed' or 'error: ...'
+    """
+    new_repo_name = fork_name(repo)
+    repo_dir = os.path.join(work_dir, new_repo_name)
+
+    try:
+        # always start from a fresh checkout, a leftover directory from an earlier run would make clone fail
+        if os.path.exists(repo_dir):
+            shutil.rmtree(repo_dir)
+        clone_cmd = ["clone", "--quiet", "--depth", "1", "--filter=blob:none"]
+        if store is not None:
+            reference = store.mirror(repo)
+        if reference:
+            # objects come from the local mirror, only what it is missing crosses the network
+            clone_cmd += ["--reference-if-able", reference]
+        git(clone_cmd + [clone_source(repo), repo_dir], cwd=work_dir, env=env)
+
+        if needs_venv:
+            # FIXME: we should care about which python3 version
+            subprocess.run([sys.executable, "-m", "venv", os.path.join(repo_dir, "venv")], check=True)
+            with open(os.path.join(repo_dir, ".gitignore"), "a") as f:
+                f.write("\nvenv/\n")
 
-    # Run the build_check function to fix dependencies or issues
-    # FIXME: # Replace with actual function logic
-    success, fixed, json_data = build_check()
+        if fixed_requirements is not None:
+            with open(os.path.join(repo_dir, "requirements_fixed.txt"), "w") as f:
+                f.write(fixed_requirements)
+        else:
+            # Run the build_check function to fix dependencies or issues
+            # FIXME: # Replace with actual function logic
+            success, fixed, json_data = build_check(repo_dir)
+            if not (success and fixed):
+                return repo, "not fixed"
 
-    # If the build is successful and issues were fixed
-    if success and fixed:
         # Move the fixed requirements.txt (if build_check fixed it)
-        if os.path.exists("requirements_fixed.txt"):
-            shutil.move("requirements_fixed.txt", "requirements.txt")
+        fixed_file = os.path.join(repo_dir, "requirements_fixed.txt")
+        if os.path.exists(fixed_file):
+            shutil.move(fixed_file, os.path.join(repo_dir, "requirements.txt"))
+
+        # Publish the fixed tree as one root commit, the shallow history is never pushed
+        git(["checkout", "--quiet", "--orphan", "grimrepor-fixed"], cwd=repo_dir, env=env)
+        git(["add", "-A"], cwd=repo_dir, env=env)
+        git(["commit", "--quiet", "-m", "repo fixed your env file"], cwd=repo_dir, env=env)
 
-        # Add all changes, commit, and prepare to reinitialize the repository
-        subprocess.run(["git", "add", "*"], check=True)
-        subprocess.run(["git", "commit", "-m", "repo fixed your env file"], check=True)
+        remote_url = remote_template.format(name=new_repo_name)
+        if create_remote is not None and not create_remote(new_repo_name, remote_url):
+            return repo, "error: could not create remote repository"
+        with instrument("git_push"):
+            git(["push", "--quiet", remote_url, "HEAD:refs/heads/main"], cwd=repo_dir, env=env)
+        return repo, "published"
 
-        # Call the function to create a new GitHub repo (this is a placeholder)
-        new_repo_name = f"{username}_{repo_name}"
-        create_new_github_repo(new_repo_name)
+    except subprocess.CalledProcessError as e:
+        return repo, f"error: {' '.join(e.cmd[:2])} failed: {(e.stderr or '').strip()}"
+    except Exception as e:
+        return repo, f"error: {str(e)}"
+    finally:
+        # the checkout is only needed until the push is done
+        if os.path.exists(repo_dir):
+            shutil.rmtree(repo_dir, ignore_errors=True)
 
-        # Add a new remote to the reinitialized Git repository and push the changes
-        new_repo_url = f"git@github.com:grimrepor/{new_repo_name}.git"
-        subprocess.run(["git", "remote", "remove", "origin"], check=True)
-        subprocess.run(["git", "remote", "add", "origin", new_repo_url], check=True)
-        subprocess.run(["git", "push", "origin", "main"], check=True)
 
-    # After all repository operations, purge pip cache
-    subprocess.run(["pip", "cache", "purge"], check=True)
-    print("Pip cache purged successfully")
+def publish_repos(repos, workers=8, work_dir=WORK_DIR, remote_template=DEFAULT_REMOTE_TEMPLATE, reference=None,
+                  create_remote=create_new_github_repo, needs_venv=False, store=None):
+    """
+    publish many repos concurrently
+    workers are threads: the work happens in git subprocesses, so there is nothing to gain from processes
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    env = git_env(os.path.join(work_dir, ".ssh-control"))
+    start_time = time.monotonic()
+    results = {}
+
+    def run(repo):
+        return publish_repo(repo, work_dir, remote_template, reference, create_remote, needs_venv, env, store)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for repo, result in pool.map(run, repos):
+            results[repo] = result
+            print(f"{repo}: {result}")
+
+    published = sum(result == "published" for result in results.values())
+    print(f"\nPublished {published} of {len(results)} repos in {time.monotonic() - start_time:.1f}s")
+    return results
+
+
+def iter_failed_repos(filepath, chunksize=10_000):
+    # stream the build check results and only keep the rows that need fixing
+    for chunk in iter_csv(filepath, chunksize=chunksize):
+        failed = chunk[~chunk["status"].isin(["Success", "No requirements found"])]
+        yield from failed.itertuples(index=False, name=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish fixed repositories")
+    parser.add_argument('-w', '--workers', type=int, default=8, help='Repositories published concurrently')
+    parser.add_argument('--remote-template', default=DEFAULT_REMOTE_TEMPLATE,
+                        help='Push URL, {name} is replaced by owner_repo (a local path publishes to bare repos)')
+    parser.add_argument('--reference', default=None, help='Local mirror to borrow objects from when cloning')
+    parser.add_argument('--use-store', action='store_true', help='Borrow objects from the shared mirror store')
+    parser.add_argument('--no-create', action='store_true', help='Do not create the repositories on GitHub')
+    parser.add_argument('--venv', action='store_true', help='Create a venv in each checkout for the fix stage')
+    args = parser.parse_args()
+
+    if args.no_create:
+        # local bare repos are created on demand so the pipeline can be tested without GitHub
+        create = create_local_bare_repo if not args.remote_template.startswith(("git@", "https://")) else None
+    else:
+        create = create_new_github_repo
 
-os.chdir(ROOT)
-print("All repositories processed successfully.")
\ No newline at end of file
+    # List of GitHub repositories
+    filepath = os.path.join(ROOT, "output", "build_check_results.csv")
+    failed_repos = [repo for repo, status in iter_failed_repos(filepath)]
+    publish_repos(failed_repos, workers=args.workers, remote_template=args.remote_template,
+                  reference=args.reference, create_remote=create, needs_venv=args.venv,
+                  store=RepoStore() if args.use_store else None)
+    print("All repositories processed successfully.")
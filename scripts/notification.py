@@ -1,12 +1,312 @@
-async def notify(owner, repo, url, priority="low"):
+"""
+Notification dispatcher
+
+Long-running process that tells repository owners about their fixed repos. It keeps one authenticated Gmail
+service and one Tweepy client for the whole run and drains the notification_outbox queue (database/outbox.py):
+
+- tweet: repos with pushed_to_fork = TRUE and tweet_posted = FALSE, marked with tweet_posted / tweet_url when posted
+- email: repos with pushed_to_fork = TRUE and an email address in contributors (scripts/get_contributor_emails.py)
+
+Notifications are claimed from the outbox with a lease (SELECT ... FOR UPDATE SKIP LOCKED), so several dispatchers
+can run at once without double-posting, and status updates are written in batches.
+
+Every channel has a token bucket matched to its API quota (17 tweets per 24h, 240 emails per minute).
+Waits are computed, not fixed: a sender sleeps exactly until its next token is available, and an idle dispatcher
+sleeps until the next poll or until it is woken up (kill -USR1 <pid>), so a backlog drains at the maximum allowed rate.
+
+Usage:
+    (venv) python3 scripts/notification.py                 # run until interrupted
+    (venv) python3 scripts/notification.py --once          # drain what is pending now and exit
+    (venv) python3 scripts/notification.py --channels email --dry-run
+"""
+
+import os
+import sys
+import time
+import signal
+import asyncio
+import argparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.database_cmds import create_session, MYSQL_DATABASE
+from database.outbox import enqueue, claim_batch, complete_batch, release_batch, peek_batch, default_owner
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+class TokenBucket:
+    """
+    rate tokens per second, at most capacity saved up
+    acquire() sleeps exactly as long as it takes for the next token to arrive, never longer
+    """
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        self._refill()
+        wait = max(0.0, self.paused_until - time.monotonic())
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    async def acquire(self):
+        async with self._lock:
+            while (wait := self.wait_time()) > 0:
+                await asyncio.sleep(wait)
+            self.tokens -= 1
+
+    def refund(self):
+        # an acquired token that was not used
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds: float):
+        # the API said no (429), nothing goes out until its reset time and the saved up tokens are gone
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+###########################
+# CHANNELS
+###########################
+
+class TweetChannel:
+    name = "tweet"
+    # claimed one at a time, a claimed tweet is always sent right away
+    claim_size = 1
+
+    def __init__(self, dry_run=False):
+        # at most one saved up post, so no 24h window ever sees more than the limit
+        self.bucket = TokenBucket(rate=17 / DAY_SECONDS, capacity=1)
+        self.dry_run = dry_run
+        self.client = None
+
+    def connect(self):
+        from tweet_bot.tweet import create_client
+        if not self.dry_run:
+            self.client = create_client()
+
+    def send(self, row):
+        from tweet_bot.tweet import tweet_text, post_tweet
+        owner_name, repo_name = row["github_url"].rstrip("/").split("/")[-2:]
+        text = tweet_text(owner_name, repo_name, row["github_fork_url"])
+        if self.dry_run:
+            print(f"[dry run] tweet: {text!r}")
+            return None
+        return post_tweet(self.client, text)
+
+    def retry_after(self, error):
+        # seconds until the quota resets when error is a rate limit response, None otherwise
+        import tweepy
+        if isinstance(error, tweepy.errors.TooManyRequests):
+            reset = error.response.headers.get("x-rate-limit-reset") if error.response is not None else None
+            return max(1.0, int(reset) - time.time()) if reset else 15 * 60
+        return None
+
+
+class EmailChannel:
+    name = "email"
+    claim_size = 20
+
+    def __init__(self, dry_run=False):
+        # ~240 emails per minute, a second's worth can go out at once
+        self.bucket = TokenBucket(rate=4.0, capacity=4)
+        self.dry_run = dry_run
+        self.service = None
+
+    def connect(self):
+        from scripts.gmail_api import build_service
+        if not self.dry_run:
+            self.service = build_service()
+
+    @staticmethod
+    def recipient(contributors):
+        # most active contributor first (get_contributor_emails.py), skip GitHub's noreply addresses
+        for email in (contributors or "").split(","):
+            email = email.strip()
+            if "@" in email and not email.endswith("users.noreply.github.com") and not email.endswith("..."):
+                return email
+        return None
+
+    def send(self, row):
+        from scripts.gmail_api import send_email
+        owner_email = self.recipient(row["contributors"])
+        if owner_email is None:
+            raise ValueError("no usable email address in contributors")
+        repo_name = row["github_url"].rstrip("/").split("/")[-1]
+        if self.dry_run:
+            print(f"[dry run] email to {owner_email} about {repo_name}")
+            return owner_email
+        send_email(self.service, owner_email, repo_name, row["github_fork_url"])
+        return owner_email
+
+    def retry_after(self, error):
+        from googleapiclient.errors import HttpError
+        if isinstance(error, HttpError) and error.resp.status == 429:
+            return float(error.resp.get("retry-after", 60))
+        return None
+
+
+###########################
+# DISPATCHER
+###########################
+
+class Dispatcher:
+    def __init__(self, channels, poll_interval=300, batch_size=20, owner=None):
+        self.channels = channels
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.owner = owner or default_owner()
+        # set to poll right away (queue emptied, SIGUSR1), senders wait on work_available
+        self.wakeup = asyncio.Event()
+        self.work_available = asyncio.Condition()
+        self.session = None
+        self._db_lock = asyncio.Lock()
+        self.sent = {channel.name: 0 for channel in channels}
+
+    async def db(self, fn, *args):
+        # one session for the whole run, used from one worker thread at a time
+        async with self._db_lock:
+            return await asyncio.to_thread(fn, self.session, *args)
+
+    async def poll(self):
+        # move newly eligible repos into the outbox, returns how many were added
+        added = 0
+        for channel in self.channels:
+            added += await self.db(enqueue, channel.name)
+        async with self.work_available:
+            self.work_available.notify_all()
+        return added
+
+    async def wait_for_work(self):
+        self.wakeup.set()
+        async with self.work_available:
+            try:
+                await asyncio.wait_for(self.work_available.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def flush(self, channel, results, failures):
+        if results:
+            await self.db(complete_batch, channel.name, self.owner, results)
+        # (retry, count_attempt): failed sends, unusable notifications, rate limited ones (not an attempt)
+        for retry, count_attempt in ((True, True), (False, True), (True, False)):
+            batch = [(outbox_id, error) for outbox_id, error, retryable, counted in failures
+                     if (retryable, counted) == (retry, count_attempt)]
+            if batch:
+                await self.db(release_batch, self.owner, batch, retry, count_attempt)
+        results.clear()
+        failures.clear()
+
+    async def sender(self, channel, once):
+        claimed, results, failures = [], [], []
+        # lease long enough to send a whole claim at the channel's rate
+        lease_seconds = int(channel.claim_size / channel.bucket.rate) + 60
+        while True:
+            if not claimed and once and not await self.db(peek_batch, channel.name, 1):
+                # nothing left, do not wait for a token first
+                break
+            # the token comes first, so a claimed notification never sits waiting for the rate limit
+            await channel.bucket.acquire()
+            if not claimed:
+                claimed = await self.db(claim_batch, channel.name, self.owner, channel.claim_size, lease_seconds)
+                if not claimed:
+                    channel.bucket.refund()
+                    if once:
+                        break
+                    await self.wait_for_work()
+                    continue
+
+            row = claimed.pop(0)
+            try:
+                result = await asyncio.to_thread(channel.send, row)
+                results.append((row["outbox_id"], row["repo_id"], result))
+                self.sent[channel.name] += 1
+                print(f"{channel.name}: notified {row['github_url']}")
+            except Exception as e:
+                # ValueError: the notification itself is unusable, never worth retrying
+                retry_after = None if isinstance(e, ValueError) else channel.retry_after(e)
+                if retry_after is not None:
+                    print(f"{channel.name}: rate limited, pausing {retry_after:.0f}s")
+                    channel.bucket.pause(retry_after)
+                    # give back the rest of the claim too, other dispatchers are limited just the same
+                    failures.extend((r["outbox_id"], "rate limited", True, False) for r in [row] + claimed)
+                    claimed = []
+                else:
+                    print(f"{channel.name}: error notifying {row['github_url']}: {str(e)}")
+                    failures.append((row["outbox_id"], str(e), not isinstance(e, ValueError), True))
+
+            # a drained claim is written right after its last send, not after the wait for the next token:
+            # a sent notification must be marked done well within its lease
+            if not claimed or len(results) >= self.batch_size:
+                await self.flush(channel, results, failures)
+        await self.flush(channel, results, failures)
+
+    async def poller(self):
+        while True:
+            await self.poll()
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def dry_run(self):
+        # nothing is claimed or written, only what the next pass would send is printed
+        for channel in self.channels:
+            for row in await self.db(peek_batch, channel.name, 50):
+                try:
+                    channel.send(row)
+                except ValueError as e:
+                    print(f"[dry run] {channel.name}: skipping {row['github_url']}: {str(e)}")
+
+    async def run(self, once=False):
+        self.session, _ = create_session(MYSQL_DATABASE)
+        for channel in self.channels:
+            await asyncio.to_thread(channel.connect)
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, self.wakeup.set)
+        except (NotImplementedError, AttributeError, ValueError):
+            pass
+
+        start_time = time.monotonic()
+        try:
+            if all(channel.dry_run for channel in self.channels):
+                await self.dry_run()
+            elif once:
+                queued = await self.poll()
+                print(f"{queued} new notifications queued")
+                await asyncio.gather(*(self.sender(channel, once=True) for channel in self.channels))
+            else:
+                await asyncio.gather(self.poller(), *(self.sender(channel, once=False) for channel in self.channels))
+        finally:
+            self.session.close()
+            sent = ", ".join(f"{name}: {count}" for name, count in self.sent.items())
+            print(f"Notifications sent ({sent}) in {time.monotonic() - start_time:.0f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send rate limited notifications for fixed repositories")
+    parser.add_argument('--channels', nargs='+', choices=["tweet", "email"], default=["tweet", "email"])
+    parser.add_argument('--once', action='store_true', help='Drain the pending notifications and exit')
+    parser.add_argument('--poll-interval', type=float, default=300, help='Seconds between checks for new work when idle')
+    parser.add_argument('--dry-run', action='store_true', help='Print the notifications instead of sending them')
+    args = parser.parse_args()
+
+    channel_types = {"tweet": TweetChannel, "email": EmailChannel}
+    channels = [channel_types[name](dry_run=args.dry_run) for name in args.channels]
     try:
-        if priority == "high":
-            # Try Twitter first
-            await tweet_notification(owner, repo, url)
-        else:
-            # Default to email
-            await email_notification(owner, repo, url)
-    except TweepyException as e:
-        # Fallback to email if Twitter fails
-        print(f"Twitter notification failed, falling back to email: {e}")
-        await email_notification(owner, repo, url) 
\ No newline at end of file
+        asyncio.run(Dispatcher(channels, poll_interval=args.poll_interval).run(once=args.once))
+    except KeyboardInterrupt:
+        print("Stopped.")
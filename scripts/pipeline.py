@@ -0,0 +1,391 @@
+"""
+Per-repo pipeline runner
+
+Runs the stages of run_all.sh as a DAG of per-repo tasks instead of one script at a time over the whole corpus:
+
+    qualify ──> build ──(failed)──> fix ──> publish
+           └──> contributors
+
+- Streaming: a repo moves on to its next stage as soon as it finishes the previous one, so the end-to-end latency
+  of one repo is the sum of its own stage times, not the time the slowest stage takes over the whole table
+- Concurrent: every stage has its own pool (threads for network and subprocess work, processes for the fix
+  analysis), so builds, fixes and pushes of different repos, and the build and contributors of one repo, overlap
+- One process: every module is imported once, stages hand results to each other in memory instead of CSV files
+- Stateful: workers only compute, the coordinator writes each result to papers_and_code as it arrives and moves
+  the row through its stage/status columns (database/pipeline_state.py), marking it RUNNING when a stage starts
+- Resumable: rows are read back in id order and every repo continues at the stage it stopped at, RUNNING rows
+  (the previous run was killed) run that stage again. Only one pipeline may run against a table at a time.
+
+Notifications are not a stage: notification.py picks published repos up through the outbox at the API quotas.
+Issues are not per-repo work either and still run from run_all.sh (github_issue_scraper.py, classify_github_issue.py).
+
+Usage:
+    (venv) python3 scripts/pipeline.py --limit 100
+    (venv) python3 scripts/pipeline.py --stages qualify build      # stop after the original build check
+    Testing publish against local bare repositories (nothing is sent to GitHub):
+    (venv) python3 scripts/pipeline.py --remote-template /tmp/remotes/{name}.git --no-create
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from database.database_cmds import Table, create_session, escape_value, MYSQL_DATABASE, TABLE_NAME
+from database.pipeline_state import Stage, Status, state_sql
+from utils.metrics import REGISTRY, execute_sql
+
+STAGE_NAMES = ["qualify", "build", "fix", "publish", "contributors"]
+BUILD_OK = ("Success", "No requirements found")
+
+# papers_and_code columns read to resume a repo (id comes first, see Table.iter_rows)
+ROW_COLUMNS = ["id", "github_url", "stage", "status", "build_sys_type", "contributors", "deps_last_commit_date"]
+
+# rows that still have a stage to run, everything else is finished (skipped, built fine, fix failed, published)
+RESUME_WHERE = f"""github_url IS NOT NULL AND deleted_at IS NULL AND (
+    status IN ({int(Status.PENDING)}, {int(Status.RUNNING)})
+    OR (stage = {int(Stage.QUALIFY)} AND status = {int(Status.OK)})
+    OR (stage = {int(Stage.BUILD)} AND status = {int(Status.FAILED)})
+    OR (stage = {int(Stage.FIX)} AND status = {int(Status.OK)}))"""
+
+
+def resume_stages(item):
+    # stages to start for a row read from the table, from its stage/status
+    stage, status = item["stage"], item["status"]
+    if status in (Status.PENDING, Status.RUNNING):
+        # interrupted: run that stage again
+        rerun = {Stage.FIND: "qualify", Stage.QUALIFY: "qualify", Stage.BUILD: "build",
+                 Stage.FIX: "fix", Stage.PUBLISH: "publish"}
+        return [rerun[stage]] if stage in rerun else []
+    if stage == Stage.QUALIFY and status == Status.OK:
+        return ["build"] + ([] if "@" in (item["contributors"] or "") else ["contributors"])
+    if stage == Stage.BUILD and status == Status.FAILED:
+        return ["fix"]
+    if stage == Stage.FIX and status == Status.OK:
+        return ["publish"]
+    return []
+
+
+def batch_fix_dependencies():
+    # batch_fix_dependencies imports its siblings as top-level modules
+    package_dir = os.path.join(ROOT, "smart_package_versioning")
+    if package_dir not in sys.path:
+        sys.path.append(package_dir)
+    import batch_fix_dependencies
+    return batch_fix_dependencies
+
+
+def fork_url(remote_url):
+    # web URL of the published fork, for the tweets and emails
+    if remote_url.startswith("git@github.com:"):
+        return "https://github.com/" + remote_url.removeprefix("git@github.com:").removesuffix(".git")
+    return remote_url
+
+###########################
+# WORKER FUNCTIONS
+# item -> result, no database access, imports are local so a stage only loads what it uses
+###########################
+
+def run_qualify(item):
+    from database.database_cmds import qualify_repo
+    # contributors come from the git history in their own stage
+    return qualify_repo(item["github_url"], with_contributors=False)
+
+
+def run_build(item):
+    from scripts.build_check import build_status, check_repo, parse_conda_env
+    content = item.get("deps_file_content_orig")
+    if content is None:
+        return check_repo(item["github_url"])[1]
+    if item.get("build_sys_type") == "conda":
+        content = parse_conda_env(content)
+    return build_status(content)
+
+
+def run_fix(item):
+    candidate = (item["id"], item["github_url"], item.get("deps_last_commit_date"))
+    return batch_fix_dependencies().process_candidate(candidate)
+
+
+def run_publish(item, remote_template, create_remote, env=None, store=None):
+    from scripts.new_repo import publish_repo, fork_name, WORK_DIR
+    _, outcome = publish_repo(item["github_url"], WORK_DIR, remote_template, create_remote=create_remote,
+                              env=env, store=store, fixed_requirements=item["fixed_requirements"])
+    return outcome, fork_url(remote_template.format(name=fork_name(item["github_url"])))
+
+
+def run_contributors(item):
+    from scripts.get_contributor_emails import extract_contributors
+    return extract_contributors((item["id"], item["github_url"]))
+
+###########################
+# WRITE FUNCTIONS
+# (session, table, item, result) -> next stages, run by the coordinator as each result arrives
+###########################
+
+def set_state(session, table, item, stage, status, assignments=""):
+    execute_sql(session, f"""
+    UPDATE {table.table_name}
+    SET {assignments}{state_sql(stage, status)}
+    WHERE id = {int(item['id'])}""")
+    session.commit()
+
+
+def write_qualify(session, table, item, info):
+    if info is None:
+        set_state(session, table, item, Stage.QUALIFY, Status.FAILED)
+        return []
+    for cmd in table.qualify_cmds(item["id"], info):
+        execute_sql(session, cmd)
+    session.commit()
+    if info["build_sys_type"] == "Not found":
+        return []
+    for key in ("build_sys_type", "deps_file_content_orig", "deps_last_commit_date"):
+        item[key] = info[key]
+    return ["build", "contributors"]
+
+
+def write_build(session, table, item, build_status):
+    ok = build_status in BUILD_OK
+    set_state(session, table, item, Stage.BUILD, Status.OK if ok else Status.FAILED,
+              f"build_status_orig = {escape_value(build_status[:255])}, datetime_latest_build = NOW(), "
+              f"num_build_attempts = num_build_attempts + 1, ")
+    # the original file is not needed past the build
+    item.pop("deps_file_content_orig", None)
+    return [] if ok else ["fix"]
+
+
+def write_fix(session, table, item, result):
+    if not result["content"]:
+        set_state(session, table, item, Stage.FIX, Status.FAILED)
+        return []
+    batch_fix_dependencies().write_results([result], table_name=table.table_name,
+                                           deps_table_name=table.deps_table_name, session=session)
+    item["fixed_requirements"] = result["content"]
+    return ["publish"]
+
+
+def write_publish(session, table, item, result):
+    outcome, url = result
+    if outcome != "published":
+        print(f"{item['github_url']}: {outcome}")
+        set_state(session, table, item, Stage.PUBLISH, Status.FAILED)
+        return []
+    set_state(session, table, item, Stage.PUBLISH, Status.OK,
+              f"pushed_to_fork = TRUE, github_fork_url = {escape_value(url)}, ")
+    return []
+
+
+def write_contributors(session, table, item, result):
+    from scripts.get_contributor_emails import write_contributors as write_rows
+    write_rows([result], session=session)
+    return []
+
+###########################
+# PIPELINE
+###########################
+
+class PipelineStage:
+    def __init__(self, name, run, write, workers=4, processes=False, db_stage=None):
+        """
+        run: worker function item -> result (module level, it is pickled when processes is set)
+        write: coordinator function (session, table, item, result) -> names of the next stages
+        db_stage: Stage the row is in while this stage runs, None for side branches that leave stage/status alone
+        """
+        self.name = name
+        self.run = run
+        self.write = write
+        self.workers = workers
+        self.processes = processes
+        self.db_stage = db_stage
+        self.executor = None
+
+    def start(self):
+        if self.processes:
+            # spawn, forking the threaded coordinator could copy a held lock into the child
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+
+
+class Pipeline:
+    def __init__(self, stages, table_name=TABLE_NAME, db_name=MYSQL_DATABASE, max_in_flight=64):
+        """
+        stages: the enabled PipelineStage objects, a repo whose next stage is not enabled stops there
+        max_in_flight: repos with work in progress, new rows are only read from the table below this
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        self.table = Table(table_name, db_name)
+        self.max_in_flight = max_in_flight
+        self.session = None
+        self.pending = {}       # future -> (stage, item, start time)
+        self.in_flight = {}     # repo id -> tasks of that repo not finished yet
+        self.stats = {name: {"done": 0, "failed": 0, "seconds": 0.0} for name in self.stages}
+        self.latencies = []
+
+    def load_deps(self, item, column):
+        row = execute_sql(self.session, f"""
+        SELECT {column} FROM {self.table.deps_table_name}
+        WHERE id = {int(item['id'])}""").fetch_one()
+        return row[0] if row else None
+
+    def start_row(self, row):
+        item = dict(zip(ROW_COLUMNS, row))
+        item["stage"], item["status"] = Stage(item["stage"]), Status(item["status"])
+        item["started"] = time.monotonic()
+        names = [name for name in resume_stages(item) if name in self.stages]
+        # dependency files are not part of the row, fetch them for stages resumed past qualify
+        if "build" in names:
+            item["deps_file_content_orig"] = self.load_deps(item, "deps_file_content_orig")
+        if "publish" in names:
+            item["fixed_requirements"] = self.load_deps(item, "deps_file_content_edited")
+        for name in names:
+            self.submit(name, item)
+
+    def submit(self, name, item):
+        if name not in self.stages:
+            return
+        stage = self.stages[name]
+        if stage.db_stage is not None:
+            set_state(self.session, self.table, item, stage.db_stage, Status.RUNNING)
+        future = stage.executor.submit(stage.run, item)
+        self.pending[future] = (stage, item, time.monotonic())
+        self.in_flight[item["id"]] = self.in_flight.get(item["id"], 0) + 1
+
+    def finish(self, future):
+        stage, item, started = self.pending.pop(future)
+        stats = self.stats[stage.name]
+        seconds = time.monotonic() - started
+        stats["seconds"] += seconds
+        # queue wait included, the worker's own calls are in the http/db/pip metrics
+        REGISTRY.observe("pipeline_stage_seconds", seconds, stage=stage.name)
+        next_stages = []
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Error in {stage.name} for {item['github_url']}: {str(e)}")
+            stats["failed"] += 1
+            REGISTRY.inc("pipeline_stage_errors_total", stage=stage.name, error=type(e).__name__)
+            if stage.db_stage is not None:
+                set_state(self.session, self.table, item, stage.db_stage, Status.FAILED)
+        else:
+            stats["done"] += 1
+            try:
+                next_stages = stage.write(self.session, self.table, item, result)
+            except Exception as e:
+                # the row stays RUNNING and this stage runs again on the next run
+                print(f"Error writing {stage.name} result for {item['github_url']}: {str(e)}")
+                self.session.rollback()
+        for name in next_stages:
+            self.submit(name, item)
+
+        self.in_flight[item["id"]] -= 1
+        if not self.in_flight[item["id"]]:
+            del self.in_flight[item["id"]]
+            self.latencies.append(time.monotonic() - item["started"])
+            REGISTRY.observe("pipeline_repo_seconds", self.latencies[-1])
+
+    def run(self, limit=None):
+        start_time = time.monotonic()
+        self.session, _ = create_session(self.table.db_name)
+        rows = self.table.iter_rows(", ".join(ROW_COLUMNS[1:]), where=RESUME_WHERE, limit=limit)
+        exhausted = False
+        for stage in self.stages.values():
+            stage.start()
+        try:
+            while True:
+                # read rows lazily, only as many as there is room for
+                while not exhausted and len(self.in_flight) < self.max_in_flight:
+                    row = next(rows, None)
+                    if row is None:
+                        exhausted = True
+                    else:
+                        self.start_row(row)
+                if not self.pending:
+                    break
+                done, _ = wait(self.pending, return_when=FIRST_COMPLETED)
+                finished = len(self.latencies)
+                for future in done:
+                    self.finish(future)
+                if len(self.latencies) // 100 > finished // 100:
+                    print(f"-- Repos finished: {len(self.latencies)}, in flight: {len(self.in_flight)}, "
+                          f"{time.monotonic() - start_time:.0f}s --")
+        finally:
+            # interrupted tasks stay RUNNING and are picked up again by the next run
+            for stage in self.stages.values():
+                stage.executor.shutdown(wait=True, cancel_futures=True)
+            rows.close()
+            self.session.close()
+        self.report(time.monotonic() - start_time)
+        return True
+
+    def report(self, elapsed):
+        print(f"\nRepos finished: {len(self.latencies)} in {elapsed:.1f}s")
+        for name, stats in self.stats.items():
+            tasks = stats["done"] + stats["failed"]
+            average = stats["seconds"] / tasks if tasks else 0.0
+            print(f"  {name:<13} {stats['done']:>6} done, {stats['failed']:>4} errors, {average:7.1f}s per repo")
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print(f"  end-to-end per repo: p50 {p50:.1f}s, p95 {p95:.1f}s, max {latencies[-1]:.1f}s")
+        # where the time went: GitHub and PyPI requests, database statements, pip installs, LLM calls
+        REGISTRY.print_summary()
+
+
+def build_stages(names, build_workers=4, fix_workers=4, publish_workers=8,
+                 remote_template=None, no_create=False, use_store=False):
+    stages = []
+    if "qualify" in names:
+        stages.append(PipelineStage("qualify", run_qualify, write_qualify, workers=8, db_stage=Stage.QUALIFY))
+    if "build" in names:
+        stages.append(PipelineStage("build", run_build, write_build, workers=build_workers, db_stage=Stage.BUILD))
+    if "fix" in names:
+        stages.append(PipelineStage("fix", run_fix, write_fix, workers=fix_workers, processes=True,
+                                    db_stage=Stage.FIX))
+    if "publish" in names:
+        from scripts.new_repo import (create_new_github_repo, create_local_bare_repo, git_env,
+                                      DEFAULT_REMOTE_TEMPLATE, WORK_DIR)
+        from utils.repo_store import RepoStore
+        remote_template = remote_template or DEFAULT_REMOTE_TEMPLATE
+        if no_create:
+            create = create_local_bare_repo if not remote_template.startswith(("git@", "https://")) else None
+        else:
+            create = create_new_github_repo
+        os.makedirs(WORK_DIR, exist_ok=True)
+        run = partial(run_publish, remote_template=remote_template, create_remote=create,
+                      env=git_env(os.path.join(WORK_DIR, ".ssh-control")),
+                      store=RepoStore() if use_store else None)
+        stages.append(PipelineStage("publish", run, write_publish, workers=publish_workers,
+                                    db_stage=Stage.PUBLISH))
+    if "contributors" in names:
+        stages.append(PipelineStage("contributors", run_contributors, write_contributors, workers=4))
+    return stages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the repo pipeline, streaming each repo through its stages")
+    parser.add_argument('--stages', nargs='+', choices=STAGE_NAMES, default=STAGE_NAMES, help='Stages to run')
+    parser.add_argument('-l', '--limit', type=int, default=None, help='Maximum number of repos to read')
+    parser.add_argument('--in-flight', type=int, default=64, help='Repos with work in progress at once')
+    parser.add_argument('--build-workers', type=int, default=4, help='Concurrent build checks')
+    parser.add_argument('--fix-workers', type=int, default=min(os.cpu_count(), 8), help='Fix worker processes')
+    parser.add_argument('--remote-template', default=None,
+                        help='Push URL, {name} is replaced by owner_repo (a local path publishes to bare repos)')
+    parser.add_argument('--no-create', action='store_true', help='Do not create the repositories on GitHub')
+    parser.add_argument('--use-store', action='store_true', help='Borrow objects from the shared mirror store')
+    args = parser.parse_args()
+
+    stages = build_stages(args.stages, build_workers=args.build_workers, fix_workers=args.fix_workers,
+                          remote_template=args.remote_template, no_create=args.no_create, use_store=args.use_store)
+    try:
+        Pipeline(stages, max_in_flight=args.in_flight).run(limit=args.limit)
+    except KeyboardInterrupt:
+        print("Stopped, interrupted repos resume on the next run.")
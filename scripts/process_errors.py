@@ -1,32 +1,57 @@
+"""
+Fix the failed builds of output/build_check_results.csv with PyPI release dates and GPT
+
+Nothing runs at import time: the GitHub and OpenAI clients (and the libraries behind them) are created on first use,
+so the helpers can be imported cheaply and the whole workload only runs through main().
+
+Usage:
+    (venv) python3 scripts/process_errors.py
+"""
+
 import os
-import subprocess
-import time
-from github import Github
-import requests
+import sys
+import argparse
+from functools import lru_cache
 from dotenv import load_dotenv
-import instructor
-from pydantic import BaseModel
-from openai import OpenAI
-import pandas as pd
 
 # Load environment variables from .env file
 load_dotenv()
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from utils.metrics import instrument, http_get
 
 # Get GitHub personal access token and OpenAI API key from environment variables
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-# Initialize GitHub API client
-g = Github(GITHUB_TOKEN)
+BUILD_CHECK_RESULTS = os.path.join(ROOT, "output", "build_check_results.csv")
+OUTPUT_FILE = os.path.join(ROOT, "output", "updated_requirements_results.csv")
+
+
+@lru_cache(maxsize=None)
+def get_github():
+    # Initialize GitHub API client
+    from github import Github
+    return Github(GITHUB_TOKEN)
 
-# Initialize OpenAI client
-client = instructor.from_openai(OpenAI(api_key=OPENAI_API_KEY))
 
-# Define the Pydantic model to hold structured responses
-class UpdateSuggestion(BaseModel):
-    file_name: str
-    suggestion: str
+@lru_cache(maxsize=None)
+def get_client():
+    # Initialize OpenAI client
+    import instructor
+    from openai import OpenAI
+    return instructor.from_openai(OpenAI(api_key=OPENAI_API_KEY))
+
+
+@lru_cache(maxsize=None)
+def update_suggestion_model():
+    from pydantic import BaseModel
+
+    # Define the Pydantic model to hold structured responses
+    class UpdateSuggestion(BaseModel):
+        file_name: str
+        suggestion: str
+    return UpdateSuggestion
 
 # Function to check if the requirement file has version numbers or not
 def has_versions(requirements_content):
@@ -45,7 +70,7 @@ def get_version_at_date(package_name, commit_date):
     pypi_url = f'https://pypi.org/pypi/{package_name}/json'
 
     try:
-        response = requests.get(pypi_url)
+        response = http_get(pypi_url)
         if response.status_code == 200:
             data = response.json()
             releases = data.get('releases', {})
@@ -96,6 +121,7 @@ def find_requirements_file(repo):
     return None
 
 # Function to check and update the requirements file using OpenAI
+@instrument("llm_request", model="gpt-4", caller="process_errors")
 def check_and_update_requirements(requirements_text):
     prompt = f"This is the requirement.txt : " + requirements_text + ", see if the packages work together and return the updated requirement.txt with fixed versions"
 
@@ -113,10 +139,10 @@ def check_and_update_requirements(requirements_text):
     full_prompt = system_prompt + "\n\n" + prompt  # Limit the content sent to GPT to 1000 characters for now
 
     # Call the GPT-4 model with Instructor to analyze the files and return structured output
-    response = client.chat.completions.create(
+    response = get_client().chat.completions.create(
         model="gpt-4",
         messages=[{"role": "user", "content": full_prompt}],
-        response_model=UpdateSuggestion  # Use the Pydantic model to ensure structured output
+        response_model=update_suggestion_model()  # Use the Pydantic model to ensure structured output
     )
 
     # Get the suggestions
@@ -148,7 +174,7 @@ def process_repository(repo_url):
 
     try:
         # Get the repository
-        repo = g.get_repo(repo_name)
+        repo = get_github().get_repo(repo_name)
 
         # Search for requirements.txt or similar file
         file_path = find_requirements_file(repo)
@@ -186,25 +212,36 @@ def process_repository(repo_url):
         print(f"Error processing {repo_name}: {str(e)}")
         return None
 
-# Read the build_check_results.csv file
-filepath = os.path.join(ROOT, "output", "build_check_results.csv")
-df = pd.read_csv(filepath)
+def main(filepath=BUILD_CHECK_RESULTS, output_file=OUTPUT_FILE):
+    import pandas as pd
+    from utils.csv_io import iter_csv
+
+    # Filter the repositories that do not have "success" status
+    error_repos = [
+        repo
+        for chunk in iter_csv(filepath, usecols=['file_or_repo', 'status'])
+        for repo in chunk[~chunk['status'].str.contains("success", case=False)]['file_or_repo']
+    ]
+
+    # List to store the results
+    results = []
 
-# Filter the repositories that do not have "success" status
-error_repos = df[~df['status'].str.contains("success", case=False)]['file_or_repo'].tolist()
+    # Process each repository with errors and save the result to the list
+    for repo_url in error_repos:
+        gpt_output = process_repository(repo_url)
+        if gpt_output:
+            results.append({'github_link': repo_url, 'updated_requirements': gpt_output})
 
-# List to store the results
-results = []
+    # Convert the results to a DataFrame and save as CSV
+    results_df = pd.DataFrame(results)
+    results_df.to_csv(output_file, index=False)
+    return results
 
-# Process each repository with errors and save the result to the list
-for repo_url in error_repos:
-    gpt_output = process_repository(repo_url)
-    if gpt_output:
-        results.append({'github_link': repo_url, 'updated_requirements': gpt_output})
 
-# Convert the results to a DataFrame and save as CSV
-results_df = pd.DataFrame(results)
-output_file = os.path.join(ROOT, "output", "updated_requirements_results.csv")
-results_df.to_csv(output_file, index=False)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fix failed builds with PyPI release dates and GPT")
+    parser.add_argument('--input', default=BUILD_CHECK_RESULTS, help='Build check results CSV')
+    parser.add_argument('--output', default=OUTPUT_FILE, help='CSV the updated requirements are written to')
+    args = parser.parse_args()
 
-print("The updated requirements have been saved to updated_requirements_results.csv")
\ No newline at end of file
+    main(args.input, args.output)
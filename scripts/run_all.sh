@@ -16,32 +16,23 @@ if ! source "${ROOT}/venv/bin/activate"; then
     exit 1
 fi
 
-# takes a few minutes to run on all 250+ repos
+# issues are harvested and classified next to the pipeline, they do not depend on its per-repo stages
 echo
-python3 "$ROOT"/scripts/build_check.py
-sleep 0.5
+(python3 "$ROOT"/scripts/github_issue_scraper.py && python3 "$ROOT"/scripts/classify_github_issue.py) &
+issues_pid=$!
 
+# qualify, build check, fix, publish and contributor emails, each repo streamed through its stages
+# (resumes where the last run stopped, see scripts/pipeline.py)
 echo
-python3 "$ROOT"/scripts/github_issue_scraper.py
-sleep 0.5
-
-echo
-python3 "$ROOT"/scripts/classify_github_issue.py
-sleep 0.5
-
-echo
-python3 "$ROOT"/scripts/new_repo.py
-sleep 0.5
+python3 "$ROOT"/scripts/pipeline.py
 
 # Rate limits with 3000+ second backoff period
 # echo
 # python3 "$ROOT"/scripts/process_errors.py
-# sleep 0.5
 
+# emails go out at the Gmail quota, tweets (17 per 24h) are left to a long-running
+# python3 "$ROOT"/scripts/notification.py --channels tweet
 echo
-python3 "$ROOT"/scripts/get_contributor_emails.py
-sleep 0.5
+python3 "$ROOT"/scripts/notification.py --once --channels email
 
-echo
-python3 "$ROOT"/scripts/tweet.py
-sleep 0.5
+wait "$issues_pid"
@@ -0,0 +1,367 @@
+'''
+WHAT DOES THIS DO?
+
+Offline index of the public API of every (package, version) in a local mirror of wheels/sdists. It answers the question
+ask_gpt was guessing at: in which versions of a package do all the attributes found by ImportUsageVisitor exist?
+
+The index is built by static inspection only (nothing is imported or installed). Every .py/.pyi file inside the archive
+is parsed with ast and its public top-level names (functions, classes, assignments, re-exports, __all__, star imports)
+are recorded as dotted names, e.g. torch.nn.Linear or numpy.array.
+
+Storage is compact: per import name, the dotted names are interned once in a sorted list and each one carries a bitset
+over the sorted versions of the package (bit i set -> present in versions[i]). The whole thing is a gzipped JSON file.
+Finding the versions that contain every used attribute is an AND over a handful of integers.
+
+To run:
+    (venv) python3 smart_package_versioning/api_index.py --build /path/to/wheel_mirror
+    (venv) python3 smart_package_versioning/api_index.py --query numpy numpy.asscalar numpy.float
+'''
+
+import os
+import ast
+import sys
+import gzip
+import json
+import tarfile
+import zipfile
+import argparse
+from itertools import groupby
+from collections import defaultdict
+
+from packaging.specifiers import SpecifierSet
+from packaging.utils import canonicalize_name, parse_wheel_filename, parse_sdist_filename
+from packaging.version import Version, InvalidVersion
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_INDEX_FILE = os.path.join(ROOT, "data", "api_index.json.gz")
+
+# Top-level directories in sdists that are never part of the installed package
+SDIST_SKIP_DIRS = {"tests", "test", "docs", "doc", "examples", "benchmarks", "scripts", "tools", "build"}
+
+###########################
+# STATIC INSPECTION
+###########################
+
+class PublicNameVisitor(ast.NodeVisitor):
+    """
+    collects the public names bound at the top level of one module
+    star imports are kept aside and resolved once the whole package has been read
+    """
+    def __init__(self, module, is_package):
+        self.module = module
+        self.package = module if is_package else module.rpartition('.')[0]
+        self.names = set()
+        self.dunder_all = None
+        self.star_imports = []
+
+    def resolve(self, node):
+        # absolute module name of an ImportFrom, handling relative imports
+        if not node.level:
+            return node.module
+        base = self.package.split('.')
+        if node.level > 1:
+            base = base[:-(node.level - 1)]
+        return '.'.join(base + ([node.module] if node.module else []))
+
+    def add(self, name):
+        if name and not name.startswith('_'):
+            self.names.add(name)
+
+    def visit_Module(self, node):
+        # only look at top-level statements (and the bodies of top-level if/try blocks)
+        for stmt in node.body:
+            self.visit_statement(stmt)
+
+    def visit_statement(self, stmt):
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            self.add(stmt.name)
+        elif isinstance(stmt, (ast.Assign, ast.AnnAssign)):
+            targets = stmt.targets if isinstance(stmt, ast.Assign) else [stmt.target]
+            for target in targets:
+                for node in ast.walk(target):
+                    if isinstance(node, ast.Name):
+                        if node.id == '__all__' and isinstance(stmt.value, (ast.List, ast.Tuple)):
+                            self.dunder_all = [elt.value for elt in stmt.value.elts
+                                               if isinstance(elt, ast.Constant) and isinstance(elt.value, str)]
+                        self.add(node.id)
+        elif isinstance(stmt, ast.Import):
+            for alias in stmt.names:
+                if alias.asname:
+                    self.add(alias.asname)
+        elif isinstance(stmt, ast.ImportFrom):
+            for alias in stmt.names:
+                if alias.name == '*':
+                    self.star_imports.append(self.resolve(stmt))
+                else:
+                    self.add(alias.asname or alias.name)
+        elif isinstance(stmt, (ast.If, ast.Try)):
+            for child in stmt.body + stmt.orelse + getattr(stmt, 'finalbody', []):
+                self.visit_statement(child)
+            for handler in getattr(stmt, 'handlers', []):
+                for child in handler.body:
+                    self.visit_statement(child)
+
+    def exported(self):
+        return set(self.dunder_all) if self.dunder_all is not None else self.names
+
+def module_name(path):
+    """
+    dotted module name for a path inside an archive, None if it isn't a python module
+    pkg/sub/__init__.py -> (pkg.sub, True), pkg/sub/mod.py -> (pkg.sub.mod, False)
+    """
+    for suffix in ('.pyi', '.py'):
+        if path.endswith(suffix):
+            parts = path[:-len(suffix)].split('/')
+            if not all(part.isidentifier() for part in parts):
+                return None
+            if parts[-1] == '__init__':
+                return '.'.join(parts[:-1]), True
+            return '.'.join(parts), False
+    return None
+
+def archive_modules(archive_path):
+    """
+    yields (relative path, source bytes) for every python file in a wheel or sdist
+    sdist paths are stripped of the leading name-version/ (and src/) directory
+    """
+    if archive_path.endswith('.whl'):
+        with zipfile.ZipFile(archive_path) as zf:
+            for path in zf.namelist():
+                if path.endswith(('.py', '.pyi')) and '.dist-info/' not in path and '.data/' not in path:
+                    yield path, zf.read(path)
+    elif archive_path.endswith(('.tar.gz', '.zip')):
+        opener = zipfile.ZipFile if archive_path.endswith('.zip') else tarfile.open
+        with opener(archive_path) as archive:
+            members = archive.namelist() if isinstance(archive, zipfile.ZipFile) else \
+                [m.name for m in archive.getmembers() if m.isfile()]
+            for path in members:
+                parts = path.split('/')[1:]
+                if parts and parts[0] == 'src':
+                    parts = parts[1:]
+                if len(parts) < 2 or parts[0] in SDIST_SKIP_DIRS or not path.endswith(('.py', '.pyi')):
+                    continue
+                if isinstance(archive, zipfile.ZipFile):
+                    source = archive.read(path)
+                else:
+                    source = archive.extractfile(path).read()
+                yield '/'.join(parts), source
+
+def inspect_archive(archive_path):
+    """
+    public dotted names exported by one archive, grouped by top-level import name
+    {import_name: {"numpy", "numpy.array", "numpy.linalg", "numpy.linalg.norm", ...}}
+    """
+    visitors = {}
+    for path, source in archive_modules(archive_path):
+        parsed = module_name(path)
+        if not parsed:
+            continue
+        module, is_package = parsed
+        visitor = PublicNameVisitor(module, is_package)
+        try:
+            visitor.visit(ast.parse(source.replace(b'async=', b'async_='), filename=path))
+        except (SyntaxError, ValueError):
+            pass
+        # .pyi stubs and .py files of the same module are merged
+        if module in visitors:
+            visitors[module].names |= visitor.names
+            visitors[module].star_imports += visitor.star_imports
+        else:
+            visitors[module] = visitor
+
+    # resolve star imports a few rounds deep (package __init__ files commonly chain them)
+    exports = {module: visitor.exported() for module, visitor in visitors.items()}
+    for _ in range(5):
+        changed = False
+        for module, visitor in visitors.items():
+            for source_module in visitor.star_imports:
+                new_names = exports.get(source_module, set()) - visitor.names
+                if new_names:
+                    visitor.names |= new_names
+                    if visitor.dunder_all is None:
+                        exports[module] = visitor.names
+                    changed = True
+        if not changed:
+            break
+
+    by_import = defaultdict(set)
+    for module, visitor in visitors.items():
+        top_level = module.split('.')[0]
+        # submodules are attributes of their parent package too
+        by_import[top_level].add(module)
+        by_import[top_level].update(f"{module}.{name}" for name in visitor.names)
+    return by_import
+
+###########################
+# INDEX
+###########################
+
+class ApiIndex:
+    """
+    {import_name: {"dist": dist, "versions": [v0, v1, ...], "names": [n0, n1, ...], "bits": [hex, hex, ...]}}
+    bits[j] is the bitset over versions for names[j]
+    """
+    def __init__(self, path=DEFAULT_INDEX_FILE):
+        self.path = path
+        self.packages = {}
+        if os.path.exists(path):
+            with gzip.open(path, 'rt') as f:
+                self.packages = json.load(f)
+        self._bits = {}
+
+    def __contains__(self, import_name):
+        return import_name in self.packages
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with gzip.open(self.path, 'wt') as f:
+            json.dump(self.packages, f, separators=(',', ':'))
+
+    def name_bits(self, import_name):
+        # {dotted name: int bitset}, decoded once per package
+        if import_name not in self._bits:
+            entry = self.packages[import_name]
+            self._bits[import_name] = {name: int(bits, 16) for name, bits in zip(entry["names"], entry["bits"])}
+        return self._bits[import_name]
+
+    def add(self, import_name, dist, version, names):
+        """
+        add (or replace) one version of a package, for late additions to a built index
+        """
+        self.add_versions(import_name, dist, {version: names})
+
+    def add_versions(self, import_name, dist, names_by_version):
+        """
+        add (or replace) several versions of a package, {version: names}
+        the existing bitsets are decoded and the new ones encoded once per call, because inserting a version shifts
+        the bit positions
+        """
+        entry = self.packages.get(import_name, {"dist": dist, "versions": [], "names": [], "bits": []})
+        old_versions = entry["versions"]
+        members = defaultdict(set)
+        for name, bits in zip(entry["names"], entry["bits"]):
+            bits = int(bits, 16)
+            members[name] = {v for i, v in enumerate(old_versions) if bits >> i & 1 and v not in names_by_version}
+        for version, names in names_by_version.items():
+            for name in names:
+                members[name].add(version)
+
+        versions = sorted(set(old_versions) | set(names_by_version), key=Version)
+        position = {v: i for i, v in enumerate(versions)}
+        sorted_names = sorted(name for name in members if members[name])
+        entry["versions"] = versions
+        entry["names"] = sorted_names
+        entry["bits"] = [format(sum(1 << position[v] for v in members[name]), 'x') for name in sorted_names]
+        self.packages[import_name] = entry
+        self._bits.pop(import_name, None)
+
+    def versions_with(self, import_name, used_names):
+        """
+        versions in which every used name exists
+        names that no indexed version has at all (dynamic attributes, C extensions) can't be judged and are ignored
+        returns (list of versions, list of ignored names)
+        """
+        entry = self.packages[import_name]
+        bits_by_name = self.name_bits(import_name)
+        mask = (1 << len(entry["versions"])) - 1
+        unknown = []
+        for name in used_names:
+            bits = bits_by_name.get(name)
+            if bits is None:
+                unknown.append(name)
+            else:
+                mask &= bits
+        return [v for i, v in enumerate(entry["versions"]) if mask >> i & 1], unknown
+
+    def version_range(self, import_name, used_names):
+        """
+        longest contiguous run of versions that contain every used name, newest run on ties
+        returns a specifier string like >=1.2.0,<=1.5.3 (or None) and the list of ignored names
+        """
+        if import_name not in self.packages:
+            return None, list(used_names)
+        matching, unknown = self.versions_with(import_name, used_names)
+        if not matching:
+            return None, unknown
+        versions = self.packages[import_name]["versions"]
+        matching = set(matching)
+        best, run = [], []
+        for version in versions:
+            if version in matching:
+                run.append(version)
+                if len(run) >= len(best):
+                    best = list(run)
+            else:
+                run = []
+        return f">={best[0]},<={best[-1]}", unknown
+
+def constraints_from_index(usage_dict, index, dist_lookup):
+    """
+    {dist: SpecifierSet} for every used package the index knows about
+    dist_lookup maps an import name to the dist name used by the solver (version_solver.dist_for_import)
+    """
+    constraints = {}
+    for import_name, uses in usage_dict.items():
+        spec, _ = index.version_range(import_name, uses)
+        dist = dist_lookup(import_name)
+        if spec and dist:
+            constraints[dist] = SpecifierSet(spec)
+    return constraints
+
+def build_index(mirror_dir, index=None):
+    """
+    walk a directory of wheels/sdists and add every (package, version) to the index
+    one archive per version is enough, wheels are preferred over sdists
+    """
+    index = index or ApiIndex()
+    archives = {}
+    for root, _, files in os.walk(mirror_dir):
+        for file in sorted(files):
+            try:
+                if file.endswith('.whl'):
+                    dist, version, _, _ = parse_wheel_filename(file)
+                elif file.endswith(('.tar.gz', '.zip')):
+                    dist, version = parse_sdist_filename(file)
+                else:
+                    continue
+            except (ValueError, InvalidVersion):
+                continue
+            key = (canonicalize_name(dist), str(version))
+            if key not in archives or file.endswith('.whl'):
+                archives[key] = os.path.join(root, file)
+
+    # the names of every version of a dist are collected first and its bitsets are encoded once
+    # (ApiIndex.add per version would decode and re-encode them for each version)
+    for dist, dist_archives in groupby(sorted(archives.items()), key=lambda item: item[0][0]):
+        names_by_import = defaultdict(dict)
+        for (_, version), archive_path in dist_archives:
+            try:
+                for import_name, names in inspect_archive(archive_path).items():
+                    names_by_import[import_name][version] = names
+                print(f"Indexed {dist}=={version}")
+            except Exception as e:
+                print(f"Error indexing {archive_path}: {str(e)}")
+        for import_name, names_by_version in names_by_import.items():
+            index.add_versions(import_name, dist, names_by_version)
+    return index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline API-surface index per package version")
+    parser.add_argument('--build', metavar='MIRROR_DIR', help='Directory of wheels/sdists to index')
+    parser.add_argument('--query', nargs='+', metavar=('IMPORT_NAME', 'ATTR'), help='Version range containing all attributes')
+    parser.add_argument('--index', default=DEFAULT_INDEX_FILE, help='Path to the index file')
+    args = parser.parse_args()
+
+    api_index = ApiIndex(args.index)
+    if args.build:
+        build_index(args.build, api_index).save()
+        print(f"{len(api_index.packages)} packages in {args.index}")
+    if args.query:
+        spec, ignored = api_index.version_range(args.query[0], args.query[1:])
+        print(f"{args.query[0]}{spec or ': no indexed version has all attributes'}")
+        if ignored:
+            print(f"Not found in any indexed version (ignored): {ignored}")
+    if not args.build and not args.query:
+        parser.print_help()
+        sys.exit(1)
@@ -0,0 +1,227 @@
+'''
+WHAT DOES THIS DO?
+
+Batch driver for fix_dependencies.py. Instead of asking for one repo path and commit date through input(), it reads every
+repo whose original build failed from the papers_and_code table, checks it out from the shared mirror store
+(utils/repo_store.py, reusing an existing local checkout), runs the dependency analysis across a pool of worker processes and writes deps_file_content_edited and py_valid_versions
+back in bulk (deps_file_content_edited goes to papers_and_code_deps), moving fixed rows to stage FIX.
+
+Progress is checkpointed to output/fix_dependencies_checkpoint.json after every bulk write, so an interrupted overnight
+run picks up where it left off. A throughput report is printed as batches complete and at the end of the run.
+
+To run:
+(venv) python3 smart_package_versioning/batch_fix_dependencies.py --workers 8 --limit 500
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from multiprocessing import Pool
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+from database.database_cmds import create_session, escape_value, extract_owner_repo, MYSQL_DATABASE, TABLE_NAME, DEPS_TABLE_NAME
+from database.pipeline_state import Stage, Status, state_sql
+from utils.repo_store import RepoStore
+from utils.metrics import execute_sql
+from fix_dependencies import fix_dependencies, format_requirements
+
+CHECKOUT_DIR = os.path.join(ROOT, "output", "checkouts")
+CHECKPOINT_FILE = os.path.join(ROOT, "output", "fix_dependencies_checkpoint.json")
+
+###########################
+# CHECKPOINT FUNCTIONS
+###########################
+
+def load_checkpoint(checkpoint_file=CHECKPOINT_FILE):
+    # ids that were already attempted, whether they succeeded or not
+    if not os.path.exists(checkpoint_file):
+        return set()
+    with open(checkpoint_file, 'r') as f:
+        return set(json.load(f).get("done_ids", []))
+
+def save_checkpoint(done_ids, checkpoint_file=CHECKPOINT_FILE):
+    # write to a temp file first so a crash mid-write can't corrupt the checkpoint
+    tmp_file = f"{checkpoint_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump({"done_ids": sorted(done_ids), "updated": time.strftime("%Y-%m-%d %H:%M:%S")}, f)
+    os.replace(tmp_file, checkpoint_file)
+
+###########################
+# DATABASE FUNCTIONS
+###########################
+
+def fetch_candidates(table_name=TABLE_NAME, db_name=MYSQL_DATABASE, limit=None):
+    """
+    rows whose original build failed and that have not been fixed yet (stage BUILD, status FAILED)
+    returns a list of (id, github_url, deps_last_commit_date)
+    """
+    session, _ = create_session(db_name)
+    # range scan of the (stage, status, id) index
+    select_cmd = f"""
+    SELECT id, github_url, deps_last_commit_date
+    FROM {table_name}
+    WHERE stage = {int(Stage.BUILD)} AND status = {int(Status.FAILED)}
+        AND github_url IS NOT NULL AND deleted_at IS NULL
+    ORDER BY id"""
+    if limit:
+        select_cmd += f" LIMIT {int(limit)}"
+    try:
+        return [(row[0], row[1], row[2]) for row in session.sql(select_cmd).execute().fetch_all()]
+    finally:
+        session.close()
+
+def write_results(results, table_name=TABLE_NAME, deps_table_name=DEPS_TABLE_NAME, db_name=MYSQL_DATABASE,
+                  session=None):
+    """
+    bulk write of deps_file_content_edited (side table) and py_valid_versions, fixed rows move to stage FIX
+    one statement per table per batch instead of one round trip per repo
+    session: an open session to reuse (scripts/pipeline.py), otherwise one is created (and closed) here
+    """
+    fixed = [result for result in results if result["content"]]
+    if not fixed:
+        return 0
+
+    content_values = ", ".join(f"({r['id']}, {escape_value(r['content'])})" for r in fixed)
+    deps_cmd = f"""
+    INSERT INTO {deps_table_name} (id, deps_file_content_edited)
+    VALUES {content_values}
+    ON DUPLICATE KEY UPDATE deps_file_content_edited = VALUES(deps_file_content_edited)"""
+    python_cases = " ".join(f"WHEN {r['id']} THEN {escape_value(r['python_version'])}" for r in fixed)
+    ids = ", ".join(str(r["id"]) for r in fixed)
+    update_cmd = f"""
+    UPDATE {table_name}
+    SET py_valid_versions = CASE id {python_cases} END,
+        {state_sql(Stage.FIX, Status.OK)}
+    WHERE id IN ({ids})"""
+
+    own_session = session is None
+    if own_session:
+        session, _ = create_session(db_name)
+    try:
+        session.start_transaction()
+        execute_sql(session, deps_cmd)
+        execute_sql(session, update_cmd)
+        session.commit()
+        return len(fixed)
+    finally:
+        if own_session:
+            session.close()
+
+###########################
+# WORKER FUNCTIONS
+###########################
+
+def get_checkout(github_url, checkout_dir=CHECKOUT_DIR):
+    """
+    reuse a local checkout if one exists, otherwise make a worktree from the shared mirror store
+    the mirror is shared with the other stages, so the repo is only fetched once per refresh
+    returns (repo_path, mirror url), the url is None for a local clone that is not the store's to remove
+    """
+    owner_repo = extract_owner_repo(github_url)
+    if not owner_repo:
+        return None, None
+    owner, repo = owner_repo
+    repo = repo.removesuffix(".git")
+    mirror_url = f"https://github.com/{owner}/{repo}"
+    repo_path = os.path.join(checkout_dir, f"{owner}_{repo}")
+    if os.path.exists(os.path.join(repo_path, ".git")):
+        # a worktree has a .git file, a worktree left by an interrupted run is removed like any other
+        return repo_path, mirror_url if os.path.isfile(os.path.join(repo_path, ".git")) else None
+
+    os.makedirs(checkout_dir, exist_ok=True)
+    try:
+        return RepoStore().checkout(mirror_url, repo_path), mirror_url
+    except subprocess.CalledProcessError as e:
+        print(f"Error checking out {github_url}: {(e.stderr or '').strip()}")
+        return None, None
+
+def process_candidate(candidate):
+    repo_id, github_url, last_commit_date = candidate
+    start_time = time.monotonic()
+    result = {"id": repo_id, "github_url": github_url, "content": None, "python_version": None}
+    repo_path, mirror_url = None, None
+    try:
+        repo_path, mirror_url = get_checkout(github_url)
+        if repo_path:
+            fixed = fix_dependencies(repo_path, str(last_commit_date) if last_commit_date else "unknown")
+            if fixed:
+                python_version, package_versions = fixed
+                result["python_version"] = python_version
+                result["content"] = format_requirements(python_version, package_versions)
+    except Exception as e:
+        print(f"Error fixing dependencies for {github_url}: {str(e)}")
+    finally:
+        # the worktree is not needed once the requirements are written, and a mirror with worktrees is never evicted
+        if mirror_url:
+            RepoStore().remove_checkout(mirror_url, repo_path)
+    result["seconds"] = time.monotonic() - start_time
+    return result
+
+###########################
+# REPORTING
+###########################
+
+def print_throughput(processed, fixed, total, start_time):
+    elapsed = time.monotonic() - start_time
+    rate = processed / elapsed if elapsed else 0.0
+    eta = (total - processed) / rate if rate else float('inf')
+    print(f"-- Repos processed: {processed}/{total}, fixed: {fixed}, "
+          f"{rate * 60:.1f} repos/min, elapsed {elapsed:.0f}s, ETA {eta:.0f}s --")
+
+###########################
+# MAIN FUNCTION
+###########################
+
+def run_batch(workers=4, limit=None, batch_size=25, checkpoint_file=CHECKPOINT_FILE):
+    done_ids = load_checkpoint(checkpoint_file)
+    candidates = [c for c in fetch_candidates(limit=limit) if c[0] not in done_ids]
+    total = len(candidates)
+    print(f"{total} repos to process ({len(done_ids)} already done in previous runs)")
+    if not candidates:
+        return True
+
+    start_time = time.monotonic()
+    processed, fixed, repo_seconds = 0, 0, 0.0
+    pending = []
+
+    def flush():
+        nonlocal fixed
+        fixed += write_results(pending)
+        # only checkpoint ids whose results are safely in the database
+        done_ids.update(result["id"] for result in pending)
+        save_checkpoint(done_ids, checkpoint_file)
+        pending.clear()
+
+    with Pool(processes=workers) as pool:
+        for result in pool.imap_unordered(process_candidate, candidates):
+            processed += 1
+            repo_seconds += result["seconds"]
+            pending.append(result)
+            if len(pending) >= batch_size:
+                flush()
+                print_throughput(processed, fixed, total, start_time)
+        # closed and joined instead of terminated, so the workers' metrics finalizer runs (utils/metrics.py)
+        pool.close()
+        pool.join()
+    if pending:
+        flush()
+
+    elapsed = time.monotonic() - start_time
+    print(f"\nRepos processed: {processed}, fixed: {fixed}, failed: {processed - fixed}")
+    print(f"Wall time: {elapsed:.1f}s, {processed / elapsed * 60:.1f} repos/min with {workers} workers")
+    print(f"Average time per repo: {repo_seconds / processed:.1f}s")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run fix_dependencies over every failed build in papers_and_code")
+    parser.add_argument('-w', '--workers', type=int, default=min(os.cpu_count(), 8), help='Number of worker processes')
+    parser.add_argument('-l', '--limit', type=int, default=None, help='Maximum number of repos to process')
+    parser.add_argument('-b', '--batch_size', type=int, default=25, help='Results per bulk database write')
+    args = parser.parse_args()
+
+    run_batch(workers=args.workers, limit=args.limit, batch_size=args.batch_size)
@@ -6,16 +6,29 @@ WHAT DOES THIS DO?
 This script uses the OpenAI API to find the range of versions of a package that likely works for a repository. It uses the parsed
 libraries and library functions/classes/etc. used in the repository.
 
+The LLM is the fallback: version_solver.py pins everything it can from the local metadata store first.
+
 '''
 
-from openai import OpenAI 
 from dotenv import load_dotenv
+from functools import lru_cache
 import os
+import sys
 
-def ask_gpt(package_name, uses, min_python_version, last_commit_date):
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from utils.metrics import instrument
+
+@lru_cache(maxsize=None)
+def get_client():
+    # openai is only imported when the LLM is asked, importing this module (fix_dependencies) stays cheap
+    from openai import OpenAI
     load_dotenv()
-    api_key = os.getenv('OPENAI_API_KEY')
-    client = OpenAI(api_key=api_key)
+    return OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+@instrument("llm_request", model="gpt-4o", caller="ask_gpt")
+def ask_gpt(package_name, uses, min_python_version, last_commit_date):
+    client = get_client()
 
     response = client.chat.completions.create(
             model="gpt-4o",
@@ -37,10 +50,9 @@ def ask_gpt(package_name, uses, min_python_version, last_commit_date):
     output_text = response.choices[0].message.content
     return output_text
 
+@instrument("llm_request", model="gpt-4o", caller="ask_gpt_python_version")
 def ask_gpt_python_version(dependency_versions, min_python_version, last_commit_date):
-    load_dotenv()
-    api_key = os.getenv('OPENAI_API_KEY')
-    client = OpenAI(api_key=api_key)
+    client = get_client()
 
     response = client.chat.completions.create(
         model="gpt-4o",
@@ -61,8 +73,17 @@ def ask_gpt_python_version(dependency_versions, min_python_version, last_commit_
     output_text = response.choices[0].message.content
     return output_text
 
-def check_all_packages(usage_dict, min_python_version, last_commit_date):
-    results = {}
+def check_all_packages(usage_dict, min_python_version, last_commit_date, solution=None, use_llm=True, api_index=None):
+    # Pins already decided by version_solver.solve are kept, then the offline API index (api_index.py) is asked for
+    # the range where every used attribute exists, only what neither of them can answer goes to the LLM
+    results = dict(solution["pins"]) if solution else {}
     for package, uses in usage_dict.items():
-        results[package] = ask_gpt(package, uses, min_python_version, last_commit_date)
+        if package in results:
+            continue
+        if api_index is not None and package in api_index:
+            spec, _ = api_index.version_range(package, uses)
+            if spec:
+                results[package] = spec
+                continue
+        results[package] = ask_gpt(package, uses, min_python_version, last_commit_date) if use_llm else ""
     return results
\ No newline at end of file
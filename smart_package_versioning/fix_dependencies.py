@@ -18,15 +18,19 @@ STEPS:
 2. Parse the github repo to find all libraries used and the library functions/classes/etc. used for each library
     -> Note that I tokenize the code first so that we can parse the code into an AST
 3. Find the range of versions of each library that likely works for the repo (i.e. the versions where none of the functions/classes/etc. used are nonexistent or deprecated)
-    -> Uses LLM to do this, using context of the parsed libraries and library functions/classes/etc. used, and the last commit date
+    -> Uses the local solver in version_solver.py first (deterministic, backtracking over a local PyPI metadata store)
+    -> Uses LLM for packages the solver can't decide, using context of the parsed libraries and library functions/classes/etc. used, and the last commit date
 4. Find the most likely python version for the repo
-    -> Uses LLM to do this, using context of the parsed libraries and library functions/classes/etc. used, the last commit date and the absolute minimum python version
+    -> Comes from the solver when it pinned every package
+    -> Otherwise uses LLM to do this, using context of the parsed libraries and library functions/classes/etc. used, the last commit date and the absolute minimum python version
 5. Write the python version and package versions to a new_requirements.txt file
 
 FUTURE IMPROVEMENTS:
 1. We could use an LLM to parse the readme to look for package version ranges
 2. We could feed the LLM the documentation of each package as context as well when finding the version ranges
 3. We don't know how functions/classes change over time between versions. This also matters but is not checked.
+    -> Partly addressed by api_index.py: if the index has been built from a local wheel mirror, versions where a used
+       attribute does not exist are excluded before solving
 
 CONSIDERATIONS:
 1. I considered parsing the source code of each package to find the acceptable version ranges, but this would require downloading
@@ -35,8 +39,11 @@ CONSIDERATIONS:
 '''
 
 import subprocess, re, os, sys
+from functools import lru_cache
 from package_analysis import analyze_python_files
 from find_package_versions import check_all_packages, ask_gpt_python_version
+from version_solver import MetadataStore, solve_cached, dist_for_import, IMPORT_TO_DIST
+from api_index import ApiIndex, constraints_from_index, DEFAULT_INDEX_FILE
 
 ###########################
 # VERMIN FUNCTIONS
@@ -81,7 +88,24 @@ def read_requirements_file(requirements_file_path):
 # MAIN FUNCTION
 ###########################
 
-def fix_dependencies(repo_path, last_commit_date):
+@lru_cache(maxsize=None)
+def metadata_store():
+    # the metadata store is loaded once per process (every worker of batch_fix_dependencies' pool), not once per repo
+    return MetadataStore()
+
+@lru_cache(maxsize=None)
+def api_index():
+    # same for the API index, None when it has not been built
+    return ApiIndex() if os.path.exists(DEFAULT_INDEX_FILE) else None
+
+def format_requirements(python_version, package_versions):
+    # Same layout as new_requirements.txt, python pin first
+    # package_versions is keyed by import name, pip needs the distribution name (sklearn -> scikit-learn)
+    lines = [f"python=={python_version}"]
+    lines += [f"{IMPORT_TO_DIST.get(package, package)}{version}" for package, version in package_versions.items()]
+    return "\n".join(lines) + "\n"
+
+def fix_dependencies(repo_path, last_commit_date, use_llm=True):
     # Get min python version for package
     min_python_version = get_python_version(repo_path)
     if min_python_version is None:
@@ -93,15 +117,29 @@ def fix_dependencies(repo_path, last_commit_date):
                   if pkg not in sys.stdlib_module_names}
     print(usage_dict)
 
-    # For each package in usage_dict, find the min and max versions that work
-    package_versions = check_all_packages(usage_dict, min_python_version, last_commit_date)
-    python_version = ask_gpt_python_version(package_versions, min_python_version, last_commit_date)
+    # Narrow each package to the versions that still export every attribute used (if the API index was built)
+    store = metadata_store()
+    index = api_index()
+    constraints = None
+    if index is not None:
+        constraints = constraints_from_index(usage_dict, index, lambda name: dist_for_import(name, store))
+
+    # Pin what we can locally, then find the min and max versions that work for the rest
+    solution = solve_cached(usage_dict, min_python_version, last_commit_date, store=store, constraints=constraints)
+    package_versions = check_all_packages(usage_dict, min_python_version, last_commit_date,
+                                          solution=solution, use_llm=use_llm, api_index=index)
+    if solution["python_version"] and not solution["undecided"]:
+        python_version = solution["python_version"]
+    elif use_llm:
+        python_version = ask_gpt_python_version(package_versions, min_python_version, last_commit_date)
+    else:
+        python_version = solution["python_version"] or min_python_version
 
     # Write to a requirements.txt file
     with open(os.path.join(repo_path, "new_requirements.txt"), "w") as file:
-        file.write(f"python=={python_version}\n")
-        for package, version in package_versions.items():
-            file.write(f"{package}{version}\n")
+        file.write(format_requirements(python_version, package_versions))
+
+    return python_version, package_versions
 
 if __name__ == "__main__":
     print("What is the path to the package (absolute path)?")
@@ -0,0 +1,215 @@
+'''
+WHAT DOES THIS DO?
+
+Repairs one bad requirement of a dependency file by searching the package's release timeline, instead of taking the
+latest release before the commit date (process_errors.get_version_at_date) or asking GPT.
+
+The releases of the package that admit the python version are put in upload order and the search starts at the
+anchor: the broken pin, or the last release at the repo's deps_last_commit_date. From there it gallops outwards
+(1, 2, 4, 8 ... releases, newer first since old pins mostly break for lack of wheels for a newer python) until a
+release passes, then binary-searches the gap for the passing release nearest to the anchor. That is O(log n) probes
+instead of a scan over every release.
+
+A probe is resolve-only (pip install --dry-run, nothing is built into a venv) and has two levels:
+    alone       package==x by itself on the python version, shared by every repo asking about that package
+    with rest   package==x together with the other requirements of the file, so the repair keeps the set consistent
+The second level only runs when the first passes. Every probe result is memoized on disk
+(output/pin_repair_probes.json), so repos with the same broken pin mostly reuse the probes of the first one.
+Delete the file to forget the results (e.g. after releases were added or yanked).
+
+Release data comes from the version solver's metadata store (data/package_metadata.json), packages it does not hold
+are fetched from PyPI once per run.
+
+To run:
+(venv) python3 smart_package_versioning/pin_repair.py tensorflow==1.4.0 --python 3.8 --date 2018-01-10 -r requirements.txt
+
+ASSUMPTIONS:
+- Around the anchor passing releases are contiguous (one failing and one passing release bound a single boundary)
+'''
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from smart_package_versioning.version_solver import MetadataStore
+from utils.metrics import instrument
+
+DEFAULT_PROBE_CACHE_FILE = os.path.join(ROOT, "output", "pin_repair_probes.json")
+HOST_PYTHON = f"{sys.version_info.major}.{sys.version_info.minor}"
+RESOLVE_TIMEOUT = 600
+
+###########################
+# RESOLVE
+###########################
+
+def pip_resolve(content, python_version=HOST_PYTHON, timeout=RESOLVE_TIMEOUT):
+    """
+    (True, None) when pip can resolve the requirements for python_version, (False, pip's error) otherwise
+    nothing is installed (pip install --dry-run), pip's last "Collecting X" line is kept in front of the error
+    """
+    command = [sys.executable, "-m", "pip", "install", "--dry-run", "--ignore-installed",
+               "--disable-pip-version-check", "--no-input"]
+    with tempfile.TemporaryDirectory() as target_dir, \
+            tempfile.NamedTemporaryFile('w', suffix=".txt") as requirements_file:
+        if python_version != HOST_PYTHON:
+            # pip can only resolve for another interpreter from wheels, into a --target (nothing is written to it)
+            command += ["--python-version", python_version, "--only-binary=:all:", "--target", target_dir]
+        requirements_file.write(content)
+        requirements_file.flush()
+        with instrument("pip_resolve") as timer:
+            try:
+                result = subprocess.run(command + ["-r", requirements_file.name], capture_output=True, text=True,
+                                        timeout=timeout)
+            except subprocess.TimeoutExpired:
+                timer.labels["result"] = "timeout"
+                return False, "ERROR: resolve timed out"
+            timer.labels["result"] = "ok" if result.returncode == 0 else "failed"
+    if result.returncode == 0:
+        return True, None
+    collecting = [line for line in result.stdout.splitlines() if line.startswith("Collecting ")]
+    return False, "\n".join(collecting[-1:] + [result.stderr])
+
+###########################
+# REPAIR ENGINE
+###########################
+
+class PinRepairer:
+    def __init__(self, store=None, cache_file=DEFAULT_PROBE_CACHE_FILE):
+        self.store = store or MetadataStore()
+        self.cache_file = cache_file
+        self.cache = {}
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                self.cache = json.load(f)
+        self.probes = 0
+        self.hits = 0
+
+    def save(self):
+        if not self.cache_file:
+            return
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.cache, f)
+        os.replace(tmp_file, self.cache_file)
+
+    def timeline(self, package, python_version):
+        """
+        releases of package admitting python_version in upload order: [(Version, upload date)]
+        """
+        if package not in self.store and not self.store.update_from_pypi(package, with_dependencies=False):
+            return []
+        releases = [(version, upload_date) for version, upload_date, requires_python in self.store.releases(package)
+                    if requires_python is None or requires_python.contains(python_version, prereleases=True)]
+        return sorted(releases, key=lambda release: (release[1], release[0]))
+
+    def probe(self, lines, python_version):
+        # memoized resolve of a requirement set, the order of the lines does not matter
+        lines = sorted(set(lines))
+        key = hashlib.sha256(json.dumps([python_version, lines]).encode()).hexdigest()
+        if key in self.cache:
+            self.hits += 1
+            return self.cache[key]
+        self.probes += 1
+        ok, _ = pip_resolve("\n".join(lines) + "\n", python_version)
+        self.cache[key] = ok
+        return ok
+
+    def passes(self, package, version, rest, python_version):
+        pin = f"{package}=={version}"
+        if not self.probe([pin], python_version):
+            return False
+        return not rest or self.probe([pin, *rest], python_version)
+
+    def repair(self, package, rest=(), python_version=HOST_PYTHON, broken_version=None, anchor_date=None):
+        """
+        version of package nearest to the anchor that resolves on python_version together with rest (the other
+        requirement lines of the file), None when no release does
+        anchor: broken_version when it is a release admitting python_version (it is not probed again), else the
+        last release uploaded on or before anchor_date (YYYY-MM-DD), else the newest release
+        """
+        timeline = self.timeline(package, python_version)
+        if not timeline:
+            return None
+        versions = [version for version, _ in timeline]
+        anchor = next((i for i, version in enumerate(versions) if str(version) == str(broken_version)), None)
+        if anchor is None:
+            before = [i for i, (_, upload_date) in enumerate(timeline)
+                      if not anchor_date or (upload_date and upload_date <= anchor_date)]
+            anchor = before[-1] if before else 0
+            if self.passes(package, versions[anchor], rest, python_version):
+                return versions[anchor]
+
+        for direction in (1, -1):
+            found = self.gallop(package, versions, anchor, direction, rest, python_version)
+            if found is not None:
+                return versions[found]
+        return None
+
+    def gallop(self, package, versions, anchor, direction, rest, python_version):
+        """
+        index of the passing release nearest to anchor in direction (1 newer, -1 older), None if there is none
+        the release at anchor fails
+        """
+        failing, step = anchor, 1
+        while True:
+            candidate = failing + direction * step
+            if not 0 <= candidate < len(versions):
+                # the last release in this direction
+                candidate = len(versions) - 1 if direction == 1 else 0
+                if candidate == failing or not self.passes(package, versions[candidate], rest, python_version):
+                    return None
+            elif not self.passes(package, versions[candidate], rest, python_version):
+                failing, step = candidate, step * 2
+                continue
+            break
+
+        # failing fails and candidate passes, bisect the releases between them
+        passing = candidate
+        while abs(passing - failing) > 1:
+            middle = (passing + failing) // 2
+            if self.passes(package, versions[middle], rest, python_version):
+                passing = middle
+            else:
+                failing = middle
+        return passing
+
+
+if __name__ == "__main__":
+    from packaging.requirements import Requirement, InvalidRequirement
+    from packaging.utils import canonicalize_name
+    parser = argparse.ArgumentParser(description="Repair a bad pin by searching the package's release timeline")
+    parser.add_argument('requirement', help='Requirement to repair, e.g. tensorflow==1.4.0 or tensorflow')
+    parser.add_argument('--python', default=HOST_PYTHON, help='Python version the requirements must resolve for')
+    parser.add_argument('--date', default=None, help='Last commit date of the dependency file (YYYY-MM-DD)')
+    parser.add_argument('-r', '--requirements', default=None, help='Requirements file the rest of the set comes from')
+    args = parser.parse_args()
+
+    requirement = Requirement(args.requirement)
+    package = canonicalize_name(requirement.name)
+    pins = [spec.version for spec in requirement.specifier if spec.operator == "=="]
+    rest = []
+    if args.requirements:
+        with open(args.requirements, 'r') as f:
+            for line in f:
+                line = line.split(" #")[0].strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    if canonicalize_name(Requirement(line).name) == package:
+                        continue
+                except InvalidRequirement:
+                    pass
+                rest.append(line)
+
+    repairer = PinRepairer()
+    version = repairer.repair(package, rest, args.python, pins[0] if pins else None, args.date)
+    repairer.save()
+    print(f"{package}=={version}" if version else f"No release of {package} resolves on python {args.python}")
+    print(f"{repairer.probes} probes, {repairer.hits} cached")
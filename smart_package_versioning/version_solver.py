@@ -0,0 +1,368 @@
+'''
+WHAT DOES THIS DO?
+
+Local replacement for the per-package GPT calls in find_package_versions.py. Given the import usage from
+analyze_python_files, the last commit date and the minimum python version from vermin, it computes one consistent set of
+pins using a backtracking resolver over a local metadata store of releases (upload date, requires_python, requires_dist).
+
+The store is a JSON file (data/package_metadata.json by default) that is filled ahead of time from PyPI:
+    (venv) python3 smart_package_versioning/version_solver.py --update numpy torch scikit-learn
+
+Layout of the store:
+    {"numpy": {"1.26.4": {"upload_time": "2024-02-05T23:48:01", "requires_python": ">=3.9",
+                          "requires_dist": ["..."], "yanked": false}, ...}, ...}
+
+The solver is deterministic (same inputs -> same pins), runs in milliseconds for a typical repo and memoizes its
+results on disk. Packages that are not in the store are returned as undecided so the caller can fall back to the LLM.
+
+ASSUMPTIONS:
+- Linux (markers are evaluated with sys_platform == linux)
+- Only constraints between packages that the repo itself imports are checked, transitive deps are left to pip
+'''
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from functools import lru_cache
+
+from packaging.requirements import Requirement, InvalidRequirement
+from packaging.specifiers import SpecifierSet, InvalidSpecifier
+from packaging.utils import canonicalize_name
+from packaging.version import Version, InvalidVersion
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from utils.metrics import http_get
+
+DEFAULT_STORE_FILE = os.path.join(ROOT, "data", "package_metadata.json")
+DEFAULT_CACHE_FILE = os.path.join(ROOT, "output", "version_solver_cache.jsonl")
+
+# Upper bound on backtracking nodes per python version, keeps worst case in the milliseconds range
+MAX_STEPS = 20000
+
+# First release date of each python minor version, used to pick the most likely interpreter for a commit date
+PYTHON_RELEASES = {
+    "2.7": "2010-07-03",
+    "3.5": "2015-09-13",
+    "3.6": "2016-12-23",
+    "3.7": "2018-06-27",
+    "3.8": "2019-10-14",
+    "3.9": "2020-10-05",
+    "3.10": "2021-10-04",
+    "3.11": "2022-10-24",
+    "3.12": "2023-10-02",
+    "3.13": "2024-10-07",
+}
+
+# Import names that differ from the distribution name on PyPI
+IMPORT_TO_DIST = {
+    "sklearn": "scikit-learn",
+    "skimage": "scikit-image",
+    "cv2": "opencv-python",
+    "PIL": "pillow",
+    "yaml": "pyyaml",
+    "bs4": "beautifulsoup4",
+    "dateutil": "python-dateutil",
+    "Crypto": "pycryptodome",
+    "attr": "attrs",
+    "dotenv": "python-dotenv",
+    "git": "gitpython",
+    "github": "pygithub",
+    "jwt": "pyjwt",
+    "serial": "pyserial",
+    "magic": "python-magic",
+    "mysqlx": "mysqlx-connector-python",
+}
+
+###########################
+# METADATA STORE
+###########################
+
+class MetadataStore:
+    def __init__(self, path=DEFAULT_STORE_FILE):
+        self.path = path
+        self.packages = {}
+        self._releases = {}
+        self._requirements = {}
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                raw = f.read()
+            self.packages = json.loads(raw)
+            self.fingerprint = hashlib.sha256(raw).hexdigest()[:16]
+        else:
+            self.fingerprint = "empty"
+
+    def __contains__(self, dist):
+        return canonicalize_name(dist) in self.packages
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.packages, f, sort_keys=True)
+
+    def releases(self, dist):
+        """
+        parsed, installable releases of a distribution sorted oldest first
+        list of (Version, upload_date, requires_python SpecifierSet or None)
+        """
+        dist = canonicalize_name(dist)
+        if dist in self._releases:
+            return self._releases[dist]
+        parsed = []
+        for version_str, info in self.packages.get(dist, {}).items():
+            if info.get("yanked"):
+                continue
+            try:
+                version = Version(version_str)
+            except InvalidVersion:
+                continue
+            if version.is_prerelease or version.is_devrelease:
+                continue
+            requires_python = None
+            if info.get("requires_python"):
+                try:
+                    requires_python = SpecifierSet(info["requires_python"])
+                except InvalidSpecifier:
+                    pass
+            parsed.append((version, (info.get("upload_time") or "")[:10], requires_python))
+        parsed.sort(key=lambda release: release[0])
+        self._releases[dist] = parsed
+        return parsed
+
+    def requirements(self, dist, version):
+        # requires_dist of one release, parsed once and memoized
+        key = (canonicalize_name(dist), str(version))
+        if key in self._requirements:
+            return self._requirements[key]
+        reqs = []
+        info = self.packages.get(key[0], {}).get(key[1], {})
+        for line in info.get("requires_dist") or []:
+            try:
+                reqs.append(Requirement(line))
+            except InvalidRequirement:
+                continue
+        self._requirements[key] = reqs
+        return reqs
+
+    def update_from_pypi(self, dist, with_dependencies=True, session=None):
+        """
+        fetch release metadata for one distribution from the PyPI JSON API
+        requires_dist is only published per version, so that costs one extra request per release
+        """
+        dist = canonicalize_name(dist)
+        response = http_get(f"https://pypi.org/pypi/{dist}/json", session=session, timeout=30)
+        if response.status_code != 200:
+            print(f"Error fetching {dist} from PyPI: {response.status_code}")
+            return False
+
+        known = self.packages.get(dist, {})
+        releases = {}
+        for version_str, files in response.json().get("releases", {}).items():
+            if not files:
+                continue
+            info = known.get(version_str, {})
+            info["upload_time"] = min(f.get("upload_time") or "" for f in files)
+            info["requires_python"] = next((f["requires_python"] for f in files if f.get("requires_python")), None)
+            info["yanked"] = all(f.get("yanked") for f in files)
+            if with_dependencies and "requires_dist" not in info:
+                version_response = http_get(f"https://pypi.org/pypi/{dist}/{version_str}/json", session=session, timeout=30)
+                if version_response.status_code == 200:
+                    info["requires_dist"] = version_response.json()["info"].get("requires_dist") or []
+            releases[version_str] = info
+        self.packages[dist] = releases
+        self._releases, self._requirements = {}, {}
+        return True
+
+def dist_for_import(import_name, store):
+    # Map a top-level import name to the distribution name used in the store
+    dist = canonicalize_name(IMPORT_TO_DIST.get(import_name, import_name))
+    return dist if dist in store else None
+
+###########################
+# SOLVER
+###########################
+
+def python_candidates(min_python_version, last_commit_date):
+    """
+    python versions to try, most likely first:
+    newest release before the commit date, then older ones, then ones released after the commit
+    """
+    try:
+        minimum = Version(min_python_version) if min_python_version else Version("2.7")
+    except InvalidVersion:
+        minimum = Version("2.7")
+    allowed = [py for py in PYTHON_RELEASES if Version(py) >= minimum]
+    if not last_commit_date:
+        return sorted(allowed, key=Version, reverse=True)
+    before = [py for py in allowed if PYTHON_RELEASES[py] <= last_commit_date]
+    after = [py for py in allowed if PYTHON_RELEASES[py] > last_commit_date]
+    return sorted(before, key=Version, reverse=True) + sorted(after, key=Version)
+
+def marker_env(python_version):
+    return {"python_version": python_version, "python_full_version": f"{python_version}.0",
+            "sys_platform": "linux", "platform_system": "Linux", "os_name": "posix", "extra": ""}
+
+def candidate_versions(store, dist, python_version, last_commit_date, constraint=None):
+    """
+    releases of dist installable on python_version, nearest to the commit date first:
+    newest release before the commit date, then older ones, then the ones released after it
+    """
+    before, after = [], []
+    for version, upload_date, requires_python in store.releases(dist):
+        if requires_python is not None and not requires_python.contains(python_version, prereleases=True):
+            continue
+        if constraint is not None and not constraint.contains(version, prereleases=True):
+            continue
+        if last_commit_date and upload_date and upload_date > last_commit_date:
+            after.append(version)
+        else:
+            before.append(version)
+    return before[::-1] + after
+
+def compatible(store, dist, version, assignment, env):
+    # requirements of dist==version on already pinned packages, and their requirements on dist
+    for req in store.requirements(dist, version):
+        other = canonicalize_name(req.name)
+        if other in assignment and (req.marker is None or req.marker.evaluate(env)):
+            if not req.specifier.contains(assignment[other], prereleases=True):
+                return False
+    for other, other_version in assignment.items():
+        for req in store.requirements(other, other_version):
+            if canonicalize_name(req.name) == dist and (req.marker is None or req.marker.evaluate(env)):
+                if not req.specifier.contains(version, prereleases=True):
+                    return False
+    return True
+
+def backtrack(store, domains, env, max_steps=MAX_STEPS):
+    """
+    plain depth-first backtracking, most constrained package first
+    returns {dist: Version} or None if there is no consistent assignment (or the step budget ran out)
+    """
+    order = sorted(domains, key=lambda dist: (len(domains[dist]), dist))
+    assignment = {}
+    steps = 0
+
+    def assign(idx):
+        nonlocal steps
+        if idx == len(order):
+            return True
+        dist = order[idx]
+        for version in domains[dist]:
+            steps += 1
+            if steps > max_steps:
+                return False
+            if compatible(store, dist, version, assignment, env):
+                assignment[dist] = version
+                if assign(idx + 1):
+                    return True
+                del assignment[dist]
+        return False
+
+    return dict(assignment) if assign(0) else None
+
+def solve(usage_dict, min_python_version, last_commit_date, store=None, constraints=None):
+    """
+    usage_dict: {import_name: [attributes used]} from analyze_python_files
+    constraints: optional {dist: SpecifierSet} narrowing the candidate versions (e.g. from an API index)
+
+    returns {"python_version": "3.8" or None, "pins": {import_name: "==x.y.z"}, "undecided": [import_name, ...]}
+    pins are keyed by the import name, the same way check_all_packages keys its results
+    """
+    store = store or MetadataStore()
+    constraints = constraints or {}
+    date = str(last_commit_date)[:10] if last_commit_date and str(last_commit_date)[:1].isdigit() else None
+
+    dists = {}
+    undecided = []
+    for import_name in sorted(usage_dict):
+        dist = dist_for_import(import_name, store)
+        if dist:
+            dists[import_name] = dist
+        else:
+            undecided.append(import_name)
+
+    for python_version in python_candidates(min_python_version, date):
+        env = marker_env(python_version)
+        domains = {dist: candidate_versions(store, dist, python_version, date, constraints.get(dist))
+                   for dist in set(dists.values())}
+        if any(not versions for versions in domains.values()):
+            continue
+        assignment = backtrack(store, domains, env)
+        if assignment is not None:
+            pins = {import_name: f"=={assignment[dist]}" for import_name, dist in dists.items()}
+            return {"python_version": python_version, "pins": pins, "undecided": undecided}
+
+    # No consistent set found, leave everything to the fallback
+    return {"python_version": None, "pins": {}, "undecided": sorted(usage_dict)}
+
+###########################
+# CACHE
+###########################
+
+def cache_key(usage_dict, min_python_version, last_commit_date, store, constraints=None):
+    payload = json.dumps({
+        "usage": {pkg: sorted(uses) for pkg, uses in usage_dict.items()},
+        "min_python": min_python_version,
+        "date": str(last_commit_date),
+        "store": store.fingerprint,
+        "constraints": {dist: str(spec) for dist, spec in (constraints or {}).items()},
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+@lru_cache(maxsize=None)
+def load_solve_cache(cache_file):
+    """
+    {key: result} of the cache file, read once per process, solve_cached adds its new results to it
+    results appended by other processes after the read are not seen, they are solved (and appended) again
+    """
+    cache = {}
+    if os.path.exists(cache_file):
+        with open(cache_file, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by a killed worker
+                    continue
+                cache[entry["key"]] = entry["result"]
+    return cache
+
+def solve_cached(usage_dict, min_python_version, last_commit_date, store=None, constraints=None,
+                 cache_file=DEFAULT_CACHE_FILE):
+    # solve() memoized on disk, keyed by the inputs and the fingerprint of the metadata store
+    # the cache is append-only JSON lines: pool workers solving at the same time each append their own line with one
+    # O_APPEND write instead of rewriting (and overwriting) the whole file
+    store = store or MetadataStore()
+    key = cache_key(usage_dict, min_python_version, last_commit_date, store, constraints)
+    cache = load_solve_cache(cache_file) if cache_file else {}
+    if key in cache:
+        return cache[key]
+
+    result = solve(usage_dict, min_python_version, last_commit_date, store, constraints)
+    cache[key] = result
+    if cache_file:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        fd = os.open(cache_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps({"key": key, "result": result}) + "\n").encode())
+        finally:
+            os.close(fd)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local version solver and its PyPI metadata store")
+    parser.add_argument('--update', nargs='+', metavar='PACKAGE', help='Fetch release metadata for packages into the store')
+    parser.add_argument('--no-deps', action='store_true', help='Skip per-version requires_dist when updating')
+    parser.add_argument('--store', default=DEFAULT_STORE_FILE, help='Path to the metadata store')
+    args = parser.parse_args()
+
+    metadata_store = MetadataStore(args.store)
+    if not args.update:
+        print(f"{len(metadata_store.packages)} packages in {args.store}")
+        sys.exit(0)
+    for package in args.update:
+        if metadata_store.update_from_pypi(package, with_dependencies=not args.no_deps):
+            print(f"Updated {package}: {len(metadata_store.packages[canonicalize_name(package)])} releases")
+    metadata_store.save()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+# fix_dependencies imports its siblings as top-level modules, like scripts/pipeline.py does
+sys.path.append(os.path.join(ROOT, "smart_package_versioning"))
@@ -0,0 +1,37 @@
+import zipfile
+
+from smart_package_versioning.api_index import ApiIndex, build_index
+
+
+def write_wheel(directory, version, source):
+    with zipfile.ZipFile(directory / f"alpha-{version}-py3-none-any.whl", "w") as zf:
+        zf.writestr("alpha/__init__.py", source)
+        zf.writestr(f"alpha-{version}.dist-info/METADATA", "")
+
+
+def test_build_index_matches_adding_one_version_at_a_time(tmp_path):
+    mirror = tmp_path / "mirror"
+    mirror.mkdir()
+    sources = {"1.0": "def old(): pass\n", "1.10": "def new(): pass\n", "1.2": "def old(): pass\ndef new(): pass\n"}
+    for version, source in sources.items():
+        write_wheel(mirror, version, source)
+
+    index = build_index(str(mirror), ApiIndex(str(tmp_path / "built.json.gz")))
+    assert index.packages["alpha"]["versions"] == ["1.0", "1.2", "1.10"]
+    assert index.version_range("alpha", ["alpha.old"]) == (">=1.0,<=1.2", [])
+    assert index.version_range("alpha", ["alpha.new", "alpha.gone"]) == (">=1.2,<=1.10", ["alpha.gone"])
+
+    one_by_one = ApiIndex(str(tmp_path / "single.json.gz"))
+    for version, names in [("1.10", {"alpha", "alpha.new"}), ("1.0", {"alpha", "alpha.old"}),
+                           ("1.2", {"alpha", "alpha.old", "alpha.new"})]:
+        one_by_one.add("alpha", "alpha", version, names)
+    assert one_by_one.packages == index.packages
+
+
+def test_add_replaces_a_version(tmp_path):
+    index = ApiIndex(str(tmp_path / "index.json.gz"))
+    index.add_versions("alpha", "alpha", {"1.0": {"alpha.old"}, "2.0": {"alpha.old"}})
+    assert index.versions_with("alpha", ["alpha.old"]) == (["1.0", "2.0"], [])
+    index.add("alpha", "alpha", "2.0", {"alpha.new"})
+    assert index.versions_with("alpha", ["alpha.old"]) == (["1.0"], [])
+    assert index.versions_with("alpha", ["alpha.new"]) == (["2.0"], [])
@@ -0,0 +1,48 @@
+import re
+
+import pandas as pd
+
+from scripts.classify_github_issue import KeywordClassifier, trie_pattern
+
+
+def match(classifier, *texts):
+    return classifier.match(pd.Series(texts)).tolist()
+
+
+def test_trie_pattern_matches_every_keyword():
+    words = ["pip install", "pip issue", "pip install --user", "version conflict"]
+    pattern = re.compile(trie_pattern(words))
+    for word in words:
+        assert pattern.fullmatch(word)
+    assert not pattern.fullmatch("pip")
+
+
+def test_overlapping_keywords_are_all_found():
+    classifier = KeywordClassifier()
+    assert match(classifier, "requires version conflict", "unsupported version not supported") == [
+        ["requires version", "version conflict"],
+        ["unsupported version", "version not supported"],
+    ]
+
+
+def test_contained_keywords_are_found():
+    classifier = KeywordClassifier()
+    # the longest keyword at a position wins, the ones it contains are added
+    assert match(classifier, "pip install --upgrade numpy") == [["pip install", "pip install --upgrade"]]
+    assert match(classifier, "python version mismatch") == [["python version mismatch", "version mismatch"]]
+
+
+def test_no_keywords():
+    classifier = KeywordClassifier()
+    assert match(classifier, "", "the docs have a typo") == [[], []]
+
+
+def test_classify_scores_and_threshold():
+    categories = {"install": {"pip install": 0.5, "import error": 0.5}}
+    classifier = KeywordClassifier(categories=categories, thresholds={"install": 1.0})
+    df = pd.DataFrame({"title": ["Import Error after upgrade", "pip install fails", None],
+                       "body": ["ran pip install", None, "import\nerror"]})
+    result = classifier.classify(df)
+    assert result["matched_keywords"].tolist() == ["import error; pip install", "pip install", ""]
+    assert result["install_score"].tolist() == [1.0, 0.5, 0.0]
+    assert result["is_install"].tolist() == [True, False, False]
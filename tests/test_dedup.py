@@ -0,0 +1,62 @@
+from database.dedup import Deduplicator
+
+
+def row(title="Attention Is All You Need", arxiv_id="1706.03762", abs_url="https://arxiv.org/abs/1706.03762",
+        pwc_url="https://paperswithcode.com/paper/attention", repo_url="https://github.com/owner/repo"):
+    return {"paper_title": title, "paper_arxiv_id": arxiv_id, "paper_url_abs": abs_url,
+            "paper_url": pwc_url, "repo_url": repo_url}
+
+
+def test_canonical_values():
+    dedup = Deduplicator()
+    kept = list(dedup.filter([row(title="  Attention   Is All\nYou Need ", arxiv_id="1706.03762v5",
+                                  abs_url="http://www.arxiv.org/pdf/1706.03762v5.pdf",
+                                  pwc_url="https://paperswithcode.com/paper/attention/?x=1#top",
+                                  repo_url="http://www.GitHub.com/owner/repo.git/")]))
+    assert kept == [(0, ("Attention Is All You Need", "1706.03762", "https://arxiv.org/abs/1706.03762",
+                         "https://paperswithcode.com/paper/attention", "https://github.com/owner/repo"))]
+
+
+def test_variants_of_a_kept_value_are_duplicates():
+    dedup = Deduplicator()
+    rows = [
+        row(),
+        # same repo: other scheme, www., .git and a trailing slash
+        row(title="Other 1", arxiv_id="1", abs_url="https://arxiv.org/abs/1", pwc_url="https://pwc/1",
+            repo_url="http://www.github.com/owner/repo.git/"),
+        # same arXiv paper: pdf link of another version
+        row(title="Other 2", arxiv_id="2", abs_url="https://arxiv.org/pdf/1706.03762v2", pwc_url="https://pwc/2",
+            repo_url="https://github.com/owner/two"),
+        # same title: case and accents do not matter, like the table's collation
+        row(title="ATTENTION is all you néed", arxiv_id="3", abs_url="https://arxiv.org/abs/3",
+            pwc_url="https://pwc/3", repo_url="https://github.com/owner/three"),
+        row(title="Other 4", arxiv_id="4", abs_url="https://arxiv.org/abs/4", pwc_url="https://pwc/4",
+            repo_url="https://github.com/owner/four"),
+    ]
+    kept = [idx for idx, _ in dedup.filter(rows)]
+    assert kept == [0, 4]
+    assert dedup.dropped == {"duplicate:github_url": 1, "duplicate:paper_arxiv_url": 1, "duplicate:paper_title": 1}
+
+
+def test_null_values_never_collide():
+    dedup = Deduplicator()
+    rows = [row(arxiv_id=None, repo_url=None),
+            row(title="Other", arxiv_id=None, abs_url="https://arxiv.org/abs/2", pwc_url="https://pwc/2",
+                repo_url=None)]
+    assert [idx for idx, _ in dedup.filter(rows)] == [0, 1]
+
+
+def test_drop_reasons():
+    dedup = Deduplicator()
+    rows = [
+        "{not json",
+        row(abs_url=None),
+        row(title=""),
+        row(repo_url="https://github.com/user/https-github.com-other-repo"),
+        row(title="x" * 256),
+        '{"paper_title": "From a string", "paper_url_abs": "https://arxiv.org/abs/9"}',
+    ]
+    assert [idx for idx, _ in dedup.filter(rows)] == [5]
+    assert dedup.dropped == {"unparseable": 1, "missing_arxiv_url": 1, "missing_title": 1,
+                             "nested_github_url": 1, "too_long:paper_title": 1}
+    assert [idx for idx, _, _ in dedup.drops] == [0, 1, 2, 3, 4]
@@ -0,0 +1,62 @@
+from database.dedup import comparison_key, fingerprint
+from database.delta_sync import plan_sync
+
+
+def values(title, github_url, pwc_url=None):
+    # UNIQUE_COLUMNS order: title, arxiv id, arxiv url, pwc url, github url
+    return (title, None, f"https://arxiv.org/abs/{title}", pwc_url or f"https://pwc/{title}", github_url)
+
+
+def records_of(*rows):
+    return {comparison_key(row[4]): row for row in rows}
+
+
+def stored(row_id, row, deleted=False, fingerprint_of=None):
+    return (row_id, row[4], row[3], row[0], fingerprint(fingerprint_of or row), deleted)
+
+
+def test_plan_sync():
+    unchanged = values("unchanged", "https://github.com/a/unchanged")
+    updated = values("updated", "https://github.com/a/updated")
+    restored = values("restored", "https://github.com/a/restored")
+    gone = values("gone", "https://github.com/a/gone")
+    gone_before = values("gone-before", "https://github.com/a/gone-before")
+    moved_old = values("moved", "https://github.com/a/old-repo")
+    moved_new = values("moved", "https://github.com/a/new-repo")
+    inserted = values("inserted", "https://github.com/a/inserted")
+
+    stored_rows = [
+        stored(1, unchanged),
+        stored(2, updated, fingerprint_of=values("updated before", "https://github.com/a/updated")),
+        stored(3, restored, deleted=True),
+        stored(4, gone),
+        stored(5, gone_before, deleted=True),
+        stored(6, moved_old),
+    ]
+    plan = plan_sync(stored_rows, records_of(unchanged, updated, restored, moved_new, inserted))
+
+    assert plan == {
+        "insert": [inserted],
+        "update": [(2, updated)],
+        "move": [(6, moved_new)],
+        "delete": [4],
+        "restore": [3],
+        "unchanged": 1,
+    }
+
+
+def test_github_url_is_compared_like_the_collation():
+    row = values("paper", "https://github.com/Owner/Repo")
+    plan = plan_sync([stored(1, values("paper", "https://github.com/owner/repo"))], records_of(row))
+    assert plan["unchanged"] == 1 and not plan["insert"] and not plan["delete"]
+
+
+def test_a_leaving_row_moves_once():
+    # two new repos of the same paper, only the first one takes over the row that left the dump
+    old = values("paper", "https://github.com/a/old")
+    first = values("paper", "https://github.com/a/first")
+    second = values("paper", "https://github.com/a/second")
+    plan = plan_sync([stored(1, old)], records_of(first, second))
+    assert plan["move"] == [(1, first)]
+    assert plan["insert"] == [second]
+    assert plan["delete"] == []
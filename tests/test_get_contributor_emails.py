@@ -0,0 +1,39 @@
+import os
+import subprocess
+
+from scripts.get_contributor_emails import MAX_CONTRIBUTORS_LENGTH, extract_contributors, format_contributors
+
+
+def test_format_contributors_keeps_whole_emails():
+    emails = ["a@x.io", "bb@x.io", "ccc@x.io"]
+    assert format_contributors(emails) == "a@x.io, bb@x.io, ccc@x.io"
+    # "a@x.io, bb@x.io" is 15 characters, the third email would not fit and is dropped whole
+    assert format_contributors(emails, max_length=15) == "a@x.io, bb@x.io"
+    assert format_contributors(emails, max_length=14) == "a@x.io"
+    assert format_contributors(emails, max_length=5) == ""
+    assert format_contributors([]) == ""
+
+
+def test_format_contributors_fits_the_column():
+    emails = [f"contributor{i}@example.com" for i in range(40)]
+    contributors = format_contributors(emails)
+    assert len(contributors) <= MAX_CONTRIBUTORS_LENGTH
+    assert contributors.split(", ") == emails[:len(contributors.split(", "))]
+
+
+def test_extract_contributors_most_active_first(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+
+    def commit(name, email, message):
+        env = {**os.environ, "GIT_AUTHOR_NAME": name, "GIT_AUTHOR_EMAIL": email,
+               "GIT_COMMITTER_NAME": name, "GIT_COMMITTER_EMAIL": email}
+        subprocess.run(["git", "commit", "--quiet", "--allow-empty", "-m", message], cwd=repo, env=env, check=True)
+
+    subprocess.run(["git", "init", "--quiet"], cwd=repo, check=True)
+    commit("Jane", "jane@example.com", "one")
+    commit("Bob", "bob@example.com", "two")
+    commit("Bob", "bob@example.com", "three")
+    # the same email under another name and case counts once, in the place of its most active name
+    commit("Jane Doe", "JANE@example.com", "four")
+    assert extract_contributors((7, str(repo))) == (7, "bob@example.com, jane@example.com")
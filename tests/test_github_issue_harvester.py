@@ -0,0 +1,105 @@
+import csv
+import json
+
+from scripts import github_issue_harvester
+from scripts.github_issue_harvester import compact, harvest, IssueWriter, ISSUE_COLUMNS
+
+
+def issue(number, updated_at, title=None, pull_request=False):
+    data = {"number": number, "title": title or f"Issue {number}", "body": "", "labels": [{"name": "bug"}],
+            "comments": 0, "state": "open", "updated_at": updated_at}
+    if pull_request:
+        data["pull_request"] = {}
+    return data
+
+
+class FakeResponse:
+    def __init__(self, status_code, issues=(), headers=None):
+        self.status_code = status_code
+        self.issues = list(issues)
+        self.headers = headers or {}
+
+    def json(self):
+        return self.issues
+
+
+class FakeGitHub:
+    """
+    serves {repo: {page: response}}, records the params and headers of every request
+    """
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def __call__(self, url, session=None, params=None, headers=None, timeout=None):
+        repo = url.split("/repos/")[1].removesuffix("/issues")
+        self.requests.append((repo, params, headers))
+        return self.pages[repo][params["page"]]
+
+
+def rows(path):
+    with open(path, newline='') as f:
+        return [row[:2] + row[-1:] for row in list(csv.reader(f))[1:]]
+
+
+def test_harvest_is_incremental_and_conditional(tmp_path, monkeypatch):
+    issues_file, run_file, cursors_file = (str(tmp_path / name) for name in
+                                           ("issues.csv", "issues.run.csv", "cursors.json"))
+    link = '<https://api.github.com/repositories/1/issues?page=2>; rel="next", ' \
+           '<https://api.github.com/repositories/1/issues?page=2>; rel="last"'
+    github = FakeGitHub({
+        "a/one": {1: FakeResponse(200, [issue(1, "2024-01-01T00:00:00Z"), issue(2, "2024-01-02T00:00:00Z", pull_request=True)],
+                                  {"Link": link, "ETag": '"e1"'}),
+                  2: FakeResponse(200, [issue(3, "2024-01-03T00:00:00Z")])},
+        # page 2 fails, the repo's cursor stays where it was
+        "b/two": {1: FakeResponse(200, [issue(1, "2024-01-01T00:00:00Z")], {"Link": link, "ETag": '"e2"'}),
+                  2: FakeResponse(500)},
+    })
+    monkeypatch.setattr(github_issue_harvester, "http_get", github)
+
+    assert harvest(["a/one", "b/two"], repo_workers=1, page_workers=1, output_file=issues_file,
+                   cursors_file=cursors_file, run_file=run_file) == (1, 1)
+    cursors = json.loads(open(cursors_file).read())
+    assert list(cursors) == ["a/one"] and cursors["a/one"]["etag"] == '"e1"'
+    # the first page of the failed repo is kept, pull requests are not
+    assert rows(issues_file) == [["a/one", "1", "2024-01-01T00:00:00Z"], ["a/one", "3", "2024-01-03T00:00:00Z"],
+                                 ["b/two", "1", "2024-01-01T00:00:00Z"]]
+
+    github.requests.clear()
+    github.pages["a/one"] = {1: FakeResponse(304)}
+    github.pages["b/two"] = {1: FakeResponse(200, [issue(1, "2024-02-01T00:00:00Z", title="Renamed")])}
+    assert harvest(["a/one", "b/two"], repo_workers=1, page_workers=1, output_file=issues_file,
+                   cursors_file=cursors_file, run_file=run_file) == (2, 0)
+    sent = {repo: (params, headers) for repo, params, headers in github.requests}
+    assert sent["a/one"][0]["since"] == cursors["a/one"]["since"]
+    assert sent["a/one"][1] == {"If-None-Match": '"e1"'}
+    assert "since" not in sent["b/two"][0] and sent["b/two"][1] == {}
+
+    new_cursors = json.loads(open(cursors_file).read())
+    # a 304 keeps the ETag, the repo that failed before has its own cursor now
+    assert new_cursors["a/one"]["etag"] == '"e1"' and new_cursors["b/two"]["etag"] is None
+    assert rows(issues_file) == [["a/one", "1", "2024-01-01T00:00:00Z"], ["a/one", "3", "2024-01-03T00:00:00Z"],
+                                 ["b/two", "1", "2024-02-01T00:00:00Z"]]
+
+
+def test_compact_keeps_the_latest_row_per_issue(tmp_path):
+    issues_file, run_file = str(tmp_path / "issues.csv"), str(tmp_path / "issues.run.csv")
+    assert compact(issues_file, run_file) is None
+
+    writer = IssueWriter(run_file, batch_size=2)
+    writer.write([["a/one", 1, "old", "", "", 0, "open", "2024-01-01T00:00:00Z"],
+                  ["a/one", 1, "new", "", "", 1, "closed", "2024-03-01T00:00:00Z"],
+                  # the same update seen twice (a repo retried after failing halfway)
+                  ["a/one", 2, "x", "", "", 0, "open", "2024-01-05T00:00:00Z"],
+                  ["a/one", 2, "x", "", "", 0, "open", "2024-01-05T00:00:00Z"]])
+    writer.flush()
+    assert compact(issues_file, run_file) == 2
+
+    writer = IssueWriter(run_file)
+    writer.write([["a/one", 1, "older", "", "", 0, "open", "2024-02-01T00:00:00Z"]])
+    writer.flush()
+    assert compact(issues_file, run_file) == 2
+    with open(issues_file, newline='') as f:
+        table = list(csv.reader(f))
+    assert table[0] == ISSUE_COLUMNS
+    assert [row[:3] for row in table[1:]] == [["a/one", "1", "new"], ["a/one", "2", "x"]]
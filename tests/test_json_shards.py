@@ -0,0 +1,61 @@
+import json
+
+import database.database_cmds
+import database.json_shards
+import utils.metrics
+from database.json_shards import shard_ranges, load_shard, insert_shard
+from utils.progress import WorkerStats, init_worker
+
+
+def record(i, title=None):
+    return {"paper_title": title or f"Paper {i}", "paper_arxiv_id": str(i), "paper_url_abs": f"https://arxiv.org/abs/{i}",
+            "paper_url": f"https://pwc/{i}", "repo_url": f"https://github.com/owner/repo{i}"}
+
+
+def write_dump(tmp_path, records):
+    path = tmp_path / "dump.json"
+    path.write_text(json.dumps(records))
+    return str(path)
+
+
+def test_shards_cover_every_record_once(tmp_path):
+    records = [record(i) for i in range(50)]
+    path = write_dump(tmp_path, records)
+    ranges = shard_ranges(path, 7)
+    assert 1 < len(ranges) <= 7
+    assert [r for start, end in ranges for r in load_shard(path, start, end)] == records
+
+
+class FakeResult:
+    def __init__(self, count):
+        self.count = count
+
+    def get_affected_items_count(self):
+        return self.count
+
+
+class FakeSession:
+    def close(self):
+        pass
+
+
+def test_failed_batches_are_not_rejected_rows(tmp_path, monkeypatch):
+    # 5 rows, one of them a duplicate, in batches of 2: the first batch fails, the second has a row the table rejects
+    path = write_dump(tmp_path, [record(0), record(1), record(2), record(3), record(0)])
+    results = iter([RuntimeError("Lost connection"), FakeResult(1)])
+
+    def execute_sql(session, sql):
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(database.json_shards, "INSERT_BATCH_SIZE", 2)
+    monkeypatch.setattr(database.database_cmds, "create_session", lambda db_name: (FakeSession(), None))
+    monkeypatch.setattr(utils.metrics, "execute_sql", execute_sql)
+    stats = WorkerStats(1, counters=("inserted", "skipped", "failed"))
+    init_worker(stats)
+
+    dropped = insert_shard(shard_ranges(path, 1)[0], path, "papers_and_code", "test")
+    assert dropped == {"duplicate:paper_title": 1, "insert_error": 2, "rejected_by_table": 1}
+    assert stats.totals() == {"inserted": 1, "skipped": 2, "failed": 2}
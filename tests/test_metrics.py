@@ -0,0 +1,103 @@
+import os
+import sys
+import asyncio
+import subprocess
+
+import pytest
+
+from utils.metrics import Registry, instrument
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def test_instrument_records_calls_and_errors():
+    registry = Registry(buckets=(0.1, 1.0))
+
+    @instrument("job", registry=registry, kind="test")
+    def job(fail=False):
+        if fail:
+            raise KeyError("x")
+
+    job()
+    with pytest.raises(KeyError):
+        job(fail=True)
+    with instrument("block", registry=registry) as m:
+        m.labels["rows"] = 3
+
+    text = registry.render()
+    assert 'job_seconds_count{kind="test"} 2' in text
+    assert 'job_errors_total{error="KeyError",kind="test"} 1' in text
+    assert 'block_seconds_count{rows="3"} 1' in text
+    assert 'job_seconds_bucket{kind="test",le="+Inf"} 2' in text
+    assert [row[:4] for row in registry.summary() if row[0] == "job"] == [("job", '{kind="test"}', 2, 1)]
+
+
+def test_instrument_async_and_unnamed():
+    registry = Registry()
+
+    @instrument(registry=registry)
+    async def fetch():
+        return 1
+
+    assert asyncio.run(fetch()) == 1
+    assert f'function_seconds_count{{function="{__name__}.test_instrument_async_and_unnamed.<locals>.fetch"}} 1' \
+        in registry.render()
+
+
+def test_histogram_buckets():
+    registry = Registry(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.5, 5.0):
+        registry.observe("op_seconds", seconds)
+    text = registry.render()
+    assert 'op_seconds_bucket{le="0.1"} 1' in text
+    assert 'op_seconds_bucket{le="1.0"} 3' in text
+    assert 'op_seconds_bucket{le="+Inf"} 4' in text
+    assert "op_seconds_sum 6.050000" in text
+
+
+def test_merge_adds_snapshots():
+    first, second = Registry(buckets=(1.0,)), Registry(buckets=(1.0,))
+    first.observe("op_seconds", 0.5, host="a")
+    second.observe("op_seconds", 2.0, host="a")
+    second.inc("op_errors_total", error="Timeout")
+    total = Registry(buckets=(1.0,))
+    total.merge(first.snapshot())
+    total.merge(second.snapshot())
+    text = total.render()
+    assert 'op_seconds_count{host="a"} 2' in text
+    assert 'op_seconds_bucket{host="a",le="1.0"} 1' in text
+    assert 'op_errors_total{error="Timeout"} 1' in text
+
+
+WORKERS_SCRIPT = """
+import sys
+from multiprocessing import get_context
+sys.path.append(sys.argv[1])
+from utils.metrics import instrument
+
+def work(i):
+    with instrument("work"):
+        pass
+
+if __name__ == "__main__":
+    with instrument("parent"):
+        pass
+    # forked after the parent has started exporting
+    with get_context("fork").Pool(4) as pool:
+        pool.map(work, range(40), chunksize=1)
+        pool.close()
+        pool.join()
+"""
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork start method")
+def test_metrics_file_covers_pool_workers(tmp_path):
+    metrics_file = tmp_path / "metrics.prom"
+    script = tmp_path / "workers.py"
+    script.write_text(WORKERS_SCRIPT)
+    env = {key: value for key, value in os.environ.items() if key != "METRICS_RUN"}
+    env["METRICS_FILE"] = str(metrics_file)
+    subprocess.run([sys.executable, str(script), ROOT], env=env, check=True, timeout=60)
+    text = metrics_file.read_text()
+    assert "work_seconds_count 40" in text
+    assert "parent_seconds_count 1" in text
@@ -0,0 +1,63 @@
+import os
+import subprocess
+
+from scripts.new_repo import create_local_bare_repo, publish_repo, publish_repos
+from utils.repo_store import RepoStore
+
+
+def git(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, check=True).stdout
+
+
+def make_repo(tmp_path, owner, name):
+    repo = tmp_path / "src" / owner / name
+    repo.mkdir(parents=True)
+    git(repo, "init", "--quiet", "--initial-branch=main")
+    (repo / "requirements.txt").write_text("numpy==1.18\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "--quiet", "-m", "first")
+    (repo / "train.py").write_text("import numpy\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "--quiet", "-m", "second")
+    return str(repo)
+
+
+def identity(monkeypatch):
+    for variable in ("GIT_AUTHOR_NAME", "GIT_COMMITTER_NAME"):
+        monkeypatch.setenv(variable, "test")
+    for variable in ("GIT_AUTHOR_EMAIL", "GIT_COMMITTER_EMAIL"):
+        monkeypatch.setenv(variable, "test@example.com")
+
+
+def test_publish_repos_pushes_one_snapshot_commit_each(tmp_path, monkeypatch):
+    identity(monkeypatch)
+    repos = [make_repo(tmp_path, "alice", "one"), make_repo(tmp_path, "bob", "two"), str(tmp_path / "src" / "x" / "gone")]
+    work_dir = str(tmp_path / "work")
+    remotes = tmp_path / "remotes"
+
+    results = publish_repos(repos, workers=3, work_dir=work_dir, remote_template=str(remotes / "{name}.git"),
+                            create_remote=create_local_bare_repo)
+    assert results[repos[0]] == results[repos[1]] == "published"
+    assert results[repos[2]].startswith("error: git clone failed")
+
+    for name in ("alice_one", "bob_two"):
+        remote = str(remotes / f"{name}.git")
+        # the shallow history is not pushed, only the fixed tree as a root commit
+        assert git(remote, "rev-list", "--count", "main").strip() == "1"
+        assert git(remote, "ls-tree", "--name-only", "main").split() == ["requirements.txt", "train.py"]
+    # checkouts are removed once pushed
+    assert [entry for entry in os.listdir(work_dir) if not entry.startswith(".")] == []
+
+
+def test_publish_repo_with_fixed_requirements_and_store(tmp_path, monkeypatch):
+    identity(monkeypatch)
+    repo = make_repo(tmp_path, "alice", "one")
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    remote = str(tmp_path / "remotes" / "alice_one.git")
+    store = RepoStore(str(tmp_path / "store"))
+
+    assert publish_repo(repo, str(work_dir), remote_template=remote, create_remote=create_local_bare_repo,
+                        store=store, fixed_requirements="numpy==1.26.4\n") == (repo, "published")
+    assert os.path.isdir(store.mirror_path(repo))
+    assert git(remote, "show", "main:requirements.txt") == "numpy==1.26.4\n"
@@ -0,0 +1,182 @@
+import asyncio
+
+import database.outbox
+from database.outbox import MAX_ATTEMPTS, claim_batch, complete_batch, release_batch
+from scripts import notification
+from scripts.notification import Dispatcher, TokenBucket
+
+
+class FakeOutbox:
+    """
+    the outbox table in memory, with the lease semantics of database/outbox.py
+    """
+    def __init__(self, repo_ids):
+        self.rows = {outbox_id: {"repo_id": repo_id, "status": "pending", "attempts": 0, "lease_owner": None,
+                                 "result": None, "last_error": None}
+                     for outbox_id, repo_id in enumerate(repo_ids, start=1)}
+
+    def row(self, outbox_id):
+        row = self.rows[outbox_id]
+        return {"outbox_id": outbox_id, "repo_id": row["repo_id"],
+                "github_url": f"https://github.com/owner/repo{row['repo_id']}", "github_fork_url": None,
+                "contributors": None}
+
+    def peek_batch(self, session, channel, limit=20):
+        return [self.row(i) for i, row in self.rows.items() if row["status"] == "pending"][:limit]
+
+    def claim_batch(self, session, channel, owner, limit=20, lease_seconds=600, repo_id=None):
+        claimed = [i for i, row in self.rows.items() if row["status"] == "pending"][:limit]
+        for i in claimed:
+            self.rows[i].update(status="claimed", lease_owner=owner, attempts=self.rows[i]["attempts"] + 1)
+        return [self.row(i) for i in claimed]
+
+    def complete_batch(self, session, channel, owner, results):
+        for outbox_id, _, result in results:
+            if self.rows[outbox_id]["lease_owner"] == owner:
+                self.rows[outbox_id].update(status="done", result=result)
+        return len(results)
+
+    def release_batch(self, session, owner, failures, retry=True, count_attempt=True):
+        for outbox_id, error in failures:
+            row = self.rows[outbox_id]
+            if row["lease_owner"] != owner:
+                continue
+            if not count_attempt:
+                row.update(status="pending", attempts=max(row["attempts"] - 1, 0))
+            elif retry:
+                row["status"] = "failed" if row["attempts"] >= MAX_ATTEMPTS else "pending"
+            else:
+                row["status"] = "failed"
+            row.update(last_error=error, lease_owner=None)
+        return len(failures)
+
+
+class RateLimited(Exception):
+    pass
+
+
+class FakeChannel:
+    name = "email"
+    claim_size = 2
+    dry_run = False
+
+    def __init__(self, send):
+        self.bucket = TokenBucket(rate=10_000, capacity=10)
+        self.send = send
+
+    def retry_after(self, error):
+        return 0.001 if isinstance(error, RateLimited) else None
+
+
+def run_sender(monkeypatch, outbox, channel):
+    for name in ("peek_batch", "claim_batch", "complete_batch", "release_batch"):
+        monkeypatch.setattr(notification, name, getattr(outbox, name))
+    dispatcher = Dispatcher([channel], owner="test:1", batch_size=5)
+    asyncio.run(dispatcher.sender(channel, once=True))
+    return dispatcher
+
+
+def test_sender_completes_retries_and_gives_up(monkeypatch):
+    outbox = FakeOutbox([10, 20, 30])
+
+    def send(row):
+        if row["repo_id"] == 20:
+            raise RuntimeError("connection reset")
+        if row["repo_id"] == 30:
+            raise ValueError("no usable email address in contributors")
+        return f"sent-{row['repo_id']}"
+
+    dispatcher = run_sender(monkeypatch, outbox, FakeChannel(send))
+    assert {i: (row["status"], row["attempts"]) for i, row in outbox.rows.items()} == {
+        1: ("done", 1),
+        # a failed send is retried until MAX_ATTEMPTS, an unusable notification is not retried at all
+        2: ("failed", MAX_ATTEMPTS),
+        3: ("failed", 1),
+    }
+    assert outbox.rows[1]["result"] == "sent-10"
+    assert outbox.rows[2]["last_error"] == "connection reset"
+    assert dispatcher.sent == {"email": 1}
+
+
+def test_rate_limited_claims_are_given_back_without_an_attempt(monkeypatch):
+    outbox = FakeOutbox([10, 20])
+    calls = []
+
+    def send(row):
+        calls.append(row["repo_id"])
+        if len(calls) == 1:
+            raise RateLimited()
+        return "ok"
+
+    run_sender(monkeypatch, outbox, FakeChannel(send))
+    # the whole claim went back to pending, the second claim sent both
+    assert calls == [10, 10, 20]
+    assert {i: (row["status"], row["attempts"]) for i, row in outbox.rows.items()} == {1: ("done", 1), 2: ("done", 1)}
+
+
+class FakeResult:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def fetch_all(self):
+        return self.rows
+
+    def get_affected_items_count(self):
+        return len(self.rows)
+
+    def execute(self):
+        return self
+
+
+class FakeSession:
+    def __init__(self, rows=()):
+        self.statements = []
+        self.rows = list(rows)
+        self.committed = 0
+
+    def sql(self, statement):
+        self.statements.append(statement)
+        return FakeResult()
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        self.committed += 1
+
+    def rollback(self):
+        pass
+
+
+def test_outbox_statements_are_guarded_by_the_lease(monkeypatch):
+    session = FakeSession()
+
+    def execute_sql(session, statement):
+        session.statements.append(statement)
+        return FakeResult(session.rows)
+
+    monkeypatch.setattr(database.outbox, "execute_sql", execute_sql)
+
+    session.rows = [(7, 70, "https://github.com/o/r", "https://github.com/grimrepor/o_r", None)]
+    assert claim_batch(session, "tweet", "host:1", limit=5, lease_seconds=60) == [
+        {"outbox_id": 7, "repo_id": 70, "github_url": "https://github.com/o/r",
+         "github_fork_url": "https://github.com/grimrepor/o_r", "contributors": None}]
+    select, update = session.statements
+    # a claim whose lease expired is taken over, rows claimed by a concurrent dispatcher are skipped
+    assert "o.lease_expires < NOW()" in select and "SKIP LOCKED" in select
+    assert "lease_owner = 'host:1'" in update and "attempts = attempts + 1" in update and "IN (7)" in update
+
+    session.statements.clear()
+    complete_batch(session, "tweet", "host:1", [(7, 70, "https://x.com/status/1")])
+    outbox_update, repo_update = session.statements
+    assert "AND lease_owner = 'host:1'" in outbox_update
+    assert "tweet_url = CASE id WHEN 70 THEN 'https://x.com/status/1' END" in repo_update
+
+    session.statements.clear()
+    release_batch(session, "host:1", [(7, "rate limited")], count_attempt=False)
+    release_batch(session, "host:1", [(7, "timeout")])
+    give_back, retry = session.statements
+    assert "attempts = GREATEST(attempts - 1, 0)" in give_back
+    assert f"IF(attempts >= {MAX_ATTEMPTS}, 'failed', 'pending')" in retry
+    assert all("AND lease_owner = 'host:1'" in statement for statement in (give_back, retry))
+    assert release_batch(session, "host:1", []) == 0
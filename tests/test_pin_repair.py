@@ -0,0 +1,76 @@
+from smart_package_versioning.pin_repair import PinRepairer
+
+
+class TimelineRepairer(PinRepairer):
+    """
+    releases 0..n-1 of one package, the ones in passing resolve, every probe is recorded instead of running pip
+    """
+    def __init__(self, passing):
+        super().__init__(store={"stub": True}, cache_file=None)
+        self.passing = set(passing)
+        self.probed = []
+
+    def passes(self, package, version, rest, python_version):
+        self.probed.append(version)
+        return version in self.passing
+
+
+def gallop(repairer, versions, anchor, direction):
+    return repairer.gallop("pkg", versions, anchor, direction, (), "3.8")
+
+
+def test_gallop_newer_finds_the_nearest_passing_release():
+    versions = list(range(100))
+    repairer = TimelineRepairer(passing=range(37, 100))
+    assert gallop(repairer, versions, 10, 1) == 37
+    # steps of 1, 2, 4, 8, 16 from the last failing release: 11, 13, 17, 25 fail, 41 passes, then 25..41 is bisected
+    assert repairer.probed[:5] == [11, 13, 17, 25, 41]
+    assert len(repairer.probed) < 12
+
+
+def test_gallop_older():
+    versions = list(range(100))
+    repairer = TimelineRepairer(passing=range(0, 61))
+    assert gallop(repairer, versions, 90, -1) == 60
+
+
+def test_gallop_clamps_to_the_last_release():
+    versions = list(range(10))
+    repairer = TimelineRepairer(passing=[9])
+    # 6 and 8 fail, the next step would overshoot so the last release is probed instead
+    assert gallop(repairer, versions, 5, 1) == 9
+
+
+def test_gallop_next_release_passes():
+    repairer = TimelineRepairer(passing=[6])
+    assert gallop(repairer, list(range(10)), 5, 1) == 6
+    assert repairer.probed == [6]
+
+
+def test_gallop_nothing_passes():
+    versions = list(range(20))
+    assert gallop(TimelineRepairer(passing=[]), versions, 5, 1) is None
+    assert gallop(TimelineRepairer(passing=[]), versions, 5, -1) is None
+
+
+def test_gallop_at_the_end_of_the_timeline():
+    repairer = TimelineRepairer(passing=range(10))
+    assert gallop(repairer, list(range(10)), 9, 1) is None
+    assert repairer.probed == []
+
+
+def test_passes_probes_alone_then_with_the_rest():
+    repairer = PinRepairer(store={"stub": True}, cache_file=None)
+    resolvable = {("pkg==1.0",), ("other==2.0", "pkg==1.0")}
+    probed = []
+
+    def probe(lines, python_version):
+        probed.append(tuple(sorted(lines)))
+        return tuple(sorted(lines)) in resolvable
+
+    repairer.probe = probe
+    assert repairer.passes("pkg", "1.0", ["other==2.0"], "3.8")
+    assert not repairer.passes("pkg", "1.0", ["other==3.0"], "3.8")
+    assert not repairer.passes("pkg", "2.0", ["other==2.0"], "3.8")
+    # the set with the rest is never tried when the pin alone does not resolve
+    assert probed[-1] == ("pkg==2.0",)
@@ -0,0 +1,72 @@
+import os
+import fcntl
+import subprocess
+
+from utils.repo_store import RepoStore
+
+GIT_ENV = {**os.environ, "GIT_AUTHOR_NAME": "test", "GIT_AUTHOR_EMAIL": "test@example.com",
+           "GIT_COMMITTER_NAME": "test", "GIT_COMMITTER_EMAIL": "test@example.com",
+           "GIT_COMMITTER_DATE": "2020-05-17T12:00:00", "GIT_AUTHOR_DATE": "2020-05-17T12:00:00"}
+
+
+def git(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, env=GIT_ENV, capture_output=True, text=True, check=True).stdout
+
+
+def make_repo(tmp_path, name):
+    repo = tmp_path / name
+    repo.mkdir()
+    git(repo, "init", "--quiet", "--initial-branch=main")
+    (repo / "requirements.txt").write_text("numpy==1.18\n")
+    (repo / "docs").mkdir()
+    (repo / "docs" / "index.md").write_text("docs\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "--quiet", "-m", "init")
+    git(repo, "tag", "v1")
+    # what GitHub serves for pull requests, never fetched into the store
+    git(repo, "update-ref", "refs/pull/1/head", "HEAD")
+    return str(repo)
+
+
+def test_mirror_fetches_branches_and_tags_only(tmp_path):
+    store = RepoStore(str(tmp_path / "store"))
+    url = make_repo(tmp_path, "repo")
+    refs = git(store.mirror(url), "for-each-ref", "--format=%(refname)").split()
+    assert refs == ["refs/heads/main", "refs/tags/v1"]
+    assert store.read_file(url, "requirements.txt") == "numpy==1.18\n"
+    assert store.read_file(url, "setup.py") is None
+    assert store.last_commit_date(url) == "2020-05-17"
+
+
+def test_checkout_is_counted_until_removed(tmp_path):
+    store = RepoStore(str(tmp_path / "store"))
+    url = make_repo(tmp_path, "repo")
+    dest = str(tmp_path / "work")
+    store.checkout(url, dest, sparse_paths=["docs"])
+    assert os.path.exists(os.path.join(dest, "docs", "index.md"))
+    checkouts = store._read_index()[store.key(url)]["checkouts"]
+    assert list(checkouts) == [dest] and checkouts[dest] > 0
+
+    store.remove_checkout(url, dest)
+    assert not os.path.exists(dest)
+    assert store._read_index()[store.key(url)]["checkouts"] == {}
+
+
+def test_evict_skips_mirrors_in_use(tmp_path):
+    store = RepoStore(str(tmp_path / "store"))
+    old, read, kept = (make_repo(tmp_path, name) for name in ("old", "read", "kept"))
+    for url in (old, read, kept):
+        store.mirror(url)
+    dest = str(tmp_path / "work")
+    store.checkout(kept, dest)
+
+    store.budget_bytes = 0
+    # a reader holds the shared lock of "read", the worktree of "kept" is live
+    with store._lock(store.key(read), fcntl.LOCK_SH):
+        assert store.evict() == [store.key(old)]
+    assert not os.path.exists(store.mirror_path(old))
+    assert os.path.isdir(store.mirror_path(read)) and os.path.isdir(store.mirror_path(kept))
+
+    # an evicted mirror is cloned again on its next read
+    store.budget_bytes = 10 ** 12
+    assert store.read_file(old, "requirements.txt") == "numpy==1.18\n"
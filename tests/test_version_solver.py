@@ -0,0 +1,111 @@
+import json
+
+from packaging.version import Version
+
+from smart_package_versioning import version_solver
+from smart_package_versioning.version_solver import MetadataStore, backtrack, marker_env, solve, solve_cached
+
+
+def release(date, requires_dist=(), requires_python=None):
+    return {"upload_time": f"{date}T00:00:00", "requires_python": requires_python,
+            "requires_dist": list(requires_dist), "yanked": False}
+
+
+def make_store(tmp_path, packages):
+    path = tmp_path / "package_metadata.json"
+    path.write_text(json.dumps(packages))
+    return MetadataStore(str(path))
+
+
+def test_format_requirements():
+    from fix_dependencies import format_requirements
+    content = format_requirements("3.8", {"numpy": "==1.26.4", "pandas": ">=2.0,<3"})
+    assert content == "python==3.8\nnumpy==1.26.4\npandas>=2.0,<3\n"
+
+
+def test_format_requirements_uses_distribution_names():
+    from fix_dependencies import format_requirements
+    content = format_requirements("3.8", {"sklearn": "==1.3.2", "cv2": ">=4.0", "yaml": "==6.0"})
+    assert content == "python==3.8\nscikit-learn==1.3.2\nopencv-python>=4.0\npyyaml==6.0\n"
+
+
+def test_backtrack_undoes_a_pin_without_a_consistent_rest(tmp_path):
+    # alpha 2.0 is tried first but no beta satisfies it, so the solver has to go back to alpha 1.0
+    store = make_store(tmp_path, {
+        "alpha": {"1.0": release("2019-01-01"), "2.0": release("2019-06-01", ["beta<1"])},
+        "beta": {"1.0": release("2019-01-01"), "2.0": release("2019-06-01")},
+    })
+    domains = {"alpha": [Version("2.0"), Version("1.0")], "beta": [Version("2.0"), Version("1.0")]}
+    assert backtrack(store, domains, marker_env("3.8")) == {"alpha": Version("1.0"), "beta": Version("2.0")}
+
+
+def test_backtrack_reverse_requirement(tmp_path):
+    # beta 2.0 is only compatible with alpha >= 2, checked from beta's side once alpha is pinned
+    store = make_store(tmp_path, {
+        "alpha": {"1.0": release("2019-01-01")},
+        "beta": {"1.0": release("2019-01-01"), "2.0": release("2019-06-01", ["alpha>=2"])},
+    })
+    domains = {"alpha": [Version("1.0")], "beta": [Version("2.0"), Version("1.0")]}
+    assert backtrack(store, domains, marker_env("3.8")) == {"alpha": Version("1.0"), "beta": Version("1.0")}
+
+
+def test_backtrack_no_solution(tmp_path):
+    store = make_store(tmp_path, {
+        "alpha": {"1.0": release("2019-01-01", ["beta>=3"])},
+        "beta": {"1.0": release("2019-01-01")},
+    })
+    domains = {"alpha": [Version("1.0")], "beta": [Version("1.0")]}
+    assert backtrack(store, domains, marker_env("3.8")) is None
+
+
+def test_backtrack_step_budget(tmp_path):
+    store = make_store(tmp_path, {
+        "alpha": {"1.0": release("2019-01-01", ["beta>=3"])},
+        "beta": {"1.0": release("2019-01-01")},
+    })
+    domains = {"alpha": [Version("1.0")], "beta": [Version("1.0")]}
+    assert backtrack(store, domains, marker_env("3.8"), max_steps=1) is None
+
+
+def test_solve_pins_near_the_commit_date(tmp_path):
+    store = make_store(tmp_path, {
+        "alpha": {"1.0": release("2019-01-01"), "2.0": release("2019-06-01", ["beta<1"]),
+                  "3.0": release("2021-01-01")},
+        "beta": {"1.0": release("2019-01-01"), "2.0": release("2019-06-01")},
+    })
+    solution = solve({"alpha": ["run"], "beta": ["load"], "notindexed": ["x"]}, "3.6", "2019-12-01", store=store)
+    # python 3.8 is the newest release before the commit date, alpha 3.0 came out after it
+    assert solution == {"python_version": "3.8", "pins": {"alpha": "==1.0", "beta": "==2.0"},
+                        "undecided": ["notindexed"]}
+
+
+def test_solve_skips_python_versions_without_candidates(tmp_path):
+    store = make_store(tmp_path, {"alpha": {"1.0": release("2019-01-01", requires_python=">=3.9")}})
+    solution = solve({"alpha": []}, "3.6", "2019-12-01", store=store)
+    assert solution["python_version"] == "3.9"
+    assert solution["pins"] == {"alpha": "==1.0"}
+
+
+def test_solve_cached_reads_the_file_once(tmp_path, monkeypatch):
+    store = make_store(tmp_path, {"alpha": {"1.0": release("2019-01-01")}})
+    cache_file = str(tmp_path / "cache.jsonl")
+    solved = []
+    monkeypatch.setattr(version_solver, "solve", lambda *args: solved.append(args) or {"pins": len(solved)})
+    opened = []
+    real_open = open
+    monkeypatch.setattr("builtins.open", lambda path, *args, **kwargs: opened.append(path) or
+                        real_open(path, *args, **kwargs))
+
+    first = solve_cached({"alpha": []}, "3.6", "2019-12-01", store=store, cache_file=cache_file)
+    again = solve_cached({"alpha": []}, "3.6", "2019-12-01", store=store, cache_file=cache_file)
+    other = solve_cached({"alpha": ["x"]}, "3.6", "2019-12-01", store=store, cache_file=cache_file)
+    assert first == again == {"pins": 1} and other == {"pins": 2}
+    assert len(solved) == 2
+    # nothing is read back, the appended results are kept in memory too
+    assert opened.count(cache_file) == 0
+    assert len((tmp_path / "cache.jsonl").read_text().splitlines()) == 2
+
+    # a new process starts from the file
+    version_solver.load_solve_cache.cache_clear()
+    assert version_solver.load_solve_cache(cache_file)[version_solver.cache_key(
+        {"alpha": []}, "3.6", "2019-12-01", store)] == {"pins": 1}
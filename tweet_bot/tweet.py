@@ -4,6 +4,9 @@ Twitter Bot for Repository Notifications
 This script posts tweets to notify repository owners about build issues.
 VERY IMPORTANT! There's a 17 post per 24 hour period limit.
 Please make sure you add a delay on your side between calls.
+scripts/notification.py does this for every fixed repo with a token bucket matched to the limit.
+A single repo posted from here goes through the same notification outbox (database/outbox.py) and its lease,
+so it is never tweeted twice when a dispatcher is running too.
 
 Usage:
     1. Command line:
@@ -35,7 +38,6 @@ import tweepy
 import sys
 from datetime import datetime
 import argparse
-import subprocess
 import random
 import logging
 
@@ -43,29 +45,27 @@ ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(ROOT)
 from database.database_cmds import create_session, escape_value
 
-logging.getLogger('tweepy').setLevel(logging.CRITICAL)
-os.makedirs(os.path.join(ROOT, "logs"), exist_ok=True)
+log_file = None
 
-datetime_str = datetime.now().strftime("%H:%M:%S_%d-%m-%Y")
-log_file = os.path.join(ROOT, "logs", f"tweet_{datetime_str}.log")
-logging.basicConfig(filename=log_file, level=logging.DEBUG)
 
-
-async def main(
-        owner_name: str = "testperson",
-        github_url: str = "https://github.com/testperson/test-repo",
-        github_fork_url: str = "https://github.com/sundai-club/test-repo"
-    ):
+def setup_logging():
     """
-    owner_name: repo owner name
-    github_url: URL of the original repository
-        last part of the URL is the repo_name
-    github_fork_url: URL of the forked (and fixed) repository
-
-    we need the github_url because in the db that field must be unique,
-    so that let's us safely query and update the repo after tweeting
+    log to logs/tweet_<time>.log, set up by main() once per process and not on import
     """
+    global log_file
+    if log_file is None:
+        logging.getLogger('tweepy').setLevel(logging.CRITICAL)
+        os.makedirs(os.path.join(ROOT, "logs"), exist_ok=True)
+        datetime_str = datetime.now().strftime("%H:%M:%S_%d-%m-%Y")
+        log_file = os.path.join(ROOT, "logs", f"tweet_{datetime_str}.log")
+        logging.basicConfig(filename=log_file, level=logging.DEBUG)
+    return log_file
 
+
+def create_client():
+    """
+    Tweepy client with OAuth 1.0a, create it once and reuse it for every tweet
+    """
     # Load environment variables
     load_dotenv()
 
@@ -75,14 +75,51 @@ async def main(
     ACCESS_TOKEN = os.getenv('TWITTER_ACCESS_TOKEN')
     ACCESS_TOKEN_SECRET = os.getenv('TWITTER_ACCESS_TOKEN_SECRET')
 
-    # Initialize Tweepy client with OAuth 1.0a
-    client = tweepy.Client(
+    return tweepy.Client(
         consumer_key=API_KEY,
         consumer_secret=API_KEY_SECRET,
         access_token=ACCESS_TOKEN,
         access_token_secret=ACCESS_TOKEN_SECRET
     )
 
+
+def tweet_text(owner_name: str, repo_name: str, github_fork_url: str) -> str:
+    return (
+        f"Hey, @{owner_name}, your repository: {repo_name} can no longer be built!\n"
+        f"We went ahead and fixed this for you at: {github_fork_url}\n"
+        f"❤️ Grim Repo-r"
+    )
+
+
+def post_tweet(client, text: str) -> str:
+    """
+    Post one tweet and return its URL, raises tweepy errors (TooManyRequests, ...) to the caller.
+    Rate limiting is up to the caller (scripts/notification.py), nothing sleeps here.
+    """
+    x_response = client.create_tweet(text=text)
+    tweet_id = x_response.data['id'] if x_response is not None else None
+    return f"https://x.com/GrimRepor/status/{tweet_id}"
+
+
+async def main(
+        owner_name: str = "testperson",
+        github_url: str = "https://github.com/testperson/test-repo",
+        github_fork_url: str = "https://github.com/sundai-club/test-repo",
+        client=None
+    ):
+    """
+    owner_name: repo owner name
+    github_url: URL of the original repository
+        last part of the URL is the repo_name
+    github_fork_url: URL of the forked (and fixed) repository
+
+    we need the github_url because in the db that field must be unique,
+    so that let's us safely query and update the repo after tweeting
+    client: an existing tweepy client (create_client), a new one is created if not given
+    """
+    setup_logging()
+    client = client or create_client()
+
     parser = argparse.ArgumentParser(description='Tweet to notify repository owners about build issues')
     parser.add_argument('-o', '--owner_name', type=str, help='Repository owner name')
     parser.add_argument('-g', '--github_url', type=str, help='URL of the original repository')
@@ -94,116 +131,114 @@ async def main(
         github_url = args.github_url or github_url
         github_fork_url = args.github_fork_url or github_fork_url
 
-    # ** do not continue if the record in the database is already marked as tweeted **
-    MYSQL_DATABASE = os.getenv("MYSQL_DATABASE") or "grimrepor_db"
-    TABLE_NAME = os.getenv('TABLE_NAME') or "papers_and_code"
-
-    # Create a session
-    session, schema = create_session(db_name=MYSQL_DATABASE)
-    cmd_check_record = f"""
-    SELECT tweet_posted
-    FROM {TABLE_NAME}
-    WHERE github_url = '{escape_value(github_url)}';
-    """
-    try:
-        record = schema.get_collection(TABLE_NAME).find(cmd_check_record).execute()
-        if record[0]['tweet_posted'] == 1:
-            print(f"Tweet already posted for {github_url}.\n")
-            logging.info(f"Tweet already posted for {github_url}.\n")
-            return
-        else:
-            print(f"Tweet not yet posted for {github_url}.\n")
-            logging.info(f"Tweet not yet posted for {github_url}.\n")
-    except Exception as e:
-        # not an issue if the db doesn't hold a test record
-        if not owner_name.startswith("testperson"):
-            print(f"Error checking record: {e}\n")
-            logging.error(f"Error checking record: {e}\n")
-            print(f'{cmd_check_record=}\n')
-            logging.info(f'{cmd_check_record=}\n')
-            return
-    finally:
-        session.close()
-
     # repo name is the last part of the url after the last slash
-    repo_name = github_url.split("/")[-1]
+    repo_name = github_url.rstrip("/").split("/")[-1]
 
-    # This allows us to post for testing as duplicate tweets are not allowed
     if owner_name.startswith("testperson"):
-        old_name = owner_name
+        # test tweets have no record in the database, duplicate tweets are not allowed so the name gets a suffix
         owner_name = owner_name + str(random.randint(1, 10000))
-        github_url = github_url.replace(old_name, owner_name)
+        TWEET_TEXT = tweet_text(owner_name, repo_name, github_fork_url)
+        print(f"Tweet content to be posted:\n{TWEET_TEXT=}\n")
+        try:
+            tweet_url = await asyncio.to_thread(post_tweet, client, TWEET_TEXT)
+        except Exception as e:
+            print(f"Sadface homies. Misc Error posting tweet: {e}\n")
+            logging.error(f"Misc Error posting tweet: {e}\n")
+            return None
+        print(f"Tweet posted successfully!\n{tweet_url}\n")
+        return tweet_url
 
-    logging.info(f'{owner_name=}\n{repo_name=}\n{github_url=}\n{github_fork_url=}\n')
+    return await asyncio.to_thread(tweet_repo, client, owner_name, github_url, github_fork_url)
 
-    TWEET_TEXT = (
-        f"Hey, @{owner_name}, your repository: {repo_name} can no longer be built!\n"
-        f"We went ahead and fixed this for you at: {github_fork_url}\n"
-        f"❤️ Grim Repo-r"
-    )
-    print("Waiting for 10 seconds before posting the tweet...")
-    print(f"Tweet content to be posted:\n{TWEET_TEXT=}\n")
-    logging.info(f'{TWEET_TEXT=}\n')
 
-    await asyncio.sleep(10)
-
-    x_response, tweet_id = None, None
+def tweet_repo(client, owner_name: str, github_url: str, github_fork_url: str = None):
+    """
+    tweet about one repo through the notification outbox (database/outbox.py), the same way
+    scripts/notification.py does: the repo is queued if it needs a tweet, claimed with a lease and marked done
+    (tweet_posted, tweet_url) when the tweet is out, so a running dispatcher never posts it a second time
+    github_fork_url: overrides the fork url stored for the repo
+    returns the tweet url, None when nothing was posted
+    """
+    from database.outbox import enqueue, claim_batch, complete_batch, release_batch, default_owner
+    from database.database_cmds import MYSQL_DATABASE, TABLE_NAME
+    session, _ = create_session(db_name=MYSQL_DATABASE)
+    owner = default_owner()
     try:
-        x_response = client.create_tweet(text=TWEET_TEXT)
-    except tweepy.errors.TooManyRequests as e:
-        print(f"Rate limit exceeded. Please wait and try again later.\n{e}\n")
-        logging.error(f"Rate limit exceeded. Please wait and try again later.\n{e}\n")
-        print(f"{log_file=}\n")
-        return
-    except Exception as e:
-        print(f"Sadface homies. Misc Error posting tweet: {e}\n")
-        logging.error(f"Misc Error posting tweet: {e}\n")
-        print(f"{log_file=}\n")
-        return
-
-    if x_response is not None:
-        tweet_id = x_response.data['id'] if x_response.data['id'] is not None else None
-
-    tweet_url = f"https://x.com/GrimRepor/status/{tweet_id}"
-    print(f"Tweet posted successfully!\n{tweet_url}\n")
-    logging.info(f"Tweet posted successfully!\n{tweet_url}\n")
-
-    update_table_in_db(github_url=github_url, tweet_posted=True, tweet_url=tweet_url)
+        record = session.sql(f"""
+        SELECT id FROM {TABLE_NAME} WHERE github_url = {escape_value(github_url)}""").execute().fetch_one()
+        if record is None:
+            print(f"Error checking record: no record for {github_url}\n")
+            logging.error(f"no record for {github_url}\n")
+            return None
+        enqueue(session, "tweet", repo_id=record[0])
+        claimed = claim_batch(session, "tweet", owner, limit=1, repo_id=record[0])
+        if not claimed:
+            print(f"No tweet to post for {github_url}: already posted, not pushed to a fork yet, "
+                  f"or being sent by scripts/notification.py.\n")
+            logging.info(f"No tweet to post for {github_url}.\n")
+            return None
+        claim = claimed[0]
+
+        TWEET_TEXT = tweet_text(owner_name, github_url.rstrip("/").split("/")[-1],
+                                github_fork_url or claim["github_fork_url"])
+        print(f"Tweet content to be posted:\n{TWEET_TEXT=}\n")
+        logging.info(f'{TWEET_TEXT=}\n')
+        try:
+            tweet_url = post_tweet(client, TWEET_TEXT)
+        except tweepy.errors.TooManyRequests as e:
+            print(f"Rate limit exceeded. Please wait and try again later.\n{e}\n")
+            logging.error(f"Rate limit exceeded. Please wait and try again later.\n{e}\n")
+            # back to pending without using up an attempt, nothing was posted
+            release_batch(session, owner, [(claim["outbox_id"], "rate limited")], count_attempt=False)
+            return None
+        except Exception as e:
+            print(f"Sadface homies. Misc Error posting tweet: {e}\n")
+            logging.error(f"Misc Error posting tweet: {e}\n")
+            release_batch(session, owner, [(claim["outbox_id"], str(e))])
+            return None
+
+        complete_batch(session, "tweet", owner, [(claim["outbox_id"], claim["repo_id"], tweet_url)])
+        print(f"Tweet posted successfully!\n{tweet_url}\n")
+        logging.info(f"Tweet posted successfully!\n{tweet_url}\n")
+        return tweet_url
+    finally:
+        if log_file:
+            print(f"{log_file=}\n")
+        session.close()
 
 
-def update_table_in_db(github_url: str, tweet_posted: bool, tweet_url: str, table_name: str = "papers_and_code"):
+def update_table_in_db(github_url: str, tweet_posted: bool, tweet_url: str, table_name: str = "papers_and_code",
+                       session=None):
     """
     Tweet about the repository and update the table with the tweet URL.
 
     need github_url (of the original repo) to match the correct record in the db
+    session: an open session to reuse, otherwise one is created (and closed) here
 
     table columns to update:
     tweet_posted           | tinyint(1)   | 1 for true (tweet posted)
     tweet_url              | varchar(255)
+
+    for many repos at once, use database/outbox.py (complete_batch) instead: one UPDATE per batch
     """
     MYSQL_DATABASE = os.getenv("MYSQL_DATABASE") or "grimrepor_db"
     TABLE_NAME = os.getenv('TABLE_NAME') or table_name
 
-    # Create a session
-    session, schema = create_session(db_name=MYSQL_DATABASE)
+    own_session = session is None
+    if own_session:
+        session, schema = create_session(db_name=MYSQL_DATABASE)
     tweet_posted = 1 if tweet_posted else 0
 
-    # Update the table with the tweet URL
+    # Update the table with the tweet URL, a single statement, no read back
     cmd_tweet_update = f"""
     UPDATE {TABLE_NAME}
-    SET tweet_posted = {escape_value(tweet_posted)}, tweet_url = '{escape_value(tweet_url)}'
-    WHERE github_url = '{escape_value(github_url)}';
-    """
-
-    cmd_view_record = f"""
-    SELECT *
-    FROM {TABLE_NAME}
-    WHERE github_url = '{escape_value(github_url)}';
+    SET tweet_posted = {escape_value(tweet_posted)}, tweet_url = {escape_value(tweet_url)}
+    WHERE github_url = {escape_value(github_url)};
     """
 
     try:
         # mark the record with this github_url as tweeted and store the tweet url
-        schema.get_collection(TABLE_NAME).modify(cmd_tweet_update).execute()
+        session.sql(cmd_tweet_update).execute()
         session.commit()
         print("Table updated successfully!")
         logging.info("Table updated successfully!")
@@ -212,17 +247,10 @@ def update_table_in_db(github_url: str, tweet_posted: bool, tweet_url: str, tabl
         logging.error(f"Error updating table: {e}\n")
         print(f'{cmd_tweet_update=}\n')
 
-    try:
-        record = schema.get_collection(TABLE_NAME).find(cmd_view_record).execute()
-        print(record)
-    except Exception as e:
-        print(f"Error viewing record: {e}\n")
-        logging.error(f"Error viewing record: {e}\n")
-        print(f'{cmd_view_record=}\n')
-        logging.info(f'{cmd_view_record=}\n')
-
-    session.close()
-    print(f"{log_file=}\n")
+    if own_session:
+        session.close()
+    if log_file:
+        print(f"{log_file=}\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+"""
+Chunked CSV reading/writing and an optional columnar cache for the large intermediate files
+(output/issues.csv, data/paper_repo_info.csv, output/build_check_results.csv, ...)
+
+import into other python files like
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from utils.csv_io import iter_csv, read_csv_cached, CsvAppender
+
+The Parquet cache is only used when pyarrow is installed (pip install pyarrow), otherwise reads fall back to CSV.
+"""
+
+import os
+import hashlib
+import importlib.util
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CACHE_DIR = os.path.join(ROOT, "output", ".cache")
+DEFAULT_CHUNKSIZE = 10_000
+
+
+def iter_csv(path, chunksize=DEFAULT_CHUNKSIZE, **kwargs):
+    """
+    Yield a CSV file as DataFrame chunks so memory stays bounded by the chunk size.
+    The index keeps counting across chunks, so chunk.index is the row number in the file.
+    """
+    import pandas as pd
+    with pd.read_csv(path, chunksize=chunksize, **kwargs) as reader:
+        yield from reader
+
+
+def has_parquet() -> bool:
+    # looked up without importing it, pyarrow is only imported by pandas when a cache file is read or written
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def cache_path(path: str) -> str:
+    # one cache file per source path, the hash keeps same-named files from different directories apart
+    abs_path = os.path.abspath(path)
+    digest = hashlib.sha1(abs_path.encode()).hexdigest()[:8]
+    name = os.path.splitext(os.path.basename(abs_path))[0]
+    return os.path.join(CACHE_DIR, f"{name}-{digest}.parquet")
+
+
+def read_csv_cached(path, columns=None, **kwargs):
+    """
+    Read a CSV through a Parquet cache that is rebuilt whenever the CSV is newer than it.
+    Only the requested columns are read back from the cache.
+    """
+    import pandas as pd
+    if not has_parquet():
+        return pd.read_csv(path, usecols=columns, **kwargs)
+
+    cached = cache_path(path)
+    if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(path):
+        try:
+            return pd.read_parquet(cached, columns=columns)
+        except Exception as e:
+            print(f"Error reading cache {cached}, rebuilding: {str(e)}")
+
+    df = pd.read_csv(path, **kwargs)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_file = f"{cached}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_file, index=False)
+        os.replace(tmp_file, cached)
+    except Exception as e:
+        # mixed-type object columns can't always be converted, the CSV still works
+        print(f"Could not cache {path} as Parquet: {str(e)}")
+    return df[columns] if columns else df
+
+
+class CsvAppender:
+    """
+    Write DataFrame chunks to one CSV file as they are produced.
+    The first write truncates the file and writes the header, later writes append.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.rows_written = 0
+        self._started = False
+
+    def write(self, df):
+        if not self._started:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        df.to_csv(self.path, mode='a' if self._started else 'w', header=not self._started, index=False)
+        self._started = True
+        self.rows_written += len(df)
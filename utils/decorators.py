@@ -1,4 +1,5 @@
-from time import time
+import inspect
+import functools
 """
 import into other python files like
 
@@ -9,13 +10,30 @@ from utils.decorators import timeit
 
 def timeit(func):
     """
-    Decorator to measure the execution time of a function
+    Decorator to measure the execution time of a function (sync or async)
     @timeit to use
+    the time is printed and also recorded as function_seconds{function=...}, see utils/metrics.py
     """
+    from utils.metrics import instrument
+    function = f"{func.__module__}.{func.__qualname__}"
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            timer = instrument(function=function)
+            try:
+                async with timer:
+                    return await func(*args, **kwargs)
+            finally:
+                print(f"Function {func.__name__} took {timer.seconds:.2f} seconds to execute.")
+        return async_wrapper
+
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time()
-        result = func(*args, **kwargs)
-        delta = time() - start_time
-        print(f"Function {func.__name__} took {delta:.2f} seconds to execute.")
-        return result
-    return wrapper
\ No newline at end of file
+        timer = instrument(function=function)
+        try:
+            with timer:
+                return func(*args, **kwargs)
+        finally:
+            print(f"Function {func.__name__} took {timer.seconds:.2f} seconds to execute.")
+    return wrapper
@@ -0,0 +1,344 @@
+"""
+In-process metrics: latency histograms, call and error counts with labels
+
+    @instrument("github_api", endpoint="contributors")      decorator, sync or async functions
+    def get_contributors(owner, repo): ...
+
+    with instrument("db_statement", statement="UPDATE") as m:   context manager (async with works too)
+        session.sql(update_cmd).execute()
+        m.labels["rows"] = ...                                   labels can be added until the block ends
+
+    response = http_get(url, session=http_session)          requests call with host/method/status labels
+
+Every instrumented block records <name>_seconds (a histogram, its _count is the number of calls) and, when the
+block raises, <name>_errors_total with the exception class as a label. Without a name the decorator records
+function_seconds{function="module.qualname"}.
+
+Output, chosen with environment variables so any script can be measured without changes:
+    METRICS_FILE=output/metrics.prom    Prometheus text format, rewritten every METRICS_INTERVAL seconds and at exit
+    METRICS_PORT=9108                   Prometheus text endpoint (http://localhost:9108/metrics)
+    METRICS_SUMMARY=1                   table of calls, errors and time per metric printed at exit
+
+Every process records into its own registry. With METRICS_FILE, each process of a run (the first process, its pool
+workers and subprocesses, which inherit METRICS_RUN) writes its series to <METRICS_FILE>.d/<run>/<pid>.json and
+METRICS_FILE is rewritten with the sum of all of them, so the file covers the whole run. A forked worker starts with
+an empty registry and its own exporter. Pool workers leave without running atexit: their last values are written by
+a multiprocessing finalizer, which runs when the pool is closed and joined (pool.close(); pool.join()), not when it
+is terminated (leaving a `with Pool(...)` block). The endpoint serves the same sum, the summary is the printing
+process's own.
+
+import into other python files like
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from utils.metrics import instrument, http_get
+"""
+
+import os
+import json
+import time
+import shutil
+import atexit
+import inspect
+import functools
+import threading
+
+# seconds, upper bounds of the histogram buckets (+Inf is implicit)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+# the first process to import this module owns the run, pool workers and subprocesses inherit the variable
+os.environ.setdefault("METRICS_RUN", str(os.getpid()))
+
+
+def _owns_run():
+    return os.environ.get("METRICS_RUN") == str(os.getpid())
+
+
+def _run_dir(path):
+    # per-process shards of the current run
+    return os.path.join(f"{path}.d", os.environ.get("METRICS_RUN") or str(os.getpid()))
+
+
+def _write_atomic(path, text):
+    # write to a temp file first so a reader never sees half a file
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w') as f:
+        f.write(text)
+    os.replace(tmp_file, path)
+
+
+def _label_key(labels):
+    return tuple(sorted((str(key), str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = [*key, *extra]
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Registry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}     # name -> {label key: value}
+        self._histograms = {}   # name -> {label key: [count per bucket..., +Inf count, sum]}
+        self._exporting = False
+
+    def _reset_after_fork(self):
+        # the parent's values are the parent's to export, and its exporter threads did not survive the fork
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._exporting = False
+
+    def inc(self, name, value=1, **labels):
+        self._start_exporters()
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        self._start_exporters()
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[i] += 1
+                    break
+            else:
+                values[len(self.buckets)] += 1
+            values[-1] += seconds
+
+    def render(self):
+        """
+        Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, values in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip((*self.buckets, "+Inf"), values):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', str(bound))])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {values[-1]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {cumulative}")
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        # every series as JSON, label keys as [[name, value], ...]
+        with self._lock:
+            return {
+                "counters": {name: [[key, value] for key, value in series.items()]
+                             for name, series in self._counters.items()},
+                "histograms": {name: [[key, list(values)] for key, values in series.items()]
+                               for name, series in self._histograms.items()},
+            }
+
+    def merge(self, snapshot):
+        # add the series of another process's snapshot
+        with self._lock:
+            for name, series in snapshot["counters"].items():
+                target = self._counters.setdefault(name, {})
+                for key, value in series:
+                    key = tuple(tuple(pair) for pair in key)
+                    target[key] = target.get(key, 0) + value
+            for name, series in snapshot["histograms"].items():
+                target = self._histograms.setdefault(name, {})
+                for key, values in series:
+                    key = tuple(tuple(pair) for pair in key)
+                    current = target.setdefault(key, [0] * (len(values) - 1) + [0.0])
+                    for i, value in enumerate(values):
+                        current[i] += value
+
+    def collect(self, path):
+        """
+        write this process's shard of the run and return a registry with the sum of every shard of the run
+        """
+        run_dir = _run_dir(path)
+        os.makedirs(run_dir, exist_ok=True)
+        _write_atomic(os.path.join(run_dir, f"{os.getpid()}.json"), json.dumps(self.snapshot()))
+        total = Registry(self.buckets)
+        for name in sorted(os.listdir(run_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(run_dir, name), 'r') as f:
+                    total.merge(json.load(f))
+            except (OSError, ValueError):
+                continue    # a shard being replaced right now
+        return total
+
+    def write_textfile(self, path):
+        # the whole run, not only this process: pool workers add to the file instead of overwriting each other
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        _write_atomic(path, self.collect(path).render())
+
+    def serve(self, port, host=""):
+        # Prometheus endpoint on a daemon thread, returns the server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = os.getenv("METRICS_FILE")
+                body = (registry.collect(path) if path else registry).render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def summary(self):
+        """
+        rows of (metric, labels, calls, errors, total seconds, mean seconds), most total time first
+        """
+        rows = []
+        with self._lock:
+            for name, series in self._histograms.items():
+                base = name.removesuffix("_seconds")
+                errors = self._counters.get(f"{base}_errors_total", {})
+                for key, values in series.items():
+                    calls = sum(values[:-1])
+                    failed = sum(value for error_key, value in errors.items() if set(key) <= set(error_key))
+                    rows.append((base, _format_labels(key), calls, failed, values[-1], values[-1] / calls))
+        return sorted(rows, key=lambda row: row[4], reverse=True)
+
+    def print_summary(self):
+        rows = self.summary()
+        if not rows:
+            return
+        print(f"\n{'metric':<48} {'calls':>8} {'errors':>7} {'total s':>10} {'mean s':>9}")
+        for base, labels, calls, errors, total, mean in rows:
+            print(f"{(base + labels)[:48]:<48} {calls:>8} {errors:>7} {total:>10.2f} {mean:>9.3f}")
+
+    def _start_exporters(self):
+        # once per process, on the first recorded value
+        if self._exporting:
+            return
+        with self._lock:
+            if self._exporting:
+                return
+            self._exporting = True
+        path = os.getenv("METRICS_FILE")
+        if path:
+            interval = float(os.getenv("METRICS_INTERVAL", 15))
+
+            def flush_periodically():
+                while True:
+                    time.sleep(interval)
+                    self.write_textfile(path)
+
+            threading.Thread(target=flush_periodically, name="metrics-file", daemon=True).start()
+            atexit.register(self.write_textfile, path)
+            if not _owns_run():
+                # pool workers leave through os._exit, which skips atexit but not multiprocessing's finalizers
+                from multiprocessing.util import Finalize
+                Finalize(None, self.write_textfile, args=(path,), exitpriority=0)
+        # one endpoint per run, a worker would find the port taken
+        if os.getenv("METRICS_PORT") and _owns_run():
+            self.serve(os.getenv("METRICS_PORT"))
+        if os.getenv("METRICS_SUMMARY"):
+            atexit.register(self.print_summary)
+
+
+REGISTRY = Registry()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=REGISTRY._reset_after_fork)
+
+if os.getenv("METRICS_FILE") and _owns_run():
+    # shards of earlier runs would be added to this one
+    shutil.rmtree(f"{os.getenv('METRICS_FILE')}.d", ignore_errors=True)
+
+
+class instrument:
+    """
+    decorator or context manager (sync and async) recording <name>_seconds and <name>_errors_total
+    """
+    def __init__(self, name=None, registry=None, **labels):
+        self.name = name
+        self.registry = registry or REGISTRY
+        self.labels = labels
+        self.start_time = None
+        self.seconds = None
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        name = self.name or "function"
+        self.seconds = time.perf_counter() - self.start_time
+        self.registry.observe(f"{name}_seconds", self.seconds, **self.labels)
+        if exc_type is not None:
+            self.registry.inc(f"{name}_errors_total", error=exc_type.__name__, **self.labels)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def __call__(self, func):
+        labels = self.labels if self.name else {"function": f"{func.__module__}.{func.__qualname__}", **self.labels}
+
+        # a new instrument per call, so concurrent calls never share a start time
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                async with instrument(self.name, self.registry, **labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with instrument(self.name, self.registry, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def http_get(url, session=None, **kwargs):
+    """
+    requests GET (through session when given) recorded as http_request_seconds{host, method, status}
+    """
+    return http_request("GET", url, session=session, **kwargs)
+
+
+def http_request(method, url, session=None, **kwargs):
+    from urllib.parse import urlsplit
+    if session is None:
+        import requests
+        session = requests
+    with instrument("http_request", host=urlsplit(url).hostname, method=method, status="error") as m:
+        response = session.request(method, url, **kwargs)
+        m.labels["status"] = response.status_code
+    return response
+
+
+def execute_sql(session, cmd, **labels):
+    """
+    session.sql(cmd).execute() recorded as db_statement_seconds{statement=SELECT/INSERT/UPDATE/...}
+    """
+    with instrument("db_statement", statement=cmd.split(None, 1)[0].upper(), **labels):
+        return session.sql(cmd).execute()
@@ -0,0 +1,120 @@
+"""
+Progress and statistics for process pools without a Manager or database polling
+
+Every worker owns one row of counters in a shared-memory array: it is the only writer of that row, so adding to a
+counter is a plain memory write (no lock, no IPC round trip). The parent sums the rows whenever it wants a total and
+prints throughput and ETA from them.
+
+    stats = WorkerStats(workers=8, counters=("inserted", "skipped"))
+    with ProgressReporter(stats, total=len(rows)), \
+            Pool(8, initializer=init_worker, initargs=(stats,)) as pool:
+        pool.map(work, chunks)                  # in work(): worker_stats().add("inserted")
+    stats.totals()                              # {"inserted": ..., "skipped": ...}
+
+import into other python files like
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from utils.progress import WorkerStats, ProgressReporter, init_worker, worker_stats
+"""
+
+import time
+import threading
+import multiprocessing
+
+
+class WorkerStats:
+    def __init__(self, workers: int, counters=("done",), context=None):
+        context = context or multiprocessing
+        self.workers = workers
+        self.counters = tuple(counters)
+        # workers x counters, one row per worker
+        self.values = context.Array('q', workers * len(self.counters), lock=False)
+        # taken once per worker, in init_worker()
+        self.next_slot = context.Value('i', 0)
+        self.slot = None
+
+    def claim_slot(self):
+        with self.next_slot.get_lock():
+            # a restarted worker reuses a slot, its predecessor no longer writes to it
+            self.slot = self.next_slot.value % self.workers
+            self.next_slot.value += 1
+
+    def add(self, counter: str, value: int = 1):
+        self.values[self.slot * len(self.counters) + self.counters.index(counter)] += value
+
+    def per_worker(self) -> list:
+        width = len(self.counters)
+        return [dict(zip(self.counters, self.values[i * width:(i + 1) * width])) for i in range(self.workers)]
+
+    def totals(self) -> dict:
+        width = len(self.counters)
+        return {counter: sum(self.values[i::width]) for i, counter in enumerate(self.counters)}
+
+
+# the WorkerStats of this worker process, set by init_worker
+_worker_stats = None
+
+
+def init_worker(stats: WorkerStats):
+    """
+    Pool initializer: claim this process's row of stats
+    """
+    global _worker_stats
+    stats.claim_slot()
+    _worker_stats = stats
+
+
+def worker_stats() -> WorkerStats:
+    return _worker_stats
+
+
+def format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class ProgressReporter:
+    """
+    context manager printing done/total, items per second and ETA every interval seconds, and once at the end
+    done is the sum of all counters (every item ends in exactly one of them), total=None when it is not known
+    """
+    def __init__(self, stats: WorkerStats, total: int = None, label: str = "rows", interval: float = 10):
+        self.stats = stats
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.start_time = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def line(self) -> str:
+        totals = self.stats.totals()
+        done = sum(totals.values())
+        elapsed = time.perf_counter() - self.start_time
+        rate = done / elapsed if elapsed > 0 else 0.0
+        counts = ", ".join(f"{counter} {value}" for counter, value in totals.items())
+        if self.total is None:
+            return (f"-- {done} {self.label}, {rate:.0f} {self.label}/s, "
+                    f"elapsed {format_seconds(elapsed)} -- {counts}")
+        eta = format_seconds((self.total - done) / rate) if rate and done < self.total else "-"
+        percent = 100 * done / self.total if self.total else 100.0
+        return (f"-- {done}/{self.total} {self.label} ({percent:.1f}%), {rate:.0f} {self.label}/s, "
+                f"elapsed {format_seconds(elapsed)}, ETA {eta} -- {counts}")
+
+    def _report(self):
+        while not self._stop.wait(self.interval):
+            print(self.line(), flush=True)
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._report, name="progress", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        print(self.line(), flush=True)
+        return False
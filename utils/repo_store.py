@@ -0,0 +1,282 @@
+"""
+Shared store of bare mirror repositories, so every pipeline stage reads the same local copy of a repo
+instead of cloning or fetching it over HTTP again.
+
+- mirror(url)          git clone --bare once, git fetch --prune when the mirror is older than refresh_after
+                       only branches and tags are fetched, not GitHub's refs/pull/* (often most of a clone --mirror)
+- read_file(url, path) file contents at a revision (git show), no checkout needed
+- checkout(url, dest)  worktree of the mirror, optionally sparse (only some paths), remove_checkout(url, dest)
+                       when done with it
+- git(url, args)       any other git command against the mirror (log, shortlog, ...)
+- evict()              least recently used mirrors are removed until the store (mirrors and their worktrees) fits
+                       its disk budget
+
+Safe to use from several processes at once: the index and every mirror are guarded by file locks. Cloning, fetching
+and adding worktrees hold the mirror's lock exclusively, reads (git, read_file) hold it shared, and evict only removes
+mirrors it can lock exclusively without waiting.
+
+import into other python files like
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from utils.repo_store import RepoStore
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import fcntl
+import subprocess
+from contextlib import contextmanager
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+STORE_DIR = os.getenv("REPO_STORE_DIR") or os.path.join(ROOT, "output", "repo_store")
+DEFAULT_BUDGET_BYTES = int(float(os.getenv("REPO_STORE_BUDGET_GB", 20)) * 1024 ** 3)
+DEFAULT_REFRESH_SECONDS = 24 * 60 * 60
+FETCH_REFSPECS = ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+class RepoStore:
+    def __init__(self, root: str = STORE_DIR, budget_bytes: int = DEFAULT_BUDGET_BYTES,
+                 refresh_after: int = DEFAULT_REFRESH_SECONDS):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.refresh_after = refresh_after
+        self.mirrors_dir = os.path.join(root, "mirrors")
+        self.locks_dir = os.path.join(root, "locks")
+        self.index_file = os.path.join(root, "index.json")
+        os.makedirs(self.mirrors_dir, exist_ok=True)
+        os.makedirs(self.locks_dir, exist_ok=True)
+        self.env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+
+    @staticmethod
+    def key(url: str) -> str:
+        """
+        stable directory name for a repository URL
+        https://github.com/Owner/Repo(.git) -> owner__repo.git
+        """
+        match = re.search(r"github\.com[/:]([^/]+)/([^/]+?)(?:\.git)?/?$", url)
+        if match:
+            return f"{match.group(1)}__{match.group(2)}.git".lower()
+        # anything else (local paths in tests, other hosts): sanitized path
+        return re.sub(r"[^A-Za-z0-9._-]+", "_", url.strip("/")).lower() + ".git"
+
+    @staticmethod
+    def remote_url(url: str) -> str:
+        if os.path.isdir(url) or url.startswith(("file://", "git@")) or url.endswith(".git"):
+            return url
+        return f"{url}.git"
+
+    def mirror_path(self, url: str) -> str:
+        return os.path.join(self.mirrors_dir, self.key(url))
+
+    @contextmanager
+    def _lock(self, name: str, mode: int = fcntl.LOCK_EX):
+        # LOCK_EX to clone/fetch/add worktrees, LOCK_SH to read a mirror (evict needs LOCK_EX to remove it)
+        with open(os.path.join(self.locks_dir, f"{name}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_index(self) -> dict:
+        if not os.path.exists(self.index_file):
+            return {}
+        try:
+            with open(self.index_file, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _write_index(self, index: dict):
+        tmp_file = f"{self.index_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.index_file)
+
+    def _update_index(self, key: str, **fields):
+        with self._lock("index"):
+            index = self._read_index()
+            index.setdefault(key, {}).update(fields)
+            self._write_index(index)
+
+    def _update_checkout(self, key: str, dest: str, size: int = None):
+        # disk used by a worktree of the mirror, counted toward the budget until it is removed (size None)
+        with self._lock("index"):
+            index = self._read_index()
+            if size is None and key not in index:
+                return
+            checkouts = index.setdefault(key, {}).setdefault("checkouts", {})
+            if size is None:
+                checkouts.pop(dest, None)
+            else:
+                checkouts[dest] = size
+            self._write_index(index)
+
+    def _run(self, args, cwd=None, check=True):
+        return subprocess.run(["git", *args], cwd=cwd, env=self.env, capture_output=True, text=True, check=check)
+
+    def _set_refspecs(self, path: str):
+        """
+        fetch branches and tags only
+        a mirror made by an older clone --mirror is converted and its refs/pull/* are deleted
+        """
+        self._run(["config", "--replace-all", "remote.origin.fetch", FETCH_REFSPECS[0]], cwd=path)
+        self._run(["config", "--add", "remote.origin.fetch", FETCH_REFSPECS[1]], cwd=path)
+        if self._run(["config", "--get", "remote.origin.mirror"], cwd=path, check=False).stdout.strip() == "true":
+            self._run(["config", "--unset", "remote.origin.mirror"], cwd=path)
+            pull_refs = self._run(["for-each-ref", "--format=delete %(refname)", "refs/pull/"], cwd=path).stdout
+            if pull_refs:
+                subprocess.run(["git", "update-ref", "--stdin"], cwd=path, env=self.env, input=pull_refs,
+                               capture_output=True, text=True, check=True)
+
+    def mirror(self, url: str, refresh: bool = False) -> str:
+        """
+        path of the bare mirror of url, cloned on first use and fetched when stale (or refresh=True)
+        """
+        key = self.key(url)
+        path = self.mirror_path(url)
+        with self._lock(key):
+            entry = self._read_index().get(key, {})
+            fetched = False
+            if not os.path.isdir(path):
+                self._run(["clone", "--bare", "--quiet", self.remote_url(url), path])
+                # a bare clone sets no fetch refspec, later fetches would only get HEAD
+                self._set_refspecs(path)
+                fetched = True
+            elif refresh or time.time() - entry.get("last_fetched", 0) > self.refresh_after:
+                if entry.get("refspecs") != FETCH_REFSPECS:
+                    self._set_refspecs(path)
+                self._run(["fetch", "--prune", "--quiet", "origin"], cwd=path)
+                fetched = True
+
+            fields = {"url": url, "last_used": time.time()}
+            if fetched:
+                fields["refspecs"] = FETCH_REFSPECS
+                fields["last_fetched"] = time.time()
+                fields["size"] = dir_size(path)
+            self._update_index(key, **fields)
+
+        if fetched:
+            self.evict(keep=key)
+        return path
+
+    @contextmanager
+    def _reading(self, url: str):
+        """
+        path of the mirror of url, held with a shared lock so evict cannot remove it until the block is left
+        the mirror is cloned again if it was evicted between mirror() and taking the lock
+        """
+        key = self.key(url)
+        while True:
+            path = self.mirror(url)
+            with self._lock(key, fcntl.LOCK_SH):
+                if os.path.isdir(path):
+                    yield path
+                    return
+
+    def git(self, url: str, args, check: bool = True):
+        # run a git command against the mirror of url
+        with self._reading(url) as path:
+            return self._run(args, cwd=path, check=check)
+
+    def read_file(self, url: str, file_path: str, rev: str = "HEAD"):
+        """
+        contents of file_path at rev, None if it does not exist
+        """
+        result = self.git(url, ["show", f"{rev}:{file_path}"], check=False)
+        return result.stdout if result.returncode == 0 else None
+
+    def last_commit_date(self, url: str, file_path: str = None):
+        """
+        'YYYY-MM-DD' of the last commit (touching file_path if given), None if there is none
+        """
+        args = ["log", "-1", "--format=%cs", "HEAD"]
+        if file_path:
+            args += ["--", file_path]
+        result = self.git(url, args, check=False)
+        return (result.stdout.strip() or None) if result.returncode == 0 else None
+
+    def checkout(self, url: str, dest: str, rev: str = "HEAD", sparse_paths=None) -> str:
+        """
+        detached worktree of the mirror at dest, reused if it already exists
+        sparse_paths limits the checkout to some files/directories (cone mode)
+        """
+        if os.path.isdir(dest):
+            return dest
+        # the exclusive lock keeps evict away as the shared one of git() does (taking the shared one and then the
+        # exclusive one would deadlock), once the worktree exists evict skips the mirror anyway
+        while True:
+            path = self.mirror(url)
+            with self._lock(self.key(url)):
+                if not os.path.isdir(path):
+                    continue  # evicted between mirror() and taking the lock
+                self._run(["worktree", "add", "--detach", "--no-checkout", dest, rev], cwd=path)
+                if sparse_paths:
+                    self._run(["sparse-checkout", "set", *sparse_paths], cwd=dest)
+                self._run(["checkout", "--quiet", "--detach", rev], cwd=dest)
+                break
+        self._update_checkout(self.key(url), dest, dir_size(dest))
+        self.evict(keep=self.key(url))
+        return dest
+
+    def remove_checkout(self, url: str, dest: str):
+        path = self.mirror_path(url)
+        with self._lock(self.key(url)):
+            if os.path.isdir(path):
+                self._run(["worktree", "remove", "--force", dest], cwd=path, check=False)
+                self._run(["worktree", "prune"], cwd=path, check=False)
+        if os.path.isdir(dest):
+            shutil.rmtree(dest, ignore_errors=True)
+        self._update_checkout(self.key(url), dest)
+
+    def _has_worktrees(self, path: str) -> bool:
+        worktrees = os.path.join(path, "worktrees")
+        return os.path.isdir(worktrees) and bool(os.listdir(worktrees))
+
+    def evict(self, keep: str = None):
+        """
+        remove least recently used mirrors until the store is within its disk budget, worktrees included
+        mirrors with live worktrees, mirrors locked by another process and the one just used (keep) are never removed
+        """
+        with self._lock("index"):
+            index = self._read_index()
+            total = sum(entry.get("size", 0) + sum(entry.get("checkouts", {}).values()) for entry in index.values())
+            if total <= self.budget_bytes:
+                return []
+            evicted = []
+            for key, entry in sorted(index.items(), key=lambda item: item[1].get("last_used", 0)):
+                if total <= self.budget_bytes:
+                    break
+                path = os.path.join(self.mirrors_dir, key)
+                if key == keep or self._has_worktrees(path):
+                    continue
+                with open(os.path.join(self.locks_dir, f"{key}.lock"), "w") as lock_file:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # being cloned/fetched/read right now
+                    shutil.rmtree(path, ignore_errors=True)
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                total -= entry.get("size", 0) + sum(entry.get("checkouts", {}).values())
+                evicted.append(key)
+            for key in evicted:
+                del index[key]
+            self._write_index(index)
+        if evicted:
+            print(f"Evicted {len(evicted)} mirrors from {self.root} to stay under {self.budget_bytes / 1024 ** 3:.1f} GB")
+        return evicted